@@ -0,0 +1,206 @@
+import os
+import io
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from db.database import Database
+from utils.blob_store import get_blob_store, CHUNK_SIZE
+
+THUMBNAIL_SIZE = (320, 320)
+
+# Leading bytes of the file formats we accept, used instead of trusting the
+# extension or the browser-supplied content type
+MIME_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword'),
+    (b'PK\x03\x04', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+]
+
+
+def sniff_mime_type(header):
+    """Detect the MIME type of a file from its first bytes"""
+    for signature, mime_type in MIME_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    try:
+        header.decode('utf-8')
+        return 'text/plain'
+    except UnicodeDecodeError:
+        return 'application/octet-stream'
+
+
+def process_blob(blob_store, sha256):
+    """
+    Sniff, hash and thumbnail a stored blob.
+
+    Runs in a worker process, so it only takes plain data and a blob store
+    (which must pickle) and reads the blob through BlobStore.open().
+
+    Returns:
+        dict: sha256, mime_type and thumbnail (JPEG bytes or None)
+    """
+    digest = hashlib.sha256()
+    header = b''
+    with blob_store.open(sha256) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if not header:
+                header = chunk[:512]
+            digest.update(chunk)
+
+    mime_type = sniff_mime_type(header)
+    thumbnail = None
+    if mime_type.startswith('image/'):
+        with blob_store.open(sha256) as f, Image.open(f) as img:
+            img.thumbnail(THUMBNAIL_SIZE)
+            buffer = io.BytesIO()
+            img.convert('RGB').save(buffer, format='JPEG', quality=80)
+            thumbnail = buffer.getvalue()
+
+    return {
+        'sha256': digest.hexdigest(),
+        'mime_type': mime_type,
+        'thumbnail': thumbnail,
+    }
+
+
+class AttachmentProcessor:
+    """Post-upload attachment processing in a shared process pool"""
+
+    _executor = None
+    _lock = threading.Lock()
+
+    def __init__(self, blob_store=None):
+        self.db = Database()
+        self.blob_store = blob_store or get_blob_store()
+
+    @classmethod
+    def _get_executor(cls):
+        with cls._lock:
+            if cls._executor is None:
+                # Spawn rather than fork: the app process runs many threads
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=int(os.environ.get('ATTACHMENT_WORKERS', 2)),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return cls._executor
+
+    def submit(self, attachment_id, sha256):
+        """Queue an attachment for processing and return the future"""
+        future = self._get_executor().submit(process_blob, self.blob_store, sha256)
+        future.add_done_callback(lambda f: self._store_result(attachment_id, sha256, f))
+        return future
+
+    def process_pending(self, limit=100):
+        """
+        Process attachments that have not been processed yet and wait for them
+
+        Returns:
+            int: Number of attachments submitted
+        """
+        query = """
+            SELECT id, blob_sha256
+            FROM attachments
+            WHERE processed_at IS NULL AND blob_sha256 IS NOT NULL
+            ORDER BY id
+            LIMIT %s
+        """
+        pending = self.db.query(query, (limit,)) or []
+        executor = self._get_executor()
+        futures = [
+            (row, executor.submit(process_blob, self.blob_store, row['blob_sha256']))
+            for row in pending
+        ]
+        # Store the results here rather than from done callbacks, so every row
+        # is marked processed before the caller selects the next batch
+        for row, future in futures:
+            self._store_result(row['id'], row['blob_sha256'], future)
+        return len(futures)
+
+    def _store_result(self, attachment_id, sha256, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Failed to process attachment {attachment_id}: {str(e)}")
+            self._mark_processed(attachment_id)
+            return
+
+        if result['sha256'] != sha256:
+            print(f"Attachment {attachment_id} content does not match its hash {sha256}")
+            self._mark_processed(attachment_id)
+            return
+
+        try:
+            if result['thumbnail']:
+                thumbnail_sha256, size, staged = self.blob_store.stage_stream(io.BytesIO(result['thumbnail']))
+                # Reprocessing replaces the thumbnail: reference the new blob and
+                # release the old one, unless they are the same
+                query = """
+                    WITH old AS (
+                        SELECT thumbnail_sha256 FROM attachments WHERE id = %(id)s FOR UPDATE
+                    ), blob AS (
+                        INSERT INTO attachment_blobs (sha256, size, ref_count)
+                        SELECT %(sha256)s, %(size)s, 1 FROM old
+                        WHERE old.thumbnail_sha256 IS DISTINCT FROM %(sha256)s
+                        ON CONFLICT (sha256) DO UPDATE
+                        SET ref_count = attachment_blobs.ref_count + 1, released_at = NULL
+                    ), released AS (
+                        UPDATE attachment_blobs b
+                        SET ref_count = b.ref_count - 1,
+                            released_at = CASE WHEN b.ref_count - 1 <= 0
+                                               THEN CURRENT_TIMESTAMP ELSE b.released_at END
+                        FROM old
+                        WHERE b.sha256 = old.thumbnail_sha256 AND old.thumbnail_sha256 <> %(sha256)s
+                    )
+                    UPDATE attachments
+                    SET mime_type = %(mime_type)s, thumbnail_sha256 = %(sha256)s,
+                        processed_at = CURRENT_TIMESTAMP
+                    FROM old
+                    WHERE attachments.id = %(id)s
+                    RETURNING attachments.id
+                """
+                # Like FileHandler.save_file, the thumbnail is only published once
+                # its row is referenced and locked, so collect_garbage cannot
+                # unlink it in between; if the attachment is gone it is dropped
+                try:
+                    with self.db.transaction():
+                        updated = self.db.execute(query, {
+                            'id': attachment_id,
+                            'sha256': thumbnail_sha256,
+                            'size': size,
+                            'mime_type': result['mime_type'],
+                        })
+                        if updated:
+                            self.blob_store.commit(staged, thumbnail_sha256)
+                except Exception:
+                    self.blob_store.discard(staged)
+                    raise
+                if not updated:
+                    self.blob_store.discard(staged)
+            else:
+                query = """
+                    UPDATE attachments
+                    SET mime_type = %s, processed_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """
+                self.db.execute(query, (result['mime_type'], attachment_id))
+        except Exception as e:
+            print(f"Failed to store processing result for attachment {attachment_id}: {str(e)}")
+
+    def _mark_processed(self, attachment_id):
+        """Record a failed attempt so the attachment is not picked up again"""
+        try:
+            self.db.execute(
+                "UPDATE attachments SET processed_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (attachment_id,)
+            )
+        except Exception as e:
+            print(f"Failed to mark attachment {attachment_id} as processed: {str(e)}")
@@ -6,8 +6,9 @@ class CommentHandler:
     def __init__(self):
         self.ticket_model = Ticket()
 
-    def render_comments(self, ticket_id, user_id, user_role):
-        comments = self.ticket_model.get_ticket_comments(ticket_id)
+    def render_comments(self, ticket_id, user_id, user_role, comments=None):
+        if comments is None:
+            comments = self.ticket_model.get_ticket_comments(ticket_id)
         visible_comments = [c for c in comments if not c['is_private'] or 
                           user_role in ['admin', 'agent']]
         
@@ -1,13 +1,21 @@
 import streamlit as st
 import os
+import mimetypes
 from db.database import Database
+from utils.blob_store import get_blob_store, FileTooLargeError, CHUNK_SIZE
+from components.attachment_processor import AttachmentProcessor
 
 class FileHandler:
-    def __init__(self):
+    # Unreferenced blobs are kept this long before garbage collection removes them
+    blob_gc_grace_period = '1 hour'
+
+    def __init__(self, blob_store=None):
         self.db = Database()
+        self.blob_store = blob_store or get_blob_store()
         self.allowed_extensions = {'.txt', '.pdf', '.doc', '.docx', '.png', '.jpg', '.jpeg'}
-        self.max_file_size = 5 * 1024 * 1024  # 5MB limit
+        self.max_file_size = int(os.environ.get('ATTACHMENT_MAX_SIZE_MB', 5)) * 1024 * 1024
         self.image_extensions = {'.png', '.jpg', '.jpeg', '.gif'}
+        self.chunk_size = CHUNK_SIZE  # bytes per read/write when streaming content
 
     def is_valid_file(self, file):
         if file is None:
@@ -17,7 +25,8 @@ class FileHandler:
         if file_ext not in self.allowed_extensions:
             return False
             
-        if file.size > self.max_file_size:
+        # Cheap early rejection; the limit is enforced again while streaming
+        if getattr(file, 'size', None) is not None and file.size > self.max_file_size:
             return False
             
         return True
@@ -25,23 +34,202 @@ class FileHandler:
     def save_file(self, ticket_id, file):
         if not self.is_valid_file(file):
             return False
-            
+        
+        # Hash and write the upload in fixed-size chunks so memory use stays
+        # constant no matter how large the file is
+        if hasattr(file, 'seek'):
+            file.seek(0)
+        try:
+            sha256, file_size, staged = self.blob_store.stage_stream(
+                file, max_size=self.max_file_size, chunk_size=self.chunk_size
+            )
+        except FileTooLargeError:
+            return False
+        mime_type = getattr(file, 'type', None) or mimetypes.guess_type(file.name)[0]
+
+        # The blob is only published once its row is referenced and locked, so
+        # collect_garbage can never unlink it between the write and the insert,
+        # and only when the outermost transaction commits: a caller's
+        # transaction that rolls back later discards it instead
+        try:
+            with self.db.transaction():
+                self.db.after_rollback(lambda: self.blob_store.discard(staged))
+                result = self._insert_attachment(ticket_id, file.name, sha256, file_size, mime_type)
+                self.db.before_commit(lambda: self.blob_store.commit(staged, sha256))
+        except Exception:
+            self.blob_store.discard(staged)
+            raise
+
+        # MIME sniffing and thumbnails happen in the background, once the
+        # attachment row is visible to the worker
+        if result:
+            attachment_id = result[0]['id']
+            self.db.after_commit(lambda: self._submit_processing(attachment_id, sha256))
+        return result
+
+    def _submit_processing(self, attachment_id, sha256):
+        try:
+            AttachmentProcessor(self.blob_store).submit(attachment_id, sha256)
+        except Exception as e:
+            print(f"Failed to queue attachment processing: {str(e)}")
+
+    def _insert_attachment(self, ticket_id, file_name, sha256, file_size, mime_type):
+        """Reference a stored blob and create the attachment row in one statement"""
         query = """
-            INSERT INTO attachments (ticket_id, file_name, file_data)
-            VALUES (%s, %s, %s) RETURNING id
+            WITH blob AS (
+                INSERT INTO attachment_blobs (sha256, size, ref_count)
+                VALUES (%s, %s, 1)
+                ON CONFLICT (sha256) DO UPDATE
+                SET ref_count = attachment_blobs.ref_count + 1, released_at = NULL
+                RETURNING sha256
+            )
+            INSERT INTO attachments (ticket_id, file_name, blob_sha256, file_size, mime_type)
+            SELECT %s, %s, sha256, %s, %s FROM blob
+            RETURNING id
         """
-        
-        file_data = file.read()
-        return self.db.execute(query, (ticket_id, file.name, file_data))
+        return self.db.execute(query, (sha256, file_size, ticket_id, file_name, file_size, mime_type))
+
+    def delete_attachment(self, attachment_id):
+        """Delete an attachment and release its reference on the stored blob"""
+        query = """
+            WITH deleted AS (
+                DELETE FROM attachments WHERE id = %s
+                RETURNING blob_sha256, thumbnail_sha256
+            ), released AS (
+                UPDATE attachment_blobs b
+                SET ref_count = b.ref_count - 1,
+                    released_at = CASE WHEN b.ref_count - 1 <= 0
+                                       THEN CURRENT_TIMESTAMP ELSE b.released_at END
+                FROM deleted
+                WHERE b.sha256 IN (deleted.blob_sha256, deleted.thumbnail_sha256)
+            )
+            SELECT COUNT(*) as deleted FROM deleted
+        """
+        result = self.db.execute(query, (attachment_id,))
+        return bool(result and result[0]['deleted'])
+
+    def collect_garbage(self, limit=500):
+        """
+        Remove blobs that no attachment has referenced for the grace period
+
+        Returns:
+            int: Number of blobs removed
+        """
+        query = """
+            DELETE FROM attachment_blobs
+            WHERE sha256 IN (
+                SELECT sha256 FROM attachment_blobs
+                WHERE ref_count <= 0
+                AND released_at < CURRENT_TIMESTAMP - %s::interval
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            AND ref_count <= 0
+            RETURNING sha256
+        """
+        # Files are unlinked while the deleted rows are still locked, so an
+        # upload of the same content waits and then publishes a fresh copy
+        with self.db.transaction():
+            removed = self.db.execute(query, (self.blob_gc_grace_period, limit)) or []
+            for row in removed:
+                self.blob_store.delete(row['sha256'])
+        return len(removed)
 
     def get_ticket_attachments(self, ticket_id):
+        """Get the attachment metadata of a ticket, without the file contents"""
         query = """
-            SELECT id, file_name, uploaded_at, 
-                   encode(file_data, 'base64') as file_data_base64
+            SELECT id, ticket_id, file_name, file_size, mime_type, thumbnail_sha256, uploaded_at
             FROM attachments
             WHERE ticket_id = %s
+            ORDER BY uploaded_at, id
         """
-        return self.db.execute(query, (ticket_id,))
+        return self.db.query(query, (ticket_id,))
+
+    def get_attachments_for_tickets(self, ticket_ids):
+        """
+        Get the attachment metadata of several tickets in a single query
+
+        Returns:
+            dict: ticket id -> list of attachments
+        """
+        attachments = {ticket_id: [] for ticket_id in ticket_ids}
+        if not attachments:
+            return attachments
+
+        query = """
+            SELECT id, ticket_id, file_name, file_size, mime_type, thumbnail_sha256, uploaded_at
+            FROM attachments
+            WHERE ticket_id = ANY(%s)
+            ORDER BY uploaded_at, id
+        """
+        for row in self.db.query(query, (list(attachments),)) or []:
+            attachments[row['ticket_id']].append(row)
+        return attachments
+
+    def get_attachment(self, attachment_id):
+        """Get the metadata of a single attachment"""
+        query = """
+            SELECT id, ticket_id, file_name, file_size, mime_type, thumbnail_sha256, uploaded_at
+            FROM attachments
+            WHERE id = %s
+        """
+        result = self.db.query(query, (attachment_id,))
+        return result[0] if result else None
+
+    def iter_attachment_chunks(self, attachment_id):
+        """
+        Stream the contents of an attachment in chunks of ``chunk_size`` bytes
+
+        Content lives in the blob store; rows that have not been migrated out
+        of the database yet are read with one substring() query per chunk.
+        Either way only one chunk is held in memory at a time.
+        """
+        result = self.db.query(
+            "SELECT blob_sha256 FROM attachments WHERE id = %s", (attachment_id,)
+        )
+        if not result:
+            return
+        if result[0]['blob_sha256']:
+            yield from self.blob_store.iter_chunks(result[0]['blob_sha256'], self.chunk_size)
+            return
+
+        query = """
+            SELECT substring(file_data FROM %s FOR %s) as chunk
+            FROM attachments
+            WHERE id = %s
+        """
+        offset = 1  # substring() positions are 1-based
+        while True:
+            result = self.db.query(query, (offset, self.chunk_size, attachment_id))
+            if not result or not result[0]['chunk']:
+                return
+            chunk = bytes(result[0]['chunk'])
+            yield chunk
+            if len(chunk) < self.chunk_size:
+                return
+            offset += len(chunk)
+
+    def get_thumbnail(self, attachment):
+        """Read the cached thumbnail of an attachment, if one has been generated"""
+        if not attachment.get('thumbnail_sha256'):
+            return None
+        with self.blob_store.open(attachment['thumbnail_sha256']) as f:
+            return f.read()
+
+    def get_attachment_content(self, attachment_id):
+        """Read the full contents of an attachment"""
+        return b''.join(self.iter_attachment_chunks(attachment_id))
+
+    @staticmethod
+    def format_size(size):
+        """Format a byte count for display"""
+        if size is None:
+            return "unknown size"
+        for unit in ['B', 'KB', 'MB']:
+            if size < 1024:
+                return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} GB"
 
     def is_image_file(self, filename):
         return os.path.splitext(filename)[1].lower() in self.image_extensions
@@ -0,0 +1,54 @@
+import json
+import datetime
+
+# Characters that must be escaped in COPY text format
+COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+_EXHAUSTED = object()
+
+
+def format_copy_value(value):
+    """Format a Python value for PostgreSQL's COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    elif isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        value = value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
+
+
+class CopyRowStream:
+    """
+    Read-only file object producing COPY text from an iterable of rows
+
+    Rows are encoded lazily as copy_expert reads, so only one read buffer is
+    held in memory however many rows are copied.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.rows = 0
+
+    def read(self, size=-1):
+        while self._rows is not None and (size < 0 or len(self._buffer) < size):
+            row = next(self._rows, _EXHAUSTED)
+            if row is _EXHAUSTED:
+                self._rows = None
+                break
+            self._buffer += '\t'.join(format_copy_value(v) for v in row) + '\n'
+            self.rows += 1
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
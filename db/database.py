@@ -1,22 +1,40 @@
 import os
 import time
+import threading
+import itertools
+from contextlib import contextmanager
 import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions, sql
+from psycopg2.extras import RealDictCursor, execute_values
+from db.pool import ConnectionPool
+from db.retry import RetryPolicy, QueryStats
+from db.bulk import CopyRowStream
 
 class Database:
     _instance = None
+    _instance_lock = threading.Lock()
+    _local = threading.local()  # per-thread transaction state
     _pool = None
     _max_retries = 3
     _retry_delay = 1  # seconds
+    retry_policy = RetryPolicy(
+        max_attempts=int(os.environ.get('DB_RETRY_ATTEMPTS', 3)),
+        base_delay=float(os.environ.get('DB_RETRY_BASE_DELAY', 0.1)),
+        max_delay=float(os.environ.get('DB_RETRY_MAX_DELAY', 2.0))
+    )
+    query_stats = QueryStats()
+    _stream_ids = itertools.count(1)
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(Database, cls).__new__(cls)
-            # Add validation before initialization
-            cls.validate_database_url()
-            cls._instance._initialize_pool()
-            cls._instance.create_tables()
+            # Sessions run in separate threads; only one of them may initialize
+            with cls._instance_lock:
+                if cls._instance is None:
+                    # Add validation before initialization
+                    cls.validate_database_url()
+                    instance = super(Database, cls).__new__(cls)
+                    instance._initialize_pool()
+                    cls._instance = instance
         return cls._instance
 
     @classmethod
@@ -58,10 +76,13 @@ class Database:
                 if self._pool is None or self._pool.closed:
                     # Use the validated DATABASE_URL
                     dsn = self.validate_database_url()
-                    self._pool = psycopg2.pool.SimpleConnectionPool(
-                        minconn=1,
-                        maxconn=10,
+                    self._pool = ConnectionPool(
                         dsn=dsn,
+                        minconn=int(os.environ.get('DB_POOL_MIN', 1)),
+                        maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+                        timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+                        max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+                        max_idle=float(os.environ.get('DB_POOL_MAX_IDLE', 600)),
                         sslmode='require'
                     )
                 break
@@ -72,26 +93,13 @@ class Database:
                 time.sleep(self._retry_delay)
 
     def _get_connection(self):
-        """Get a connection from the pool with retry logic"""
-        retry_count = 0
-        while retry_count < self._max_retries:
-            try:
-                conn = self._pool.getconn()
-                if conn is None or conn.closed:
-                    self._initialize_pool()
-                    conn = self._pool.getconn()
-                return conn
-            except (psycopg2.Error, Exception) as e:
-                retry_count += 1
-                if retry_count == self._max_retries:
-                    raise Exception(f"Failed to get database connection after {self._max_retries} attempts: {str(e)}")
-                time.sleep(self._retry_delay)
-                self._initialize_pool()
+        """Check out a connection, blocking up to DB_POOL_TIMEOUT seconds if all are in use"""
+        return self._pool.getconn()
 
-    def _return_connection(self, conn):
-        """Return a connection to the pool"""
+    def _return_connection(self, conn, close=False):
+        """Return a connection to the pool, closing it instead if it is broken"""
         try:
-            self._pool.putconn(conn)
+            self._pool.putconn(conn, close=close)
         except Exception:
             # If returning the connection fails, just close it
             try:
@@ -99,107 +107,277 @@ class Database:
             except Exception:
                 pass
 
-    def create_tables(self):
-        """Create database tables with retry logic"""
+    def pool_stats(self):
+        """Connection pool usage: size, in use, waiting and acquire latency"""
+        return self._pool.stats()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run every execute() and query() call in the block in a single transaction
+
+        The connection is bound to the current thread, so model methods called
+        inside the block join the transaction without any extra arguments.
+        Nested blocks join the outermost transaction. The transaction commits
+        when the block exits normally and rolls back if it raises; see
+        before_commit, after_commit and after_rollback for hooks.
+        """
+        if self.in_transaction():
+            yield self
+            return
+
         conn = self._get_connection()
+        self._local.conn = conn
+        self._local.before_commit = []
+        self._local.after_commit = []
+        self._local.after_rollback = []
+        self._local.state = {}
+        broken = False
+        committed = False
         try:
-            with conn.cursor() as cur:
-                # Users table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id SERIAL PRIMARY KEY,
-                        email VARCHAR(255) UNIQUE NOT NULL,
-                        password_hash VARCHAR(255) NOT NULL,
-                        role VARCHAR(20) NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Tickets table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS tickets (
-                        id SERIAL PRIMARY KEY,
-                        title VARCHAR(255) NOT NULL,
-                        description TEXT NOT NULL,
-                        status VARCHAR(50) NOT NULL,
-                        priority VARCHAR(20) NOT NULL,
-                        category VARCHAR(50),
-                        created_by INTEGER REFERENCES users(id),
-                        assigned_to INTEGER REFERENCES users(id),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Attachments table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS attachments (
-                        id SERIAL PRIMARY KEY,
-                        ticket_id INTEGER REFERENCES tickets(id),
-                        file_name VARCHAR(255) NOT NULL,
-                        file_data BYTEA NOT NULL,
-                        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Comments table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS comments (
-                        id SERIAL PRIMARY KEY,
-                        ticket_id INTEGER REFERENCES tickets(id),
-                        user_id INTEGER REFERENCES users(id),
-                        content TEXT NOT NULL,
-                        is_private BOOLEAN DEFAULT FALSE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                conn.commit()
+            yield self
+            # Callbacks may register further callbacks, so iterate by index
+            i = 0
+            while i < len(self._local.before_commit):
+                self._local.before_commit[i]()
+                i += 1
+            if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_INERROR:
+                # COMMIT would silently roll back a transaction a swallowed error aborted
+                raise psycopg2.InternalError("Transaction aborted by an earlier error; rolled back")
+            conn.commit()
+            committed = True
+        except Exception as e:
+            broken = self.retry_policy.is_connection_error(e)
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
         finally:
-            self._return_connection(conn)
+            callbacks = self._local.after_commit if committed else self._local.after_rollback
+            self._local.conn = None
+            self._local.before_commit = []
+            self._local.after_commit = []
+            self._local.after_rollback = []
+            self._local.state = None
+            self._return_connection(conn, close=broken)
+            if not committed:
+                self._run_callbacks(callbacks, "After-rollback")
 
-    def execute(self, query, params=None):
-        """Execute a query with retry logic"""
-        retry_count = 0
-        last_error = None
-        while retry_count < self._max_retries:
+        self._run_callbacks(callbacks, "After-commit")
+
+    @staticmethod
+    def _run_callbacks(callbacks, kind):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"{kind} callback failed: {str(e)}")
+
+    def in_transaction(self):
+        return getattr(self._local, 'conn', None) is not None
+
+    def transaction_state(self):
+        """
+        A dict that lives as long as the current transaction, or None outside one
+
+        Lets callers collect work during a transaction and write it once,
+        e.g. from a before_commit callback.
+        """
+        return self._local.state if self.in_transaction() else None
+
+    def before_commit(self, callback):
+        """Run callback inside the current transaction just before it commits, or right away outside one"""
+        if self.in_transaction():
+            self._local.before_commit.append(callback)
+        else:
+            callback()
+
+    def after_commit(self, callback):
+        """Run callback once the current transaction commits, or right away outside one"""
+        if self.in_transaction():
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+
+    def after_rollback(self, callback):
+        """Run callback if the current transaction rolls back; outside one there is nothing to roll back"""
+        if self.in_transaction():
+            self._local.after_rollback.append(callback)
+
+    def execute(self, query, params=None, read_only=False):
+        """
+        Execute a query, retrying it only after transient errors
+
+        Deterministic errors (constraint violations, syntax errors, ...) are
+        raised immediately; see RetryPolicy for what is retried and when.
+        Inside transaction() the query runs on the transaction's connection
+        and is not committed or retried on its own. Pass read_only=True for
+        a statement without side effects, so it can also be retried after a
+        lost connection; a SELECT that calls a function may well write.
+        """
+        return self._run(
+            query, lambda cur: self._execute(cur, query, params),
+            read_only=read_only, autocommit=False
+        )
+
+    def query(self, query, params=None):
+        """
+        Run a read-only query
+
+        Outside a transaction the statement runs in autocommit mode, which
+        saves the BEGIN and COMMIT round trips execute() pays, and it is
+        always retried after a lost connection. Only pass statements without
+        side effects; use execute() for anything that writes.
+        """
+        return self._run(
+            query, lambda cur: self._execute(cur, query, params),
+            read_only=True, autocommit=True
+        )
+
+    def stream(self, query, params=None, batch_size=1000):
+        """
+        Yield the rows of a read-only query from a server-side cursor
+
+        Rows are fetched ``batch_size`` at a time, so memory use stays flat
+        however large the result is. The cursor lives in a transaction on
+        the current thread: database calls made on the same thread while
+        the generator is suspended join that transaction. Close the
+        generator when not reading it to the end (e.g. with
+        contextlib.closing), or the connection stays checked out until it
+        is garbage-collected.
+        """
+        with self.transaction():
+            conn = self._local.conn
+            # Named cursors are server-side; the name only has to be unique per connection
+            name = f"stream_{next(self._stream_ids)}"
+            with conn.cursor(name=name, cursor_factory=RealDictCursor) as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                yield from cur
+
+    def execute_many(self, query, rows, template=None, page_size=1000, fetch=False):
+        """
+        Run a multi-row statement with psycopg2's execute_values
+
+        The query holds a single ``VALUES %s`` placeholder which is expanded
+        to ``page_size`` rows per statement, so inserting a few hundred rows
+        takes one round trip instead of one per row.
+
+        Args:
+            query (str): Statement containing ``VALUES %s``
+            rows (list): Sequence of parameter tuples
+            template (str, optional): Per-row template, e.g. ``(%s, %s, NOW())``
+            page_size (int): Rows per statement
+            fetch (bool): Return the rows produced by a RETURNING clause
+
+        Returns:
+            list: RETURNING rows when fetch is set, otherwise None
+        """
+        rows = list(rows)
+        if not rows:
+            return [] if fetch else None
+
+        def run(cur):
+            result = execute_values(cur, query, rows, template=template, page_size=page_size, fetch=fetch)
+            return result if fetch else None
+
+        return self._run(query, run, read_only=False, autocommit=False)
+
+    def bulk_insert(self, table, columns, rows):
+        """
+        Load rows into a table with COPY FROM STDIN
+
+        COPY is the fastest way to load large batches: rows are streamed to
+        the server as they are produced, and no per-row statement is parsed.
+        There is no ON CONFLICT handling, so use execute_many for upserts or
+        COPY into a staging table first.
+
+        Args:
+            table (str): Table name
+            columns (list): Column names, in row order
+            rows (iterable): Tuples of values; may be a generator
+
+        Returns:
+            int: Number of rows copied
+        """
+        statement = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.Identifier(*table.split('.')),
+            sql.SQL(', ').join(sql.Identifier(c) for c in columns)
+        )
+
+        def run(cur):
+            stream = CopyRowStream(rows)
+            cur.copy_expert(statement, stream)
+            return stream.rows
+
+        # A generator is consumed by the first attempt and cannot be replayed
+        replayable = iter(rows) is not rows
+        return self._run(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN", run,
+            read_only=False, autocommit=False, replayable=replayable
+        )
+
+    @staticmethod
+    def _execute(cur, query, params):
+        cur.execute(query, params)
+        return cur.fetchall() if cur.description is not None else None
+
+    def _run(self, query, run, read_only, autocommit, replayable=True):
+        """
+        Call run(cursor) on the transaction's connection or a pooled one
+
+        Args:
+            query (str): Statement text, used for the retry statistics
+            run (callable): Executes the statement and returns its result
+        """
+        tx_conn = getattr(self._local, 'conn', None)
+        if tx_conn is not None:
+            with tx_conn.cursor(cursor_factory=RealDictCursor) as cur:
+                return run(cur)
+
+        attempt = 0
+        while True:
+            attempt += 1
             conn = None
+            broken = False
+            statement_sent = False
             try:
                 conn = self._get_connection()
-                if conn is None or conn.closed:
-                    raise Exception("Failed to get valid database connection")
-                    
+                conn.autocommit = autocommit
                 with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute(query, params)
-                    conn.commit()
-                    try:
-                        result = cur.fetchall()
-                        return result
-                    except psycopg2.ProgrammingError:
-                        return None
-            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
-                last_error = e
-                retry_count += 1
-                if retry_count < self._max_retries:
-                    print(f"Database connection error (attempt {retry_count}): {str(e)}")
-                    time.sleep(self._retry_delay * retry_count)  # Exponential backoff
-                    self._initialize_pool()  # Reinitialize the pool on connection errors
+                    statement_sent = True
+                    result = run(cur)
+                    if not autocommit:
+                        conn.commit()
+                self.query_stats.record(query, retries=attempt - 1)
+                return result
             except Exception as e:
-                last_error = e
-                retry_count += 1
-                if retry_count < self._max_retries:
-                    print(f"Query execution error (attempt {retry_count}): {str(e)}")
-                    time.sleep(self._retry_delay)
+                broken = self.retry_policy.is_connection_error(e)
+                if not (replayable and self.retry_policy.should_retry(e, attempt, statement_sent, read_only)):
+                    self.query_stats.record(query, retries=attempt - 1, failed=True)
+                    # Re-raise the driver error itself, so callers can still check its pgcode
+                    if attempt > 1:
+                        e.add_note(f"Query execution failed after {attempt} attempts")
+                    raise
+                delay = self.retry_policy.backoff(attempt)
+                print(f"Transient database error (attempt {attempt}, retrying in {delay:.2f}s): {str(e)}")
+                time.sleep(delay)
             finally:
                 if conn:
+                    if autocommit and not conn.closed:
+                        try:
+                            conn.autocommit = False
+                        except Exception:
+                            broken = True
                     try:
-                        self._return_connection(conn)
+                        self._return_connection(conn, close=broken)
                     except Exception as e:
                         print(f"Error returning connection to pool: {str(e)}")
-        
-        if last_error:
-            raise Exception(f"Query execution failed after {self._max_retries} attempts. Last error: {str(last_error)}")
-        raise Exception("Query execution failed with unknown error")
+
+    def retry_stats(self):
+        """Calls, retries and failures per query"""
+        return self.query_stats.snapshot()
 
     def __del__(self):
         """Cleanup: close all connections in the pool"""
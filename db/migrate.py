@@ -0,0 +1,131 @@
+"""
+Versioned schema migrations.
+
+Usage:
+    python -m db.migrate [upgrade] [--target VERSION]
+    python -m db.migrate status
+
+Migrations are the ``db/migrations/NNNN_description.sql`` files, applied in
+version order. Each one runs in its own transaction together with the
+``schema_version`` row that records it, so a failed migration leaves no
+trace and can be fixed and rerun. An advisory lock serializes concurrent
+runners, e.g. several containers starting at once. Because of the
+transaction, migrations cannot use CREATE INDEX CONCURRENTLY.
+
+Never edit a migration that has been applied anywhere; add a new one.
+"""
+import os
+import re
+import time
+import hashlib
+import argparse
+from collections import namedtuple
+from db.database import Database
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+FILENAME_PATTERN = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# Key of the advisory lock held while a migration is applied
+MIGRATION_LOCK_ID = 5_310_001
+
+Migration = namedtuple('Migration', ['version', 'name', 'path', 'checksum'])
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """Return the migration files in directory, ordered by version"""
+    migrations = {}
+    for filename in os.listdir(directory):
+        match = FILENAME_PATTERN.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"Duplicate migration version {version}: {filename}")
+        path = os.path.join(directory, filename)
+        with open(path, 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        migrations[version] = Migration(version, match.group(2), path, checksum)
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def ensure_version_table(db):
+    with db.transaction():
+        db.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                checksum CHAR(64) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+
+def applied_migrations(db):
+    """Return version -> checksum of every applied migration"""
+    rows = db.query("SELECT version, checksum FROM schema_version ORDER BY version") or []
+    return {row['version']: row['checksum'] for row in rows}
+
+
+def upgrade(db=None, target=None):
+    """
+    Apply pending migrations up to and including target
+
+    Returns:
+        list: The migrations that were applied
+    """
+    db = db or Database()
+    ensure_version_table(db)
+    applied = applied_migrations(db)
+
+    for migration in discover():
+        checksum = applied.get(migration.version)
+        if checksum and checksum != migration.checksum:
+            print(f"Warning: migration {migration.version:04d}_{migration.name} "
+                  f"was modified after it was applied")
+
+    done = []
+    for migration in discover():
+        if migration.version in applied or (target is not None and migration.version > target):
+            continue
+        started = time.time()
+        with db.transaction():
+            db.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            # Another runner may have applied it while we waited for the lock
+            if db.query("SELECT 1 FROM schema_version WHERE version = %s", (migration.version,)):
+                continue
+            with open(migration.path, encoding='utf-8') as f:
+                db.execute(f.read())
+            db.execute(
+                "INSERT INTO schema_version (version, name, checksum) VALUES (%s, %s, %s)",
+                (migration.version, migration.name, migration.checksum)
+            )
+        done.append(migration)
+        print(f"Applied {migration.version:04d}_{migration.name} ({time.time() - started:.2f}s)")
+    return done
+
+
+def status(db=None):
+    db = db or Database()
+    ensure_version_table(db)
+    applied = applied_migrations(db)
+    for migration in discover():
+        state = "applied" if migration.version in applied else "pending"
+        print(f"{migration.version:04d}_{migration.name}: {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument('command', nargs='?', choices=['upgrade', 'status'], default='upgrade')
+    parser.add_argument('--target', type=int, help="Highest migration version to apply")
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        status()
+    else:
+        applied = upgrade(target=args.target)
+        print(f"Done: {len(applied)} migrations applied")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+-- Core tables. IF NOT EXISTS lets databases created before versioned
+-- migrations adopt this history without changes.
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    role VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tickets (
+    id SERIAL PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    description TEXT NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    priority VARCHAR(20) NOT NULL,
+    category VARCHAR(50),
+    created_by INTEGER REFERENCES users(id),
+    assigned_to INTEGER REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Keyset pagination indexes for the ticket list
+CREATE INDEX IF NOT EXISTS idx_tickets_updated_at_id ON tickets (updated_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_tickets_created_at_id ON tickets (created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS attachments (
+    id SERIAL PRIMARY KEY,
+    ticket_id INTEGER REFERENCES tickets(id),
+    file_name VARCHAR(255) NOT NULL,
+    file_data BYTEA NOT NULL,
+    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Attachment metadata so listings never have to read file_data
+ALTER TABLE attachments
+ADD COLUMN IF NOT EXISTS file_size BIGINT,
+ADD COLUMN IF NOT EXISTS mime_type VARCHAR(100);
+
+UPDATE attachments SET file_size = octet_length(file_data)
+WHERE file_size IS NULL;
+
+CREATE TABLE IF NOT EXISTS comments (
+    id SERIAL PRIMARY KEY,
+    ticket_id INTEGER REFERENCES tickets(id),
+    user_id INTEGER REFERENCES users(id),
+    content TEXT NOT NULL,
+    is_private BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
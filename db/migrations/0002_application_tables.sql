@@ -0,0 +1,60 @@
+-- Tables the models used without any code creating them
+
+CREATE TABLE IF NOT EXISTS custom_fields (
+    id SERIAL PRIMARY KEY,
+    field_name VARCHAR(100) NOT NULL,
+    field_type VARCHAR(20) NOT NULL,
+    field_options TEXT[],
+    is_required BOOLEAN DEFAULT FALSE,
+    validation_rules JSONB,
+    help_text TEXT,
+    depends_on JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ticket_custom_fields (
+    id SERIAL PRIMARY KEY,
+    ticket_id INTEGER NOT NULL REFERENCES tickets(id) ON DELETE CASCADE,
+    field_id INTEGER NOT NULL REFERENCES custom_fields(id) ON DELETE CASCADE,
+    field_value TEXT,
+    UNIQUE (ticket_id, field_id)
+);
+
+CREATE TABLE IF NOT EXISTS macros (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    actions JSONB NOT NULL,
+    description TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS saved_filters (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    filter_criteria JSONB NOT NULL,
+    is_macro BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS audit_logs (
+    id SERIAL PRIMARY KEY,
+    operation VARCHAR(20) NOT NULL,
+    entity_type VARCHAR(50) NOT NULL,
+    entity_id INTEGER,
+    user_id INTEGER REFERENCES users(id),
+    details TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS gdpr_consents (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    consents JSONB,
+    ip_address VARCHAR(45),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(user_id)
+);
@@ -0,0 +1,21 @@
+-- Content-addressed attachment blobs, stored outside the database
+
+CREATE TABLE IF NOT EXISTS attachment_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    released_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_attachment_blobs_unreferenced
+ON attachment_blobs (released_at) WHERE ref_count <= 0;
+
+ALTER TABLE attachments
+ADD COLUMN IF NOT EXISTS blob_sha256 CHAR(64) REFERENCES attachment_blobs(sha256),
+ALTER COLUMN file_data DROP NOT NULL;
+
+-- Results of the background attachment processing pipeline
+ALTER TABLE attachments
+ADD COLUMN IF NOT EXISTS thumbnail_sha256 CHAR(64) REFERENCES attachment_blobs(sha256),
+ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP;
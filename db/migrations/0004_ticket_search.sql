@@ -0,0 +1,52 @@
+-- Full-text search: title weighted above description above public comments.
+-- Until the backfill has run, existing tickets are not found by search.
+
+ALTER TABLE tickets ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE INDEX IF NOT EXISTS idx_tickets_search_vector
+ON tickets USING GIN (search_vector);
+
+CREATE OR REPLACE FUNCTION ticket_search_document(
+    p_ticket_id INTEGER, p_title TEXT, p_description TEXT
+) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce(p_title, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(p_description, '')), 'B') ||
+           setweight(to_tsvector('english', coalesce((
+               SELECT string_agg(c.content, ' ')
+               FROM comments c
+               WHERE c.ticket_id = p_ticket_id AND NOT c.is_private
+           ), '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION tickets_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := ticket_search_document(NEW.id, NEW.title, NEW.description);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION comments_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE tickets
+    SET search_vector = ticket_search_document(id, title, description)
+    WHERE id IN (
+        CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.ticket_id END,
+        CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE OLD.ticket_id END
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tickets_search_vector_update ON tickets;
+CREATE TRIGGER tickets_search_vector_update
+BEFORE INSERT OR UPDATE OF title, description ON tickets
+FOR EACH ROW EXECUTE FUNCTION tickets_search_vector_trigger();
+
+DROP TRIGGER IF EXISTS comments_search_vector_update ON comments;
+CREATE TRIGGER comments_search_vector_update
+AFTER INSERT OR UPDATE OR DELETE ON comments
+FOR EACH ROW EXECUTE FUNCTION comments_search_vector_trigger();
+
+-- Existing tickets are filled by ``python -m scripts.backfill_search_vectors``
+-- in short batches rather than here, so the migration does not rewrite the
+-- whole table in one transaction.
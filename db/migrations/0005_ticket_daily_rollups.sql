@@ -0,0 +1,69 @@
+-- Daily ticket rollups for the dashboard trends, kept current by a trigger.
+-- Missing category/assignee are stored as '' and 0 so they can be part of the key.
+
+CREATE TABLE IF NOT EXISTS ticket_daily_rollups (
+    day DATE NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    priority VARCHAR(20) NOT NULL,
+    category VARCHAR(50) NOT NULL DEFAULT '',
+    assigned_to INTEGER NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status, priority, category, assigned_to)
+);
+
+CREATE OR REPLACE FUNCTION ticket_daily_rollup_add(
+    p_created_at TIMESTAMP, p_status VARCHAR, p_priority VARCHAR,
+    p_category VARCHAR, p_assigned_to INTEGER, p_delta INTEGER
+) RETURNS void AS $$
+    INSERT INTO ticket_daily_rollups (day, status, priority, category, assigned_to, count)
+    VALUES (p_created_at::date, p_status, p_priority,
+            coalesce(p_category, ''), coalesce(p_assigned_to, 0), p_delta)
+    ON CONFLICT (day, status, priority, category, assigned_to)
+    DO UPDATE SET count = ticket_daily_rollups.count + EXCLUDED.count
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION tickets_daily_rollup_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM ticket_daily_rollup_add(OLD.created_at, OLD.status, OLD.priority,
+                                        OLD.category, OLD.assigned_to, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM ticket_daily_rollup_add(NEW.created_at, NEW.status, NEW.priority,
+                                        NEW.category, NEW.assigned_to, 1);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tickets_daily_rollup_insert_delete ON tickets;
+CREATE TRIGGER tickets_daily_rollup_insert_delete
+AFTER INSERT OR DELETE ON tickets
+FOR EACH ROW EXECUTE FUNCTION tickets_daily_rollup_trigger();
+
+DROP TRIGGER IF EXISTS tickets_daily_rollup_update ON tickets;
+CREATE TRIGGER tickets_daily_rollup_update
+AFTER UPDATE OF created_at, status, priority, category, assigned_to ON tickets
+FOR EACH ROW
+WHEN ((OLD.created_at::date, OLD.status, OLD.priority, OLD.category, OLD.assigned_to)
+      IS DISTINCT FROM
+      (NEW.created_at::date, NEW.status, NEW.priority, NEW.category, NEW.assigned_to))
+EXECUTE FUNCTION tickets_daily_rollup_trigger();
+
+CREATE OR REPLACE FUNCTION rebuild_ticket_daily_rollups() RETURNS void AS $$
+BEGIN
+    -- Block ticket writes so no trigger update is lost during the rebuild
+    LOCK TABLE tickets IN SHARE MODE;
+    DELETE FROM ticket_daily_rollups;
+    INSERT INTO ticket_daily_rollups (day, status, priority, category, assigned_to, count)
+    SELECT created_at::date, status, priority,
+           coalesce(category, ''), coalesce(assigned_to, 0), COUNT(*)
+    FROM tickets
+    GROUP BY 1, 2, 3, 4, 5;
+END
+$$ LANGUAGE plpgsql;
+
+-- Backfill once when the rollups are introduced on an existing database
+SELECT rebuild_ticket_daily_rollups()
+WHERE NOT EXISTS (SELECT 1 FROM ticket_daily_rollups)
+AND EXISTS (SELECT 1 FROM tickets);
@@ -0,0 +1,9 @@
+-- Indexes for foreign-key lookups and the audit log's sort order. Without
+-- them, per-user ticket lists, comment/attachment loading and deletes of
+-- referenced rows scan the whole child table.
+
+CREATE INDEX IF NOT EXISTS idx_tickets_created_by ON tickets (created_by);
+CREATE INDEX IF NOT EXISTS idx_tickets_assigned_to ON tickets (assigned_to);
+CREATE INDEX IF NOT EXISTS idx_comments_ticket_id ON comments (ticket_id);
+CREATE INDEX IF NOT EXISTS idx_attachments_ticket_id ON attachments (ticket_id);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_created_at ON audit_logs (created_at DESC);
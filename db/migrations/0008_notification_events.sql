@@ -0,0 +1,22 @@
+-- Ticket notifications are recorded as events and turned into emails by
+-- utils.notifications.NotificationAggregator, which coalesces events per
+-- recipient and ticket and builds digests.
+
+CREATE TABLE IF NOT EXISTS notification_events (
+    id BIGSERIAL PRIMARY KEY,
+    recipient VARCHAR(255) NOT NULL,
+    ticket_id INTEGER REFERENCES tickets(id) ON DELETE CASCADE,
+    event_type VARCHAR(20) NOT NULL,  -- created, updated or assigned
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_events_pending
+ON notification_events (recipient, ticket_id, created_at) WHERE processed_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS notification_preferences (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    mode VARCHAR(20) NOT NULL DEFAULT 'immediate',  -- immediate, hourly or daily
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
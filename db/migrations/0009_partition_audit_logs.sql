@@ -0,0 +1,61 @@
+-- Range-partition audit_logs by month and store details as JSONB.
+-- Old months can then be removed by detaching a partition instead of a
+-- large DELETE, and date-bounded queries only touch the matching months.
+
+ALTER TABLE audit_logs RENAME TO audit_logs_legacy;
+ALTER TABLE audit_logs_legacy RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey;
+ALTER INDEX IF EXISTS idx_audit_logs_created_at RENAME TO idx_audit_logs_legacy_created_at;
+
+CREATE TABLE audit_logs (
+    id BIGINT NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+    operation VARCHAR(20) NOT NULL,
+    entity_type VARCHAR(50) NOT NULL,
+    entity_id INTEGER,
+    user_id INTEGER REFERENCES users(id),
+    details JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (created_at, id)
+) PARTITION BY RANGE (created_at);
+
+-- Keep the id sequence when the legacy table is dropped
+ALTER SEQUENCE audit_logs_id_seq AS BIGINT;
+ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id;
+
+-- Rows outside every monthly partition land here instead of failing the insert
+CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_audit_log_partition(p_month DATE) RETURNS text AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month)::date;
+    partition_name TEXT := 'audit_logs_' || to_char(start_date, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF audit_logs FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_date, (start_date + INTERVAL '1 month')::date
+    );
+    RETURN partition_name;
+END
+$$ LANGUAGE plpgsql;
+
+-- Partitions for the existing history and the next few months
+SELECT create_audit_log_partition(month::date)
+FROM generate_series(
+    date_trunc('month', LEAST(
+        COALESCE((SELECT MIN(created_at) FROM audit_logs_legacy), CURRENT_TIMESTAMP::timestamp),
+        CURRENT_TIMESTAMP::timestamp
+    )),
+    date_trunc('month', CURRENT_TIMESTAMP::timestamp) + INTERVAL '3 months',
+    INTERVAL '1 month'
+) AS month;
+
+-- Browsing newest first, by entity and by user
+CREATE INDEX idx_audit_logs_created_at ON audit_logs (created_at DESC, id DESC);
+CREATE INDEX idx_audit_logs_entity ON audit_logs (entity_type, entity_id, created_at DESC, id DESC);
+CREATE INDEX idx_audit_logs_user ON audit_logs (user_id, created_at DESC, id DESC);
+
+INSERT INTO audit_logs (id, operation, entity_type, entity_id, user_id, details, created_at)
+SELECT id, operation, entity_type, entity_id, user_id, details::jsonb,
+       COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM audit_logs_legacy;
+
+DROP TABLE audit_logs_legacy;
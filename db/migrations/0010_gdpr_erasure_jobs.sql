@@ -0,0 +1,23 @@
+-- Progress of GDPR erasure jobs (utils.gdpr.GDPRCompliance.erase_user).
+-- Each batch moves last_id forward in the same transaction as its changes,
+-- so an interrupted job resumes exactly where it stopped. No foreign key to
+-- users: the account row is deleted by the job's last step.
+
+CREATE TABLE IF NOT EXISTS gdpr_erasure_jobs (
+    user_id INTEGER PRIMARY KEY,
+    email VARCHAR(255) NOT NULL,
+    requested_by INTEGER,
+    step VARCHAR(50) NOT NULL,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    counts JSONB NOT NULL DEFAULT '{}',
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+-- Keyset lookups of the comments a user wrote
+CREATE INDEX IF NOT EXISTS idx_comments_user_id ON comments (user_id, id);
+
+-- Keyset lookups of a recipient's queued notifications and emails
+CREATE INDEX IF NOT EXISTS idx_notification_events_recipient ON notification_events (recipient, id);
+CREATE INDEX IF NOT EXISTS idx_email_outbox_recipient ON email_outbox (recipient, id);
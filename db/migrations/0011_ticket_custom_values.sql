@@ -0,0 +1,29 @@
+-- Custom field values denormalized onto tickets as {"<field id>": value},
+-- so the ticket list can filter on them through a GIN index. MultiSelect
+-- values are arrays, everything else the text stored in ticket_custom_fields.
+-- ticket_custom_fields stays the source of truth; CustomField keeps this
+-- column in sync. Existing rows are filled by
+-- ``python -m scripts.backfill_custom_values`` rather than here, so the
+-- migration does not rewrite the whole table in one transaction.
+
+ALTER TABLE tickets ADD COLUMN IF NOT EXISTS custom_values JSONB NOT NULL DEFAULT '{}';
+
+-- jsonb_path_ops only supports @>, which is all the filters use, and is
+-- smaller and faster than the default operator class
+CREATE INDEX IF NOT EXISTS idx_tickets_custom_values
+ON tickets USING GIN (custom_values jsonb_path_ops);
+
+CREATE OR REPLACE FUNCTION ticket_custom_values(p_ticket_id INTEGER) RETURNS jsonb AS $$
+    SELECT COALESCE(jsonb_object_agg(
+               tcf.field_id::text,
+               CASE WHEN cf.field_type = 'MultiSelect'
+                    THEN to_jsonb(string_to_array(tcf.field_value, ','))
+                    ELSE to_jsonb(tcf.field_value) END
+           ), '{}')
+    FROM ticket_custom_fields tcf
+    JOIN custom_fields cf ON cf.id = tcf.field_id
+    WHERE tcf.ticket_id = p_ticket_id AND tcf.field_value IS NOT NULL
+$$ LANGUAGE sql STABLE;
+
+-- Finding the tickets that have a value for a field, when the field changes or is deleted
+CREATE INDEX IF NOT EXISTS idx_ticket_custom_fields_field_id ON ticket_custom_fields (field_id);
@@ -0,0 +1,15 @@
+-- Completed erasure jobs must not keep the erased email address. Jobs keep
+-- a SHA-256 of the lowercased address instead, so an erasure can still be
+-- looked up by email, and the address itself is cleared on completion.
+
+ALTER TABLE gdpr_erasure_jobs
+ALTER COLUMN email DROP NOT NULL,
+ADD COLUMN IF NOT EXISTS email_sha256 CHAR(64);
+
+UPDATE gdpr_erasure_jobs
+SET email_sha256 = encode(sha256(convert_to(LOWER(email), 'UTF8')), 'hex')
+WHERE email IS NOT NULL AND email_sha256 IS NULL;
+
+UPDATE gdpr_erasure_jobs SET email = NULL WHERE completed_at IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_gdpr_erasure_jobs_email_sha256 ON gdpr_erasure_jobs (email_sha256);
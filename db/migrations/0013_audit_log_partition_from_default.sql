@@ -0,0 +1,39 @@
+-- Let create_audit_log_partition create a month that already has rows in
+-- audit_logs_default. Attaching a partition fails while the default
+-- partition holds rows of its range, so those rows are moved into the new
+-- table first. The default partition is locked for the duration, so no row
+-- of the month can slip in between the move and the attach.
+
+CREATE OR REPLACE FUNCTION create_audit_log_partition(p_month DATE) RETURNS text AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month)::date;
+    end_date DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    partition_name TEXT := 'audit_logs_' || to_char(start_date, 'YYYY_MM');
+BEGIN
+    IF to_regclass(quote_ident(partition_name)) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+    LOCK TABLE audit_logs_default IN ACCESS EXCLUSIVE MODE;
+    -- Another session may have created it while we waited for the lock
+    IF to_regclass(quote_ident(partition_name)) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        partition_name
+    );
+    EXECUTE format(
+        'WITH moved AS (
+             DELETE FROM audit_logs_default WHERE created_at >= %L AND created_at < %L RETURNING *
+         )
+         INSERT INTO %I SELECT * FROM moved',
+        start_date, end_date, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE audit_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_date, end_date
+    );
+    RETURN partition_name;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,38 @@
+-- Bound the comment text in a ticket's search document. It used to
+-- aggregate every public comment, so each new comment re-read all earlier
+-- ones (quadratic over a long thread) and a large thread could exceed the
+-- 1MB tsvector limit and make comment inserts fail. Now only the latest
+-- 50 public comments count, each cut to its first 2000 characters.
+
+CREATE INDEX IF NOT EXISTS idx_comments_ticket_id_id ON comments (ticket_id, id);
+
+CREATE OR REPLACE FUNCTION ticket_search_document(
+    p_ticket_id INTEGER, p_title TEXT, p_description TEXT
+) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce(p_title, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(p_description, '')), 'B') ||
+           setweight(to_tsvector('english', coalesce((
+               SELECT string_agg(latest.content, ' ')
+               FROM (
+                   SELECT left(c.content, 2000) as content
+                   FROM comments c
+                   WHERE c.ticket_id = p_ticket_id AND NOT c.is_private
+                   ORDER BY c.id DESC
+                   LIMIT 50
+               ) latest
+           ), '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+-- Only changes that affect the document rebuild it (not e.g. anonymizing the author)
+DROP TRIGGER IF EXISTS comments_search_vector_update ON comments;
+CREATE TRIGGER comments_search_vector_update
+AFTER INSERT OR DELETE OR UPDATE OF ticket_id, content, is_private ON comments
+FOR EACH ROW EXECUTE FUNCTION comments_search_vector_trigger();
+
+UPDATE tickets SET search_vector = ticket_search_document(id, title, description)
+WHERE id IN (
+    SELECT ticket_id FROM comments
+    WHERE NOT is_private
+    GROUP BY ticket_id
+    HAVING COUNT(*) > 50 OR MAX(length(content)) > 2000
+);
@@ -0,0 +1,14 @@
+-- The ticket list pages on (updated_at, id) or (created_at, id) keysets. A
+-- row comparison with NULL is NULL, so a ticket without a timestamp would
+-- be skipped or repeated between pages. Both columns always get a value
+-- from their default; make that a guarantee. Only rows with a NULL are
+-- rewritten, and there should be none.
+
+UPDATE tickets
+SET created_at = COALESCE(created_at, updated_at, CURRENT_TIMESTAMP),
+    updated_at = COALESCE(updated_at, created_at, CURRENT_TIMESTAMP)
+WHERE created_at IS NULL OR updated_at IS NULL;
+
+ALTER TABLE tickets
+ALTER COLUMN created_at SET NOT NULL,
+ALTER COLUMN updated_at SET NOT NULL;
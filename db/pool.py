@@ -0,0 +1,260 @@
+import time
+import threading
+from collections import deque
+import psycopg2
+from psycopg2 import extensions
+
+# Upper bounds (milliseconds) of the acquire latency histogram buckets
+LATENCY_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000, float('inf')]
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the acquire timeout"""
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+
+    Unlike psycopg2's SimpleConnectionPool this can be shared by the threads
+    Streamlit serves sessions from. Callers block up to ``timeout`` seconds
+    when all ``maxconn`` connections are in use. Connections idle for longer
+    than ``ping_interval`` are checked with ``SELECT 1`` before being handed
+    out, connections older than ``max_lifetime`` are replaced, and a reaper
+    thread closes connections idle for longer than ``max_idle`` down to
+    ``minconn``.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=30, max_lifetime=3600,
+                 max_idle=600, ping_interval=5, reaper_interval=60, **connect_kwargs):
+        if minconn > maxconn:
+            raise ValueError("minconn must not be greater than maxconn")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.ping_interval = ping_interval
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, returned_at), most recently used last
+        self._created_at = {}  # id(connection) -> creation time
+        self._size = 0  # open connections, including ones being opened
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._counters = {'created': 0, 'closed': 0, 'timeouts': 0, 'failed_pings': 0}
+        self._latency_buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self._latency_total = 0.0
+        self._acquires = 0
+
+        for _ in range(minconn):
+            with self._cond:
+                self._size += 1
+            self._idle.append((self._connect(), time.monotonic()))
+
+        self._stop = threading.Event()
+        self._reaper = threading.Thread(
+            target=self._reap_loop, args=(reaper_interval,), name="db-pool-reaper", daemon=True
+        )
+        self._reaper.start()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to timeout seconds for one to free up"""
+        started = time.monotonic()
+        deadline = started + (self.timeout if timeout is None else timeout)
+
+        while True:
+            conn, idle_since = self._checkout(deadline)
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif not self._is_usable(conn, idle_since):
+                self._discard(conn)
+                continue
+            break
+
+        with self._cond:
+            self._in_use += 1
+        self._record_latency(time.monotonic() - started)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection; broken, expired or explicitly closed ones are discarded"""
+        with self._cond:
+            self._in_use -= 1
+
+        if close or self._closed or conn.closed or self._expired(conn):
+            self._discard(conn)
+            return
+
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        self._stop.set()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Snapshot of pool usage for sizing and diagnostics"""
+        with self._cond:
+            histogram = {}
+            for bound, count in zip(LATENCY_BUCKETS_MS, self._latency_buckets):
+                label = f"<= {bound:g} ms" if bound != float('inf') else f"> {LATENCY_BUCKETS_MS[-2]:g} ms"
+                histogram[label] = count
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+                'acquires': self._acquires,
+                'avg_acquire_ms': (self._latency_total / self._acquires * 1000) if self._acquires else 0.0,
+                'acquire_latency': histogram,
+                **self._counters,
+            }
+
+    def _checkout(self, deadline):
+        """
+        Take an idle connection, or reserve a slot for a new one
+
+        Returns:
+            tuple: (connection, idle since) or (None, None) when the caller
+            should open a new connection
+        """
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("connection pool is closed")
+                    if self._idle:
+                        return self._idle.pop()
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        return None, None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No database connection available within the timeout "
+                            f"({self.maxconn} connections in use)"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._counters['created'] += 1
+        return conn
+
+    def _is_usable(self, conn, idle_since):
+        if conn.closed or self._expired(conn):
+            return False
+        if time.monotonic() - idle_since < self.ping_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self._counters['failed_pings'] += 1
+            return False
+
+    def _expired(self, conn):
+        created_at = self._created_at.get(id(conn))
+        return created_at is not None and time.monotonic() - created_at > self.max_lifetime
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+            self._counters['closed'] += 1
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _record_latency(self, seconds):
+        ms = seconds * 1000
+        with self._cond:
+            self._acquires += 1
+            self._latency_total += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if ms <= bound:
+                    self._latency_buckets[i] += 1
+                    break
+
+    def _reap_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self._reap()
+            except Exception as e:
+                print(f"Connection pool reaper error: {str(e)}")
+
+    def _reap(self):
+        """Close idle and expired connections, then top the pool back up to minconn"""
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            keep = deque()
+            # Oldest idle connections are at the left
+            while self._idle:
+                conn, idle_since = self._idle.popleft()
+                too_many = self._size - len(stale) > self.minconn
+                if conn.closed or self._expired(conn) or (too_many and now - idle_since > self.max_idle):
+                    stale.append(conn)
+                else:
+                    keep.append((conn, idle_since))
+            self._idle = keep
+        for conn in stale:
+            self._discard(conn)
+
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+            with self._cond:
+                self._idle.appendleft((conn, time.monotonic()))
+                self._cond.notify()
@@ -0,0 +1,101 @@
+import random
+import threading
+import psycopg2
+from db.pool import PoolTimeout
+
+# SQLSTATEs after which the transaction was rolled back and can be replayed
+ROLLBACK_SQLSTATES = {
+    '40001',  # serialization_failure
+    '40P01',  # deadlock_detected
+}
+
+# SQLSTATE classes and codes that mean the server or connection went away
+CONNECTION_SQLSTATE_CLASSES = {'08'}  # connection_exception
+CONNECTION_SQLSTATES = {
+    '57P01',  # admin_shutdown
+    '57P02',  # crash_shutdown
+    '57P03',  # cannot_connect_now
+    '53300',  # too_many_connections
+}
+
+
+class RetryPolicy:
+    """
+    Decides which database errors are retried, and how long to wait.
+
+    Only transient failures are retried: serialization failures and
+    deadlocks (the transaction was rolled back, so replaying it is always
+    safe) and connection failures. A connection failure is only retried
+    when the statement never reached the server or is read-only, because a
+    write may have been committed before the connection dropped. Everything
+    else (constraint violations, syntax errors, bad parameters) fails fast.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=2.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def is_connection_error(error):
+        if isinstance(error, PoolTimeout):
+            return False
+        pgcode = getattr(error, 'pgcode', None)
+        if pgcode:
+            return pgcode[:2] in CONNECTION_SQLSTATE_CLASSES or pgcode in CONNECTION_SQLSTATES
+        # Errors raised by libpq itself (server closed the connection, ...) carry no SQLSTATE
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+    @staticmethod
+    def is_rollback_error(error):
+        return getattr(error, 'pgcode', None) in ROLLBACK_SQLSTATES
+
+    def should_retry(self, error, attempt, statement_sent, read_only):
+        """
+        Args:
+            error: The exception raised by the attempt
+            attempt (int): Number of attempts made so far, starting at 1
+            statement_sent (bool): Whether the statement may have reached the server
+            read_only (bool): Whether the caller declared the statement free of side effects
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if self.is_rollback_error(error):
+            return True
+        if self.is_connection_error(error):
+            return not statement_sent or read_only
+        return False
+
+    def backoff(self, attempt):
+        """Exponential backoff with full jitter, in seconds"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class QueryStats:
+    """Per-query call, retry and failure counters"""
+
+    def __init__(self, max_queries=200):
+        self.max_queries = max_queries
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(query):
+        return ' '.join(query.split())[:120]
+
+    def record(self, query, retries, failed=False):
+        key = self.fingerprint(query)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_queries:
+                    return
+                stats = self._stats[key] = {'calls': 0, 'retries': 0, 'failures': 0}
+            stats['calls'] += 1
+            stats['retries'] += retries
+            if failed:
+                stats['failures'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [{'query': query, **stats} for query, stats in self._stats.items()]
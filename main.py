@@ -1,6 +1,7 @@
 import streamlit as st
 from utils.auth import check_authentication, login_user, logout_user
 from models.user import User
+from models.notification_preference import NotificationPreference
 from pages.dashboard import render_dashboard
 from pages.tickets import render_tickets
 from pages.users import render_users
@@ -8,6 +9,8 @@ from pages.settings import render_settings
 from pages.auth import render_auth
 from utils.recaptcha import ReCaptcha
 from utils.gdpr import GDPRCompliance
+from utils.email_worker import start_worker
+from models.audit_log import ensure_partitions
 
 st.set_page_config(
     page_title="Support Ticket System",
@@ -92,6 +95,12 @@ def style_sidebar():
 # Hide all Streamlit elements except the sidebar toggle
 hide_streamlit_elements()
 
+# Deliver what is already queued (including retries and digests) after a restart;
+# a no-op once the worker thread runs, or with EMAIL_WORKER_MODE=external
+start_worker()
+# Make sure this month's and the next audit log partitions exist; once per month
+ensure_partitions()
+
 def main():
     # Main content area
     if not check_authentication():
@@ -119,6 +128,20 @@ def main():
             
             st.markdown("---")
             st.write(f"Logged in as: {st.session_state.user['email']}")
+            
+            # Email notification delivery: per-ticket emails or a digest
+            preference_model = NotificationPreference()
+            current_mode = preference_model.get_mode(st.session_state.user['id'])
+            mode = st.selectbox(
+                "Email notifications",
+                NotificationPreference.MODES,
+                index=NotificationPreference.MODES.index(current_mode),
+                format_func=lambda m: {'immediate': "Per ticket", 'hourly': "Hourly digest", 'daily': "Daily digest"}[m],
+                key="notification_mode"
+            )
+            if mode != current_mode:
+                preference_model.set_mode(st.session_state.user['id'], mode)
+
             if st.button("Logout"):
                 logout_user()
                 st.rerun()
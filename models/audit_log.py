@@ -0,0 +1,183 @@
+import re
+import threading
+from datetime import date, timedelta
+from db.database import Database
+from utils.cache import get_cache
+
+PARTITION_PATTERN = re.compile(r'^audit_logs_(\d{4})_(\d{2})$')
+
+_partitions_month = None  # month the partitions were last created for
+_partitions_lock = threading.Lock()
+
+
+def month_start(day, months=0):
+    """First day of the month ``months`` after the one containing day"""
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def ensure_partitions(months_ahead=3):
+    """
+    Create the upcoming audit_logs partitions once per month in this process
+
+    Called at app startup and by the audit flusher, so partitions exist
+    without the maintenance script. Errors are printed and retried on the
+    next call.
+    """
+    global _partitions_month
+    month = month_start(date.today())
+    if _partitions_month == month:
+        return
+    with _partitions_lock:
+        if _partitions_month == month:
+            return
+        try:
+            AuditLog().create_partitions(months_ahead=months_ahead)
+            _partitions_month = month
+        except Exception as e:
+            print(f"Error creating audit log partitions: {str(e)}")
+
+
+class AuditLog:
+    """
+    Read access to, and retention of, the monthly-partitioned audit_logs table.
+    """
+
+    def __init__(self):
+        self.db = Database()
+        self.cache = get_cache()
+
+    def search(self, entity_type=None, entity_id=None, user_id=None, start_date=None, end_date=None,
+               cursor=None, limit=50):
+        """
+        Get one page of audit entries, newest first
+
+        A date range lets PostgreSQL skip every partition outside it. Pass
+        the returned cursor back in to fetch the following page.
+
+        Args:
+            entity_type (str, optional): Only entries for this entity type
+            entity_id (int, optional): Only entries for this entity
+            user_id (int, optional): Only entries by this user
+            start_date (date, optional): First day to include
+            end_date (date, optional): Last day to include
+            cursor (tuple, optional): (created_at, id) of the last entry seen
+            limit (int): Maximum number of entries to return
+
+        Returns:
+            tuple: (list of entries, cursor for the next page or None)
+        """
+        conditions = []
+        params = []
+        if entity_type:
+            conditions.append("al.entity_type = %s")
+            params.append(entity_type)
+        if entity_id is not None:
+            conditions.append("al.entity_id = %s")
+            params.append(entity_id)
+        if user_id is not None:
+            conditions.append("al.user_id = %s")
+            params.append(user_id)
+        if start_date:
+            conditions.append("al.created_at >= %s")
+            params.append(start_date)
+        if end_date:
+            conditions.append("al.created_at < %s")
+            params.append(end_date + timedelta(days=1))
+        if cursor:
+            conditions.append("(al.created_at, al.id) < (%s, %s)")
+            params.extend(cursor)
+
+        query = """
+            SELECT al.id, al.operation, al.entity_type, al.entity_id, al.user_id,
+                   al.details, al.created_at, u.email as user_email
+            FROM audit_logs al
+            LEFT JOIN users u ON al.user_id = u.id
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # Fetch one extra row to find out whether another page exists
+        query += " ORDER BY al.created_at DESC, al.id DESC LIMIT %s"
+        params.append(limit + 1)
+
+        entries = self.db.query(query, tuple(params)) or []
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = (entries[-1]['created_at'], entries[-1]['id'])
+        return entries, next_cursor
+
+    def get_entity_types(self):
+        """Entity types that appear in the audit log, for filter choices"""
+        query = "SELECT DISTINCT entity_type FROM audit_logs ORDER BY entity_type"
+        return self.cache.get_or_load(
+            ('audit_entity_types',),
+            lambda: [row['entity_type'] for row in self.db.query(query) or []]
+        )
+
+    def get_partitions(self):
+        """
+        List the monthly partitions
+
+        Returns:
+            list: (partition name, first day of its month), oldest first
+        """
+        query = """
+            SELECT c.relname as name
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'audit_logs'::regclass
+        """
+        partitions = []
+        for row in self.db.query(query) or []:
+            match = PARTITION_PATTERN.match(row['name'])
+            if match:
+                partitions.append((row['name'], date(int(match.group(1)), int(match.group(2)), 1)))
+        return sorted(partitions, key=lambda p: p[1])
+
+    def create_partitions(self, months_ahead=3):
+        """
+        Create the partitions for the current month and the next months_ahead
+
+        The app does this at startup and the audit flusher at the start of
+        each month (see ensure_partitions). Entries for a month without a
+        partition go to audit_logs_default; creating the partition later
+        moves them into it.
+
+        Returns:
+            list: Names of the partitions that now exist for those months
+        """
+        today = date.today()
+        created = []
+        for months in range(months_ahead + 1):
+            result = self.db.execute(
+                "SELECT create_audit_log_partition(%s) as name", (month_start(today, months),)
+            )
+            created.append(result[0]['name'])
+        return created
+
+    def detach_partitions_before(self, cutoff, drop=False):
+        """
+        Remove whole months older than cutoff from the audit log
+
+        Detaching a partition is a catalog change, so retention never runs
+        a large DELETE over the live table. Detached tables are kept for
+        archiving unless drop is set.
+
+        Args:
+            cutoff (date): Months that end on or before this day are removed
+            drop (bool): Drop the detached tables as well
+
+        Returns:
+            list: Names of the partitions that were detached
+        """
+        detached = []
+        for name, month in self.get_partitions():
+            if month_start(month, 1) > cutoff:
+                break
+            with self.db.transaction():
+                self.db.execute(f'ALTER TABLE audit_logs DETACH PARTITION "{name}"')
+                if drop:
+                    self.db.execute(f'DROP TABLE "{name}"')
+            detached.append(name)
+        return detached
@@ -2,40 +2,57 @@ import json
 from db.database import Database
 from psycopg2.extras import Json
 from utils.audit_logger import AuditLogger
+from utils.cache import get_cache
+from models.custom_field_schema import CustomFieldSchema, compile_validators
 import datetime
 
+# Refresh tickets.custom_values from ticket_custom_fields for a list of tickets
+SYNC_CUSTOM_VALUES_QUERY = """
+    UPDATE tickets SET custom_values = ticket_custom_values(id)
+    WHERE id = ANY(%s)
+"""
+
 class CustomField:
     def __init__(self):
         self.db = Database()
         self.audit_logger = AuditLogger()
+        self.cache = get_cache()
         
     def delete_field(self, field_id):
         """Delete a custom field and its associated values"""
         try:
-            # First delete the field values
-            query1 = """
-                DELETE FROM ticket_custom_fields 
-                WHERE field_id = %s
-            """
-            self.db.execute(query1, (field_id,))
+            with self.db.transaction():
+                # Drop the field from the denormalized values of the tickets that have it
+                self.db.execute("""
+                    UPDATE tickets SET custom_values = custom_values - %s
+                    WHERE id IN (SELECT ticket_id FROM ticket_custom_fields WHERE field_id = %s)
+                """, (str(field_id), field_id))
+
+                # First delete the field values
+                query1 = """
+                    DELETE FROM ticket_custom_fields 
+                    WHERE field_id = %s
+                """
+                self.db.execute(query1, (field_id,))
             
-            # Then delete the field itself
-            query2 = """
-                DELETE FROM custom_fields 
-                WHERE id = %s 
-                RETURNING id
-            """
-            result = self.db.execute(query2, (field_id,))
-            success = result and len(result) > 0
-            if success:
-                self.audit_logger.log_action(
-                    operation="delete",
-                    entity_type="field",
-                    entity_id=field_id,
-                    user_id=None,  # Will be set from the request context
-                    details={"field_id": field_id}
-                )
-            return success
+                # Then delete the field itself
+                query2 = """
+                    DELETE FROM custom_fields 
+                    WHERE id = %s 
+                    RETURNING id
+                """
+                result = self.db.execute(query2, (field_id,))
+                self.db.after_commit(lambda: self.cache.invalidate('custom_fields'))
+                success = result and len(result) > 0
+                if success:
+                    self.audit_logger.log_action(
+                        operation="delete",
+                        entity_type="field",
+                        entity_id=field_id,
+                        user_id=None,  # Will be set from the request context
+                        details={"field_id": field_id}
+                    )
+                return success
         except Exception as e:
             print(f"Error deleting field: {str(e)}")
             raise
@@ -48,30 +65,36 @@ class CustomField:
             )
             VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id, field_name, field_type
         """
+        # Reject rules the schema could not compile, e.g. an invalid regex
+        compile_validators({'field_name': field_name, 'field_type': field_type,
+                            'validation_rules': validation_rules})
+
         # Convert dictionaries to JSON objects for PostgreSQL
         validation_rules_json = Json(validation_rules) if validation_rules else None
         depends_on_json = Json(depends_on) if depends_on else None
         
-        result = self.db.execute(query, (
-            field_name, field_type, field_options, is_required,
-            validation_rules_json, help_text, depends_on_json
-        ))
+        with self.db.transaction():
+            result = self.db.execute(query, (
+                field_name, field_type, field_options, is_required,
+                validation_rules_json, help_text, depends_on_json
+            ))
+            self.db.after_commit(lambda: self.cache.invalidate('custom_fields'))
         
-        if result:
-            new_field = result[0]
-            self.audit_logger.log_action(
-                operation="create",
-                entity_type="field",
-                entity_id=new_field['id'],
-                user_id=user_id,
-                details={
-                    "field_name": field_name,
-                    "field_type": field_type,
-                    "is_required": is_required,
-                    "field_options": field_options,
-                    "created_at": datetime.datetime.now().isoformat()
-                }
-            )
+            if result:
+                new_field = result[0]
+                self.audit_logger.log_action(
+                    operation="create",
+                    entity_type="field",
+                    entity_id=new_field['id'],
+                    user_id=user_id,
+                    details={
+                        "field_name": field_name,
+                        "field_type": field_type,
+                        "is_required": is_required,
+                        "field_options": field_options,
+                        "created_at": datetime.datetime.now().isoformat()
+                    }
+                )
         return result
 
     def get_all_fields(self):
@@ -83,72 +106,92 @@ class CustomField:
             FROM custom_fields
             ORDER BY field_name
         """
-        return self.db.execute(query)
+        return list(self.cache.get_or_load(('custom_fields',), lambda: self.db.query(query) or []))
+
+    def get_schema(self):
+        """
+        The compiled CustomFieldSchema of the current field definitions
+
+        Cached under the custom_fields namespace, so it is rebuilt only after
+        a field is created, updated or deleted.
+        """
+        return self.cache.get_or_load(
+            ('custom_fields', 'schema'), lambda: CustomFieldSchema(self.get_all_fields())
+        )
 
     def get_field_by_id(self, field_id):
         query = """
             SELECT * FROM custom_fields
             WHERE id = %s
         """
-        result = self.db.execute(query, (field_id,))
+        result = self.db.query(query, (field_id,))
         return result[0] if result else None
 
     def update_field(self, field_id, field_name=None, field_type=None, field_options=None, is_required=None, user_id=None):
-        # Get the original field data for audit logging
-        original_field = self.get_field_by_id(field_id)
-        if not original_field:
-            return None
-
-        updates = []
-        params = []
-        changes = {}
+        with self.db.transaction():
+            # Get the original field data for audit logging
+            original_field = self.get_field_by_id(field_id)
+            if not original_field:
+                return None
+
+            updates = []
+            params = []
+            changes = {}
         
-        if field_name is not None and field_name != original_field['field_name']:
-            updates.append("field_name = %s")
-            params.append(field_name)
-            changes['field_name'] = {'old': original_field['field_name'], 'new': field_name}
+            if field_name is not None and field_name != original_field['field_name']:
+                updates.append("field_name = %s")
+                params.append(field_name)
+                changes['field_name'] = {'old': original_field['field_name'], 'new': field_name}
             
-        if field_type is not None and field_type != original_field['field_type']:
-            updates.append("field_type = %s")
-            params.append(field_type)
-            changes['field_type'] = {'old': original_field['field_type'], 'new': field_type}
+            if field_type is not None and field_type != original_field['field_type']:
+                updates.append("field_type = %s")
+                params.append(field_type)
+                changes['field_type'] = {'old': original_field['field_type'], 'new': field_type}
             
-        if field_options is not None and field_options != original_field['field_options']:
-            updates.append("field_options = %s")
-            params.append(field_options)
-            changes['field_options'] = {'old': original_field['field_options'], 'new': field_options}
+            if field_options is not None and field_options != original_field['field_options']:
+                updates.append("field_options = %s")
+                params.append(field_options)
+                changes['field_options'] = {'old': original_field['field_options'], 'new': field_options}
             
-        if is_required is not None and is_required != original_field['is_required']:
-            updates.append("is_required = %s")
-            params.append(is_required)
-            changes['is_required'] = {'old': original_field['is_required'], 'new': is_required}
+            if is_required is not None and is_required != original_field['is_required']:
+                updates.append("is_required = %s")
+                params.append(is_required)
+                changes['is_required'] = {'old': original_field['is_required'], 'new': is_required}
             
-        if not updates:
-            return original_field
+            if not updates:
+                return original_field
             
-        params.append(field_id)
+            params.append(field_id)
         
-        query = f"""
-            UPDATE custom_fields 
-            SET {', '.join(updates)}
-            WHERE id = %s
-            RETURNING *
-        """
-        result = self.db.execute(query, tuple(params))
+            query = f"""
+                UPDATE custom_fields 
+                SET {', '.join(updates)}
+                WHERE id = %s
+                RETURNING *
+            """
+            result = self.db.execute(query, tuple(params))
+            self.db.after_commit(lambda: self.cache.invalidate('custom_fields'))
+
+            # MultiSelect values are stored as arrays in tickets.custom_values
+            if 'field_type' in changes:
+                self.db.execute("""
+                    UPDATE tickets SET custom_values = ticket_custom_values(id)
+                    WHERE id IN (SELECT ticket_id FROM ticket_custom_fields WHERE field_id = %s)
+                """, (field_id,))
         
-        if result and result[0]:
-            self.audit_logger.log_action(
-                operation="update",
-                entity_type="field",
-                entity_id=field_id,
-                user_id=user_id,
-                details={
-                    'changes': changes,
-                    'updated_at': datetime.datetime.now().isoformat()
-                }
-            )
+            if result and result[0]:
+                self.audit_logger.log_action(
+                    operation="update",
+                    entity_type="field",
+                    entity_id=field_id,
+                    user_id=user_id,
+                    details={
+                        'changes': changes,
+                        'updated_at': datetime.datetime.now().isoformat()
+                    }
+                )
             
-        return result[0] if result else None
+            return result[0] if result else None
 
     def save_field_value(self, ticket_id, field_id, field_value):
         query = """
@@ -158,7 +201,78 @@ class CustomField:
             DO UPDATE SET field_value = EXCLUDED.field_value
             RETURNING id
         """
-        return self.db.execute(query, (ticket_id, field_id, field_value))
+        with self.db.transaction():
+            result = self.db.execute(query, (ticket_id, field_id, field_value))
+            self.db.execute(SYNC_CUSTOM_VALUES_QUERY, ([ticket_id],))
+        return result
+
+    def save_field_values(self, ticket_id, field_values):
+        """
+        Save several custom field values of a ticket in one statement
+
+        Args:
+            ticket_id (int): The ticket the values belong to
+            field_values (dict): field id -> value
+
+        Returns:
+            list: The ids of the saved rows
+        """
+        query = """
+            INSERT INTO ticket_custom_fields (ticket_id, field_id, field_value)
+            VALUES %s
+            ON CONFLICT (ticket_id, field_id)
+            DO UPDATE SET field_value = EXCLUDED.field_value
+            RETURNING id
+        """
+        rows = [(ticket_id, field_id, value) for field_id, value in field_values.items()]
+        if not rows:
+            return []
+        with self.db.transaction():
+            result = self.db.execute_many(query, rows, fetch=True)
+            self.db.execute(SYNC_CUSTOM_VALUES_QUERY, ([ticket_id],))
+        return result
+
+    def backfill_custom_values(self, after_id=0, batch_size=1000):
+        """
+        Rebuild tickets.custom_values for the next batch_size tickets after after_id
+
+        Returns:
+            tuple: (highest ticket id in the batch or None when done, tickets updated)
+        """
+        query = """
+            WITH done AS (
+                UPDATE tickets SET custom_values = ticket_custom_values(id)
+                WHERE id IN (SELECT id FROM tickets WHERE id > %s ORDER BY id LIMIT %s)
+                RETURNING id
+            )
+            SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+        """
+        result = self.db.execute(query, (after_id, batch_size))[0]
+        return result['last_id'], result['rows']
+
+    @staticmethod
+    def value_filters(field, values):
+        """
+        Build tickets.custom_values containment documents matching any of values
+
+        Args:
+            field (dict): The custom field
+            values (list): Accepted values; for a MultiSelect field, options
+                any one of which must be selected
+
+        Returns:
+            list: One document per value, for ``custom_values @> %s`` conditions
+        """
+        key = str(field['id'])
+        documents = []
+        for value in values:
+            if isinstance(value, bool):
+                value = str(value).lower()
+            if field['field_type'] == 'MultiSelect':
+                documents.append({key: [str(value)]})
+            else:
+                documents.append({key: str(value)})
+        return documents
 
     def get_ticket_field_values(self, ticket_id):
         query = """
@@ -167,4 +281,25 @@ class CustomField:
             JOIN custom_fields cf ON tcf.field_id = cf.id
             WHERE tcf.ticket_id = %s
         """
-        return self.db.execute(query, (ticket_id,))
+        return self.db.query(query, (ticket_id,))
+
+    def get_field_values_for_tickets(self, ticket_ids):
+        """
+        Get the custom field values of several tickets in a single query
+
+        Returns:
+            dict: ticket id -> list of field values
+        """
+        values = {ticket_id: [] for ticket_id in ticket_ids}
+        if not values:
+            return values
+
+        query = """
+            SELECT tcf.ticket_id, cf.field_name, cf.field_type, tcf.field_value
+            FROM ticket_custom_fields tcf
+            JOIN custom_fields cf ON tcf.field_id = cf.id
+            WHERE tcf.ticket_id = ANY(%s)
+        """
+        for row in self.db.query(query, (list(values),)) or []:
+            values[row['ticket_id']].append(row)
+        return values
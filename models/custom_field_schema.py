@@ -0,0 +1,195 @@
+import re
+import heapq
+import hashlib
+import json
+
+
+def compile_condition(depends_on):
+    """
+    Turn a depends_on rule into a predicate on the parent field's value
+
+    Checkbox parents are matched with {'value': bool}, Dropdown and
+    MultiSelect parents with {'values': [...]}, any of which may be selected.
+    """
+    if 'value' in depends_on:
+        expected = str(depends_on['value']).lower() == 'true'
+        return lambda value: (str(value).lower() == 'true') == expected
+    if 'values' in depends_on:
+        allowed = {str(v) for v in depends_on['values'] or []}
+
+        def matches(value):
+            if isinstance(value, str):
+                value = value.split(',')
+            elif not isinstance(value, (list, tuple, set)):
+                value = [value]
+            return any(str(v) in allowed for v in value)
+        return matches
+    return lambda value: True
+
+
+def compile_validators(field):
+    """
+    Build the format checks of a field from its validation rules
+
+    Returns:
+        list: Functions taking a value and returning an error message or None
+
+    Raises:
+        ValueError: If the validation pattern is not a valid regular expression
+    """
+    rules = field.get('validation_rules') or {}
+    checks = []
+    if field['field_type'] == 'Text':
+        if rules.get('min_length'):
+            min_length = rules['min_length']
+            checks.append(lambda v: f"Minimum length is {min_length} characters"
+                          if v and len(v) < min_length else None)
+        if rules.get('max_length'):
+            max_length = rules['max_length']
+            checks.append(lambda v: f"Maximum length is {max_length} characters"
+                          if v and len(v) > max_length else None)
+        if rules.get('pattern'):
+            try:
+                pattern = re.compile(rules['pattern'])
+            except re.error as e:
+                raise ValueError(f"Invalid validation pattern for {field['field_name']}: {e}")
+            checks.append(lambda v: "Input format is invalid" if v and not pattern.match(v) else None)
+    elif field['field_type'] == 'Number':
+        if rules.get('min_value') is not None:
+            min_value = rules['min_value']
+            checks.append(lambda v: f"Minimum value is {min_value}"
+                          if v is not None and v < min_value else None)
+        if rules.get('max_value') is not None:
+            max_value = rules['max_value']
+            checks.append(lambda v: f"Maximum value is {max_value}"
+                          if v is not None and v > max_value else None)
+    return checks
+
+
+class CustomFieldSchema:
+    """
+    Compiled form of the custom field definitions.
+
+    Built once per version of the definitions (see CustomField.get_schema):
+    dependency conditions and validation rules are compiled up front, and
+    fields are ordered so that every field comes after the field it depends
+    on. Fields caught in a dependency cycle are listed in ``cycles`` and
+    never shown. A field is visible when it has no dependency, or when its
+    parent is visible and the parent's value matches the rule.
+    """
+
+    def __init__(self, fields):
+        self.fields = {f['id']: f for f in fields}
+        self.version = hashlib.sha256(
+            json.dumps(fields, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        self.parents = {}  # field id -> id of the field it depends on
+        self.conditions = {}  # field id -> predicate on the parent's value
+        self.children = {field_id: [] for field_id in self.fields}
+        self.validators = {}
+        for field in fields:
+            depends_on = field.get('depends_on') or {}
+            if depends_on.get('field_id'):
+                parent_id = int(depends_on['field_id'])
+                self.parents[field['id']] = parent_id
+                self.conditions[field['id']] = compile_condition(depends_on)
+                if parent_id in self.children:
+                    self.children[parent_id].append(field['id'])
+            try:
+                self.validators[field['id']] = compile_validators(field)
+            except ValueError as e:
+                print(f"Ignoring validation rules: {str(e)}")
+                self.validators[field['id']] = []
+        self.order, self.cycles = self._sort(fields)
+
+    def _sort(self, fields):
+        """Topological order, keeping the given order among independent fields"""
+        position = {f['id']: i for i, f in enumerate(fields)}
+        waiting = {field_id: 1 for field_id, parent_id in self.parents.items() if parent_id in self.fields}
+        ready = [position[f['id']] for f in fields if f['id'] not in waiting]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            field = fields[heapq.heappop(ready)]
+            order.append(field)
+            for child_id in self.children[field['id']]:
+                del waiting[child_id]
+                heapq.heappush(ready, position[child_id])
+        # Whatever still waits on a parent is in, or below, a dependency cycle
+        return order, set(waiting)
+
+    def is_visible(self, field_id, visible, values):
+        """Whether a field is visible, given the visibility of its parent"""
+        if field_id in self.cycles:
+            return False
+        parent_id = self.parents.get(field_id)
+        if parent_id is None:
+            return True
+        value = values.get(parent_id)
+        return parent_id in visible and value is not None and self.conditions[field_id](value)
+
+    def visible_fields(self, values):
+        """Ids of every visible field for the given field id -> value mapping"""
+        visible = set()
+        for field in self.order:
+            if self.is_visible(field['id'], visible, values):
+                visible.add(field['id'])
+        return visible
+
+    def update_visibility(self, visible, values, changed_id):
+        """
+        Re-evaluate visibility after the value of changed_id changed
+
+        Only the fields below changed_id are visited, and a branch is left as
+        soon as a field's visibility does not change. visible is updated in
+        place.
+
+        Returns:
+            set: Ids of the fields that were hidden
+        """
+        hidden = set()
+        pending = list(self.children.get(changed_id, []))
+        while pending:
+            field_id = pending.pop()
+            now_visible = self.is_visible(field_id, visible, values)
+            if now_visible == (field_id in visible):
+                continue
+            if now_visible:
+                visible.add(field_id)
+                hidden.discard(field_id)
+            else:
+                visible.discard(field_id)
+                hidden.add(field_id)
+            pending.extend(self.children[field_id])
+        return hidden
+
+    def check(self, field_id, value):
+        """Format errors of one value, without the required check"""
+        errors = []
+        for validator in self.validators.get(field_id, []):
+            error = validator(value)
+            if error:
+                errors.append(error)
+        return errors
+
+    def validate(self, values, visible):
+        """
+        Check the values of the visible fields
+
+        Returns:
+            list: (field, error message) tuples; empty if everything is valid
+        """
+        errors = []
+        for field in self.order:
+            if field['id'] not in visible:
+                continue
+            value = values.get(field['id'])
+            if field['is_required']:
+                if value is None or (isinstance(value, str) and not value.strip()):
+                    errors.append((field, f"{field['field_name']} is required"))
+                    continue
+                if isinstance(value, list) and not value:
+                    errors.append((field, f"Please select at least one option for {field['field_name']}"))
+                    continue
+            errors.extend((field, error) for error in self.check(field['id'], value))
+        return errors
@@ -0,0 +1,139 @@
+from db.database import Database
+
+class DashboardStats:
+    """
+    Aggregated ticket statistics for the dashboard.
+
+    Every widget is computed in SQL so only a handful of aggregated rows are
+    transferred. Customers only see statistics over their own tickets, the
+    same scoping as Ticket.get_all_tickets.
+    """
+
+    def __init__(self, user_id=None, user_role=None):
+        self.db = Database()
+        self.user_id = user_id
+        self.user_role = user_role
+
+    def _scope(self, extra_conditions=None):
+        """Build the WHERE clause and params for the current user's tickets"""
+        conditions = list(extra_conditions or [])
+        params = []
+        if self.user_role == 'customer':
+            conditions.insert(0, "(t.created_by = %s OR t.assigned_to = %s)")
+            params.extend([self.user_id, self.user_id])
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def get_overview(self):
+        """Get ticket counts by status and priority"""
+        where, params = self._scope()
+        query = f"""
+            SELECT COUNT(*) as total,
+                   COUNT(*) FILTER (WHERE LOWER(t.status) = 'open') as open,
+                   COUNT(*) FILTER (WHERE LOWER(t.status) = 'in progress') as in_progress,
+                   COUNT(*) FILTER (WHERE LOWER(t.status) = 'closed') as closed,
+                   COUNT(*) FILTER (WHERE LOWER(t.priority) = 'low') as low_priority,
+                   COUNT(*) FILTER (WHERE LOWER(t.priority) = 'medium') as medium_priority,
+                   COUNT(*) FILTER (WHERE LOWER(t.priority) = 'high') as high_priority
+            FROM tickets t
+            {where}
+        """
+        return self.db.query(query, tuple(params))[0]
+
+    def get_daily_trends(self, start_date=None):
+        """
+        Get tickets created per day, in total and per status
+
+        Staff read the incrementally maintained ticket_daily_rollups table, so
+        the cost depends on the number of days shown rather than the number of
+        tickets. Customers' own tickets are few enough to aggregate directly.
+
+        Args:
+            start_date (date, optional): First day to include
+
+        Returns:
+            tuple: (list of {date, count}, list of {date, status, count})
+        """
+        if self.user_role == 'customer':
+            conditions = ["t.created_at >= %s"] if start_date else []
+            where, params = self._scope(conditions)
+            params = params + ([start_date] if start_date else [])
+            query = f"""
+                SELECT t.created_at::date as date, t.status, COUNT(*) as count,
+                       GROUPING(t.status) as all_statuses
+                FROM tickets t
+                {where}
+                GROUP BY GROUPING SETS ((t.created_at::date), (t.created_at::date, t.status))
+                ORDER BY date
+            """
+        else:
+            where = "WHERE r.day >= %s" if start_date else ""
+            params = [start_date] if start_date else []
+            query = f"""
+                SELECT r.day as date, r.status, SUM(r.count) as count,
+                       GROUPING(r.status) as all_statuses
+                FROM ticket_daily_rollups r
+                {where}
+                GROUP BY GROUPING SETS ((r.day), (r.day, r.status))
+                HAVING SUM(r.count) > 0
+                ORDER BY date
+            """
+        rows = self.db.query(query, tuple(params)) or []
+        daily = [{'date': r['date'], 'count': int(r['count'])} for r in rows if r['all_statuses']]
+        by_status = [{'date': r['date'], 'status': r['status'], 'count': int(r['count'])}
+                     for r in rows if not r['all_statuses']]
+        return daily, by_status
+
+    def rebuild_rollups(self):
+        """Recompute ticket_daily_rollups from the tickets table"""
+        self.db.execute("SELECT rebuild_ticket_daily_rollups()")
+
+    def get_distribution(self):
+        """
+        Get ticket counts by category and by priority
+
+        Returns:
+            tuple: (list of {category, count}, list of {priority, count})
+        """
+        where, params = self._scope()
+        query = f"""
+            SELECT t.category, t.priority, COUNT(*) as count,
+                   GROUPING(t.category) as by_priority
+            FROM tickets t
+            {where}
+            GROUP BY GROUPING SETS ((t.category), (t.priority))
+            ORDER BY count DESC
+        """
+        rows = self.db.query(query, tuple(params)) or []
+        by_category = [{'category': r['category'], 'count': r['count']} for r in rows if not r['by_priority']]
+        by_priority = [{'priority': r['priority'], 'count': r['count']} for r in rows if r['by_priority']]
+        return by_category, by_priority
+
+    def get_agent_performance(self):
+        """Get assigned and closed ticket counts per assignee"""
+        where, params = self._scope(["t.assigned_to IS NOT NULL"])
+        query = f"""
+            SELECT u.email as assignee_email,
+                   COUNT(*) as assigned,
+                   COUNT(*) FILTER (WHERE LOWER(t.status) = 'closed') as closed,
+                   ROUND(100.0 * COUNT(*) FILTER (WHERE LOWER(t.status) = 'closed') / COUNT(*), 2) as resolution_rate
+            FROM tickets t
+            JOIN users u ON t.assigned_to = u.id
+            {where}
+            GROUP BY u.email
+            ORDER BY assigned DESC
+        """
+        return self.db.query(query, tuple(params)) or []
+
+    def get_resolution_time_by_priority(self):
+        """Get the average hours from creation to last update of closed tickets, per priority"""
+        where, params = self._scope(["LOWER(t.status) = 'closed'"])
+        query = f"""
+            SELECT t.priority,
+                   ROUND((AVG(EXTRACT(EPOCH FROM t.updated_at - t.created_at)) / 3600)::numeric, 2) as hours
+            FROM tickets t
+            {where}
+            GROUP BY t.priority
+            ORDER BY t.priority
+        """
+        return self.db.query(query, tuple(params)) or []
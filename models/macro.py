@@ -1,10 +1,12 @@
 from db.database import Database
 from psycopg2.extras import Json
+from utils.cache import get_cache
 import json
 
 class Macro:
     def __init__(self):
         self.db = Database()
+        self.cache = get_cache()
     
     def create_macro(self, name, user_id, actions, description=None):
         """Create a new macro"""
@@ -14,7 +16,9 @@ class Macro:
             RETURNING id, name, actions
         """
         try:
-            return self.db.execute(query, (name, user_id, Json(actions), description))
+            result = self.db.execute(query, (name, user_id, Json(actions), description))
+            self.db.after_commit(lambda: self.cache.invalidate('macros', user_id))
+            return result
         except Exception as e:
             print(f"Error creating macro: {str(e)}")
             raise
@@ -27,7 +31,9 @@ class Macro:
             WHERE user_id = %s
             ORDER BY name
         """
-        return self.db.execute(query, (user_id,))
+        return list(self.cache.get_or_load(
+            ('macros', user_id), lambda: self.db.query(query, (user_id,)) or []
+        ))
     
     def get_macro_by_id(self, macro_id, user_id):
         """Get a specific macro by ID and user"""
@@ -36,7 +42,7 @@ class Macro:
             FROM macros
             WHERE id = %s AND user_id = %s
         """
-        result = self.db.execute(query, (macro_id, user_id))
+        result = self.db.query(query, (macro_id, user_id))
         return result[0] if result else None
     
     def update_macro(self, macro_id, user_id, name=None, actions=None, description=None):
@@ -67,6 +73,7 @@ class Macro:
             RETURNING id, name, actions
         """
         result = self.db.execute(query, tuple(params))
+        self.db.after_commit(lambda: self.cache.invalidate('macros', user_id))
         return result[0] if result else None
     
     def delete_macro(self, macro_id, user_id):
@@ -77,4 +84,5 @@ class Macro:
             RETURNING id
         """
         result = self.db.execute(query, (macro_id, user_id))
+        self.db.after_commit(lambda: self.cache.invalidate('macros', user_id))
         return bool(result)
@@ -0,0 +1,32 @@
+from db.database import Database
+from utils.cache import get_cache
+
+class NotificationPreference:
+    # Delivery modes: coalesced per ticket, or one digest per hour or day
+    MODES = ['immediate', 'hourly', 'daily']
+
+    def __init__(self):
+        self.db = Database()
+        self.cache = get_cache()
+
+    def get_mode(self, user_id):
+        """Get a user's notification delivery mode; users without a preference get 'immediate'"""
+        query = "SELECT mode FROM notification_preferences WHERE user_id = %s"
+
+        def load():
+            result = self.db.query(query, (user_id,))
+            return result[0]['mode'] if result else 'immediate'
+
+        return self.cache.get_or_load(('notification_preferences', user_id), load)
+
+    def set_mode(self, user_id, mode):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown notification mode: {mode}")
+        query = """
+            INSERT INTO notification_preferences (user_id, mode)
+            VALUES (%s, %s)
+            ON CONFLICT (user_id)
+            DO UPDATE SET mode = EXCLUDED.mode, updated_at = CURRENT_TIMESTAMP
+        """
+        self.db.execute(query, (user_id, mode))
+        self.db.after_commit(lambda: self.cache.invalidate('notification_preferences', user_id))
@@ -1,10 +1,12 @@
 from db.database import Database
 from psycopg2.extras import Json
+from utils.cache import get_cache
 import json
 
 class SavedFilter:
     def __init__(self):
         self.db = Database()
+        self.cache = get_cache()
     
     def create_filter(self, name, user_id, filter_criteria, is_macro=False):
         """Create a new saved filter"""
@@ -14,7 +16,9 @@ class SavedFilter:
             RETURNING id, name, filter_criteria
         """
         try:
-            return self.db.execute(query, (name, user_id, Json(filter_criteria), is_macro))
+            result = self.db.execute(query, (name, user_id, Json(filter_criteria), is_macro))
+            self.db.after_commit(lambda: self.cache.invalidate('saved_filters', user_id))
+            return result
         except Exception as e:
             print(f"Error creating filter: {str(e)}")
             raise
@@ -28,7 +32,10 @@ class SavedFilter:
             AND (is_macro = %s OR %s = TRUE)
             ORDER BY name
         """
-        return self.db.execute(query, (user_id, False, include_macros))
+        return list(self.cache.get_or_load(
+            ('saved_filters', user_id, include_macros),
+            lambda: self.db.query(query, (user_id, False, include_macros)) or []
+        ))
 
     def get_filter_by_id(self, filter_id, user_id):
         """Get a specific filter by ID and user"""
@@ -37,7 +44,7 @@ class SavedFilter:
             FROM saved_filters
             WHERE id = %s AND user_id = %s
         """
-        result = self.db.execute(query, (filter_id, user_id))
+        result = self.db.query(query, (filter_id, user_id))
         return result[0] if result else None
 
     def update_filter(self, filter_id, user_id, name=None, filter_criteria=None):
@@ -65,6 +72,7 @@ class SavedFilter:
             RETURNING id, name, filter_criteria
         """
         result = self.db.execute(query, tuple(params))
+        self.db.after_commit(lambda: self.cache.invalidate('saved_filters', user_id))
         return result[0] if result else None
 
     def delete_filter(self, filter_id, user_id):
@@ -75,4 +83,5 @@ class SavedFilter:
             RETURNING id
         """
         result = self.db.execute(query, (filter_id, user_id))
+        self.db.after_commit(lambda: self.cache.invalidate('saved_filters', user_id))
         return bool(result)
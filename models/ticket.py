@@ -1,8 +1,44 @@
 from db.database import Database
+from psycopg2.extras import Json
+from models.custom_field import CustomField
+from utils.audit_logger import AuditLogger
+from utils.email import EmailNotifier
+
+TICKET_COLUMNS = """
+    t.id, t.title, t.description, t.status, t.priority, t.category,
+    t.created_by, t.assigned_to, t.created_at, t.updated_at
+"""
+
+# Base query for reading tickets; the search_vector column is left out on purpose
+TICKET_SELECT = f"""
+    SELECT {TICKET_COLUMNS}, u1.email as creator_email, u2.email as assignee_email
+    FROM tickets t
+    LEFT JOIN users u1 ON t.created_by = u1.id
+    LEFT JOIN users u2 ON t.assigned_to = u2.id
+"""
+
+# Fields of an imported or exported ticket, in staging table order
+IMPORT_COLUMNS = (
+    'title', 'description', 'status', 'priority', 'category',
+    'created_by_email', 'assigned_to_email', 'created_at', 'updated_at',
+    'custom_fields', 'comments',
+)
 
 class Ticket:
+    # Columns the ticket list may be ordered by; values are trusted SQL
+    SORT_COLUMNS = {
+        'updated_at': 't.updated_at',
+        'created_at': 't.created_at',
+    }
+
+    # Columns bulk_update may change
+    BULK_FIELDS = ('status', 'priority', 'assigned_to')
+
     def __init__(self):
         self.db = Database()
+        self.audit_logger = AuditLogger()
+        self.email_notifier = EmailNotifier()
+        self.custom_field = CustomField()
 
     def create_ticket(self, title, description, status, priority, category, created_by, assigned_to=None):
         query = """
@@ -12,28 +48,355 @@ class Ticket:
         return self.db.execute(query, (title, description, status, priority, category, created_by, assigned_to))
 
     def get_all_tickets(self, user_id=None, user_role=None):
-        base_query = """
-            SELECT t.*, u1.email as creator_email, u2.email as assignee_email
-            FROM tickets t
-            LEFT JOIN users u1 ON t.created_by = u1.id
-            LEFT JOIN users u2 ON t.assigned_to = u2.id
-        """
+        base_query = TICKET_SELECT
         
         if user_role == 'customer':
             base_query += " WHERE t.created_by = %s OR t.assigned_to = %s"
-            return self.db.execute(base_query, (user_id, user_id))
+            return self.db.query(base_query, (user_id, user_id))
         
-        return self.db.execute(base_query)
+        return self.db.query(base_query)
 
-    def get_ticket_by_id(self, ticket_id):
+    def _build_filters(self, user_id=None, user_role=None, status=None, priority=None, search=None,
+                       custom_fields=None):
+        """
+        Build the WHERE conditions and params shared by the ticket list queries
+
+        custom_fields maps field ids to a value or a list of accepted values.
+        Each becomes a containment test on tickets.custom_values, which the
+        GIN index answers without touching ticket_custom_fields.
+        """
+        conditions = []
+        params = []
+
+        if user_role == 'customer':
+            conditions.append("(t.created_by = %s OR t.assigned_to = %s)")
+            params.extend([user_id, user_id])
+        if status:
+            conditions.append("LOWER(t.status) = LOWER(%s)")
+            params.append(status)
+        if priority:
+            conditions.append("LOWER(t.priority) = LOWER(%s)")
+            params.append(priority)
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("t.title ILIKE %s")
+            params.append(f"%{escaped}%")
+        if custom_fields:
+            fields = self.custom_field.get_schema().fields
+            for field_id, values in custom_fields.items():
+                field = fields.get(int(field_id))
+                if not isinstance(values, list):
+                    values = [values]
+                # Saved filters may still name a field that has since been deleted
+                if field is None or not values:
+                    continue
+                documents = self.custom_field.value_filters(field, values)
+                conditions.append("(" + " OR ".join(["t.custom_values @> %s"] * len(documents)) + ")")
+                params.extend(Json(document) for document in documents)
+
+        return conditions, params
+
+    def get_tickets_page(self, user_id=None, user_role=None, status=None, priority=None,
+                         search=None, custom_fields=None, sort_by='updated_at', cursor=None, limit=25):
+        """
+        Get one page of tickets with all filters applied in SQL.
+
+        Tickets are ordered newest first by ``sort_by`` and then by id. Pass the
+        returned cursor back in to fetch the following page. Both sort columns
+        are NOT NULL (migration 0015), which the keyset comparison relies on.
+
+        Args:
+            status (str, optional): Only tickets with this status
+            priority (str, optional): Only tickets with this priority
+            search (str, optional): Substring to match against the title
+            custom_fields (dict, optional): field id -> value or list of accepted values
+            sort_by (str): One of SORT_COLUMNS
+            cursor (tuple, optional): (sort value, id) of the last ticket seen
+            limit (int): Maximum number of tickets to return
+
+        Returns:
+            tuple: (list of tickets, cursor for the next page or None)
+        """
+        if sort_by not in self.SORT_COLUMNS:
+            raise ValueError(f"Invalid sort column: {sort_by}")
+        sort_column = self.SORT_COLUMNS[sort_by]
+
+        conditions, params = self._build_filters(user_id, user_role, status, priority, search, custom_fields)
+        if cursor:
+            conditions.append(f"({sort_column}, t.id) < (%s, %s)")
+            params.extend(cursor)
+
+        query = TICKET_SELECT
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # Fetch one extra row to find out whether another page exists
+        query += f" ORDER BY {sort_column} DESC, t.id DESC LIMIT %s"
+        params.append(limit + 1)
+
+        tickets = self.db.query(query, tuple(params)) or []
+        next_cursor = None
+        if len(tickets) > limit:
+            tickets = tickets[:limit]
+            last = tickets[-1]
+            next_cursor = (last[sort_by], last['id'])
+        return tickets, next_cursor
+
+    def search(self, query, user_id=None, user_role=None, status=None, priority=None,
+               custom_fields=None, cursor=None, limit=25):
+        """
+        Full-text search over ticket titles, descriptions and public comments.
+
+        Matches are ranked with titles weighted above descriptions and
+        descriptions above comments. ``query`` accepts web search syntax
+        (quoted phrases, OR, -excluded words).
+
+        Args:
+            query (str): Search terms
+            custom_fields (dict, optional): field id -> value or list of accepted values
+            cursor (tuple, optional): (rank, id) of the last hit seen
+            limit (int): Maximum number of hits to return
+
+        Returns:
+            tuple: (list of tickets with rank and snippet, cursor for the next page or None)
+        """
+        conditions, params = self._build_filters(user_id, user_role, status, priority,
+                                                 custom_fields=custom_fields)
+        conditions.insert(0, "t.search_vector @@ q.query")
+        params.insert(0, query)
+        if cursor:
+            conditions.append("(ts_rank(t.search_vector, q.query)::float8, t.id) < (%s, %s)")
+            params.extend(cursor)
+        params.append(limit + 1)
+
+        # Rank and page first, then only build snippets for the page itself
+        sql = f"""
+            SELECT page.*,
+                   ts_headline('english', page.description, q.query,
+                               'StartSel=**, StopSel=**, MaxFragments=2, MaxWords=25, MinWords=8') as snippet
+            FROM (
+                SELECT {TICKET_COLUMNS}, u1.email as creator_email, u2.email as assignee_email,
+                       ts_rank(t.search_vector, q.query)::float8 as rank
+                FROM tickets t
+                CROSS JOIN websearch_to_tsquery('english', %s) as q(query)
+                LEFT JOIN users u1 ON t.created_by = u1.id
+                LEFT JOIN users u2 ON t.assigned_to = u2.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY rank DESC, t.id DESC
+                LIMIT %s
+            ) page
+            CROSS JOIN websearch_to_tsquery('english', %s) as q(query)
+            ORDER BY page.rank DESC, page.id DESC
+        """
+        params.append(query)
+
+        tickets = self.db.query(sql, tuple(params)) or []
+        next_cursor = None
+        if len(tickets) > limit:
+            tickets = tickets[:limit]
+            last = tickets[-1]
+            next_cursor = (last['rank'], last['id'])
+        return tickets, next_cursor
+
+    def import_rows(self, rows, first_row=1):
+        """
+        Insert a batch of tickets with their custom field values and comments
+
+        Rows are loaded into a temporary staging table with COPY and moved
+        into the real tables with a few set-based statements, all in one
+        transaction. Users are resolved by email (case-insensitively);
+        custom fields by name.
+
+        Args:
+            rows (list): Dicts with the IMPORT_COLUMNS keys. custom_fields
+                maps field names to values; comments is a list of dicts with
+                author_email, content, is_private and created_at
+            first_row (int): Number of the first row in the input file, used
+                in error messages
+
+        Raises:
+            ValueError: If a row does not fit the tickets table; nothing from
+                the batch is imported and the message lists the bad rows
+
+        Returns:
+            dict: Counts of imported tickets, field values and comments, and
+            of user emails and field names that could not be resolved
+        """
+        with self.db.transaction():
+            self.db.execute("""
+                CREATE TEMP TABLE ticket_import_staging (
+                    line INTEGER,
+                    ticket_id INTEGER,
+                    title TEXT,
+                    description TEXT,
+                    status TEXT,
+                    priority TEXT,
+                    category TEXT,
+                    created_by_email TEXT,
+                    assigned_to_email TEXT,
+                    created_at TIMESTAMP,
+                    updated_at TIMESTAMP,
+                    custom_fields JSONB,
+                    comments JSONB
+                ) ON COMMIT DROP
+            """)
+            self.db.bulk_insert(
+                'ticket_import_staging',
+                ['line'] + list(IMPORT_COLUMNS),
+                ([first_row + i] + [row.get(column) for column in IMPORT_COLUMNS]
+                 for i, row in enumerate(rows))
+            )
+            # Check the column limits here, so a bad row is reported by number
+            # instead of failing the whole INSERT with no hint which row it was
+            invalid = self.db.execute("""
+                SELECT line, array_remove(ARRAY[
+                    CASE WHEN title IS NULL OR title = '' THEN 'title is missing' END,
+                    CASE WHEN length(title) > 255 THEN 'title is longer than 255 characters' END,
+                    CASE WHEN length(status) > 50 THEN 'status is longer than 50 characters' END,
+                    CASE WHEN length(priority) > 20 THEN 'priority is longer than 20 characters' END,
+                    CASE WHEN length(category) > 50 THEN 'category is longer than 50 characters' END
+                ], NULL) as errors
+                FROM ticket_import_staging
+                WHERE title IS NULL OR title = '' OR length(title) > 255 OR length(status) > 50
+                   OR length(priority) > 20 OR length(category) > 50
+                ORDER BY line
+                LIMIT 20
+            """)
+            if invalid:
+                raise ValueError("Invalid rows: " + "; ".join(
+                    f"row {row['line']}: {', '.join(row['errors'])}" for row in invalid
+                ))
+            # Allocate ids up front so custom fields and comments can refer to them
+            self.db.execute("""
+                UPDATE ticket_import_staging
+                SET ticket_id = nextval(pg_get_serial_sequence('tickets', 'id'))
+            """)
+            stats = self.db.execute("""
+                WITH resolved AS (
+                    SELECT s.*, cu.id as created_by, au.id as assigned_to
+                    FROM ticket_import_staging s
+                    LEFT JOIN users cu ON LOWER(cu.email) = LOWER(s.created_by_email)
+                    LEFT JOIN users au ON LOWER(au.email) = LOWER(s.assigned_to_email)
+                ), inserted AS (
+                    INSERT INTO tickets (id, title, description, status, priority, category,
+                                         created_by, assigned_to, created_at, updated_at)
+                    SELECT ticket_id, title, COALESCE(description, ''), COALESCE(status, 'Open'),
+                           COALESCE(priority, 'Medium'), category, created_by, assigned_to,
+                           COALESCE(created_at, CURRENT_TIMESTAMP),
+                           COALESCE(updated_at, created_at, CURRENT_TIMESTAMP)
+                    FROM resolved
+                    ORDER BY line
+                    RETURNING id
+                )
+                SELECT (SELECT COUNT(*) FROM inserted) as tickets,
+                       COUNT(*) FILTER (WHERE created_by_email IS NOT NULL AND created_by IS NULL)
+                     + COUNT(*) FILTER (WHERE assigned_to_email IS NOT NULL AND assigned_to IS NULL)
+                       as unresolved_users
+                FROM resolved
+            """)[0]
+
+            field_stats = self.db.execute("""
+                WITH staged_values AS (
+                    SELECT s.ticket_id, kv.key, kv.value, cf.id as field_id
+                    FROM ticket_import_staging s
+                    CROSS JOIN LATERAL jsonb_each_text(COALESCE(s.custom_fields, '{}'::jsonb)) kv
+                    LEFT JOIN custom_fields cf ON cf.field_name = kv.key
+                ), inserted AS (
+                    INSERT INTO ticket_custom_fields (ticket_id, field_id, field_value)
+                    SELECT ticket_id, field_id, value FROM staged_values
+                    WHERE field_id IS NOT NULL AND value IS NOT NULL
+                    ON CONFLICT (ticket_id, field_id) DO UPDATE SET field_value = EXCLUDED.field_value
+                    RETURNING 1
+                )
+                SELECT (SELECT COUNT(*) FROM inserted) as field_values,
+                       COUNT(*) FILTER (WHERE field_id IS NULL) as unknown_fields
+                FROM staged_values
+            """)[0]
+            self.db.execute("""
+                UPDATE tickets SET custom_values = ticket_custom_values(id)
+                WHERE id IN (SELECT ticket_id FROM ticket_import_staging WHERE custom_fields IS NOT NULL)
+            """)
+
+            # Comments by unknown authors are attributed to the ticket's creator
+            comment_stats = self.db.execute("""
+                INSERT INTO comments (ticket_id, user_id, content, is_private, created_at)
+                SELECT s.ticket_id, COALESCE(u.id, t.created_by), c.content,
+                       COALESCE(c.is_private, FALSE), COALESCE(c.created_at, t.created_at)
+                FROM ticket_import_staging s
+                JOIN tickets t ON t.id = s.ticket_id
+                CROSS JOIN LATERAL jsonb_to_recordset(COALESCE(s.comments, '[]'::jsonb))
+                    AS c(author_email TEXT, content TEXT, is_private BOOLEAN, created_at TIMESTAMP)
+                LEFT JOIN users u ON LOWER(u.email) = LOWER(c.author_email)
+                WHERE c.content IS NOT NULL
+                RETURNING id
+            """) or []
+
+        return {
+            'tickets': stats['tickets'],
+            'field_values': field_stats['field_values'],
+            'comments': len(comment_stats),
+            'unresolved_users': stats['unresolved_users'],
+            'unknown_fields': field_stats['unknown_fields'],
+        }
+
+    def backfill_search_vectors(self, after_id=0, batch_size=1000):
+        """
+        Fill search_vector for the next batch_size tickets after after_id that have none
+
+        Returns:
+            tuple: (highest ticket id in the batch or None when done, tickets updated)
+        """
+        query = """
+            WITH done AS (
+                UPDATE tickets SET search_vector = ticket_search_document(id, title, description)
+                WHERE id IN (
+                    SELECT id FROM tickets
+                    WHERE id > %s AND search_vector IS NULL
+                    ORDER BY id
+                    LIMIT %s
+                )
+                RETURNING id
+            )
+            SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+        """
+        result = self.db.execute(query, (after_id, batch_size))[0]
+        return result['last_id'], result['rows']
+
+    def stream_export(self, after_id=0, batch_size=1000):
+        """
+        Yield every ticket with id above after_id, in id order, for export
+
+        Rows come from a server-side cursor, so memory use stays flat. Each
+        row has the IMPORT_COLUMNS keys plus id, so an export can be
+        imported again; resume an interrupted export by passing the last
+        exported id. Close the generator if it is not read to the end (see
+        Database.stream).
+        """
         query = """
-            SELECT t.*, u1.email as creator_email, u2.email as assignee_email
+            SELECT t.id, t.title, t.description, t.status, t.priority, t.category,
+                   cu.email as created_by_email, au.email as assigned_to_email,
+                   t.created_at, t.updated_at,
+                   (SELECT jsonb_object_agg(cf.field_name, tcf.field_value)
+                    FROM ticket_custom_fields tcf
+                    JOIN custom_fields cf ON cf.id = tcf.field_id
+                    WHERE tcf.ticket_id = t.id) as custom_fields,
+                   (SELECT jsonb_agg(jsonb_build_object(
+                               'author_email', u.email, 'content', c.content,
+                               'is_private', c.is_private, 'created_at', c.created_at
+                           ) ORDER BY c.created_at, c.id)
+                    FROM comments c
+                    LEFT JOIN users u ON u.id = c.user_id
+                    WHERE c.ticket_id = t.id) as comments
             FROM tickets t
-            LEFT JOIN users u1 ON t.created_by = u1.id
-            LEFT JOIN users u2 ON t.assigned_to = u2.id
-            WHERE t.id = %s
+            LEFT JOIN users cu ON t.created_by = cu.id
+            LEFT JOIN users au ON t.assigned_to = au.id
+            WHERE t.id > %s
+            ORDER BY t.id
         """
-        result = self.db.execute(query, (ticket_id,))
+        return self.db.stream(query, (after_id,), batch_size=batch_size)
+
+    def get_ticket_by_id(self, ticket_id):
+        query = TICKET_SELECT + " WHERE t.id = %s"
+        result = self.db.query(query, (ticket_id,))
         return result[0] if result else None
 
     def update_ticket(self, ticket_id, status=None, priority=None, assigned_to=None):
@@ -58,6 +421,155 @@ class Ticket:
         """
         return self.db.execute(query, tuple(params))
 
+    def get_matching_ids(self, user_id=None, user_role=None, status=None, priority=None,
+                         search=None, custom_fields=None, after_id=0, limit=1000):
+        """
+        Get the ids of the tickets matching the ticket list filters, for bulk operations
+
+        A search term matches the same way as in search(), so the result is
+        the set of tickets the user is paging through. Ids come in ascending
+        order; pass the last one as after_id to get the next batch.
+        """
+        conditions, params = self._build_filters(user_id, user_role, status, priority,
+                                                 custom_fields=custom_fields)
+        if search:
+            conditions.append("t.search_vector @@ websearch_to_tsquery('english', %s)")
+            params.append(search)
+        conditions.append("t.id > %s")
+        params.append(after_id)
+        query = "SELECT t.id FROM tickets t WHERE " + " AND ".join(conditions)
+        query += " ORDER BY t.id LIMIT %s"
+        params.append(limit)
+        return [row['id'] for row in self.db.query(query, tuple(params)) or []]
+
+    def bulk_update_matching(self, changes, user_id=None, user_role=None, status=None, priority=None,
+                             search=None, custom_fields=None, comment=None, is_private=False,
+                             batch_size=1000):
+        """
+        Apply bulk_update to every ticket matching the ticket list filters
+
+        Tickets are walked in id order and updated batch_size at a time, each
+        batch in its own transaction, so there is no cap on how many match.
+        The filters are those of get_matching_ids.
+
+        Returns:
+            int: Number of tickets updated
+        """
+        updated, after_id = 0, 0
+        while True:
+            ticket_ids = self.get_matching_ids(user_id, user_role, status, priority, search,
+                                               custom_fields, after_id=after_id, limit=batch_size)
+            if not ticket_ids:
+                return updated
+            updated += len(self.bulk_update(ticket_ids, changes, user_id=user_id,
+                                            comment=comment, is_private=is_private))
+            after_id = ticket_ids[-1]
+            if len(ticket_ids) < batch_size:
+                return updated
+
+    def bulk_update(self, ticket_ids, changes, user_id=None, comment=None, is_private=False):
+        """
+        Apply the same changes to many tickets in one transaction
+
+        The update, the comments, the audit entries and the notifications
+        are each written with a single set-based statement, however many
+        tickets are selected.
+
+        Args:
+            ticket_ids (list): Tickets to change
+            changes (dict): New values for any of BULK_FIELDS
+            user_id (int, optional): The user making the change; authors the comments
+            comment (str, optional): Comment added to every ticket. May use
+                {id}, {title}, {status} and {priority}, filled in per ticket
+                after the update
+            is_private (bool): Whether the comments are private
+
+        Returns:
+            list: The updated tickets, with old_status, old_priority and
+            old_assigned_to holding the values before the update
+        """
+        changes = {k: v for k, v in changes.items() if k in self.BULK_FIELDS and v is not None}
+        ticket_ids = list(dict.fromkeys(ticket_ids))
+        if not ticket_ids or not (changes or (comment and comment.strip())):
+            return []
+
+        assignments = [f"{column} = %s" for column in changes] + ["updated_at = CURRENT_TIMESTAMP"]
+        # The old row is read in the FROM clause, so RETURNING can report both versions
+        query = f"""
+            UPDATE tickets t
+            SET {', '.join(assignments)}
+            FROM (
+                SELECT id, status, priority, assigned_to
+                FROM tickets
+                WHERE id = ANY(%s)
+                FOR UPDATE
+            ) old
+            WHERE t.id = old.id
+            RETURNING t.id, t.title, t.description, t.status, t.priority, t.category,
+                      t.created_by, t.assigned_to,
+                      old.status as old_status, old.priority as old_priority,
+                      old.assigned_to as old_assigned_to
+        """
+        params = list(changes.values()) + [ticket_ids]
+
+        with self.db.transaction():
+            updated = self.db.execute(query, tuple(params)) or []
+            if not updated:
+                return []
+
+            if comment and comment.strip():
+                rows = [(t['id'], user_id, self.render_comment(comment, t), is_private) for t in updated]
+                self.db.execute_many("""
+                    INSERT INTO comments (ticket_id, user_id, content, is_private)
+                    VALUES %s
+                """, rows)
+
+            audit_entries = []
+            for ticket in updated:
+                diff = {
+                    field: {'old': ticket[f'old_{field}'], 'new': ticket[field]}
+                    for field in changes if ticket[f'old_{field}'] != ticket[field]
+                }
+                if diff or comment:
+                    audit_entries.append({
+                        'operation': "update",
+                        'entity_type': "ticket",
+                        'entity_id': ticket['id'],
+                        'user_id': user_id,
+                        'details': {'changes': diff, 'bulk': True, 'commented': bool(comment)},
+                    })
+            self.audit_logger.log_actions(audit_entries)
+
+            self._notify_bulk_update(updated)
+        return updated
+
+    @staticmethod
+    def render_comment(template, ticket):
+        """Fill {id}, {title}, {status} and {priority} into a comment template"""
+        values = {key: ticket.get(key) for key in ('id', 'title', 'status', 'priority')}
+        try:
+            return template.format_map(values).strip()
+        except (KeyError, ValueError, IndexError):
+            # Unknown placeholders or stray braces: use the text as written
+            return template.strip()
+
+    def _notify_bulk_update(self, updated):
+        user_ids = {t['created_by'] for t in updated} | {t['assigned_to'] for t in updated}
+        user_ids.discard(None)
+        if not user_ids:
+            return
+        emails = {
+            row['id']: row['email']
+            for row in self.db.query("SELECT id, email FROM users WHERE id = ANY(%s)", (list(user_ids),)) or []
+        }
+        events = []
+        for ticket in updated:
+            if emails.get(ticket['created_by']):
+                events.append((emails[ticket['created_by']], ticket, 'updated'))
+            if ticket['assigned_to'] != ticket['old_assigned_to'] and emails.get(ticket['assigned_to']):
+                events.append((emails[ticket['assigned_to']], ticket, 'assigned'))
+        self.email_notifier.record_events(events)
+
     def add_comment(self, ticket_id, user_id, content, is_private=False):
         if not content or not content.strip():
             return None
@@ -77,4 +589,26 @@ class Ticket:
             WHERE c.ticket_id = %s
             ORDER BY c.created_at DESC
         """
-        return self.db.execute(query, (ticket_id,))
+        return self.db.query(query, (ticket_id,))
+
+    def get_comments_for_tickets(self, ticket_ids):
+        """
+        Get the comments of several tickets in a single query
+
+        Returns:
+            dict: ticket id -> list of comments, newest first
+        """
+        comments = {ticket_id: [] for ticket_id in ticket_ids}
+        if not comments:
+            return comments
+
+        query = """
+            SELECT c.*, u.email as user_email
+            FROM comments c
+            JOIN users u ON c.user_id = u.id
+            WHERE c.ticket_id = ANY(%s)
+            ORDER BY c.created_at DESC
+        """
+        for row in self.db.query(query, (list(comments),)) or []:
+            comments[row['ticket_id']].append(row)
+        return comments
@@ -1,10 +1,12 @@
 import hashlib
 import uuid
 from db.database import Database
+from utils.cache import get_cache
 
 class User:
     def __init__(self):
         self.db = Database()
+        self.cache = get_cache()
 
     def create_user(self, email, password, role):
         password_hash = hashlib.sha256(password.encode()).hexdigest()
@@ -12,21 +14,23 @@ class User:
             INSERT INTO users (email, password_hash, role)
             VALUES (%s, %s, %s) RETURNING id
         """
-        return self.db.execute(query, (email, password_hash, role))
+        result = self.db.execute(query, (email, password_hash, role))
+        self.db.after_commit(lambda: self.cache.invalidate('users'))
+        return result
 
     def authenticate(self, email, password):
         password_hash = hashlib.sha256(password.encode()).hexdigest()
         query = """
             SELECT * FROM users WHERE email = %s AND password_hash = %s
         """
-        result = self.db.execute(query, (email, password_hash))
+        result = self.db.query(query, (email, password_hash))
         return result[0] if result else None
 
     def get_all_users(self):
         query = "SELECT id, email, role, created_at FROM users"
-        return self.db.execute(query)
+        return list(self.cache.get_or_load(('users',), lambda: self.db.query(query) or []))
 
     def get_user_by_id(self, user_id):
         query = "SELECT * FROM users WHERE id = %s"
-        result = self.db.execute(query, (user_id,))
+        result = self.db.query(query, (user_id,))
         return result[0] if result else None
@@ -1,11 +1,11 @@
 import streamlit as st
 from utils.auth import require_auth
 from models.ticket import Ticket
+from models.dashboard_stats import DashboardStats
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import pandas as pd
-from db.database import Database
 
 def render_dashboard():
     require_auth()
@@ -13,22 +13,19 @@ def render_dashboard():
     st.title("Support Dashboard")
     
     ticket_model = Ticket()
-    db = Database()
-    
-    # Fetch tickets and create DataFrame
-    tickets = ticket_model.get_all_tickets(
+    stats = DashboardStats(
         user_id=st.session_state.user['id'],
         user_role=st.session_state.user['role']
     )
-    df_tickets = pd.DataFrame(tickets)
     
     # Overview Statistics
+    overview = stats.get_overview()
     col1, col2, col3, col4, col5 = st.columns(5)
     
-    total_tickets = len(df_tickets)
-    open_tickets = len(df_tickets[df_tickets['status'].str.lower() == 'open'])
-    closed_tickets = len(df_tickets[df_tickets['status'].str.lower() == 'closed'])
-    in_progress = len(df_tickets[df_tickets['status'].str.lower() == 'in progress'])
+    total_tickets = overview['total']
+    open_tickets = overview['open']
+    closed_tickets = overview['closed']
+    in_progress = overview['in_progress']
     
     with col1:
         st.metric("Total Tickets", total_tickets)
@@ -46,12 +43,14 @@ def render_dashboard():
     st.markdown("---")
     st.subheader("Ticket Trends")
     
-    # Convert created_at to datetime if it's not already
-    df_tickets['created_at'] = pd.to_datetime(df_tickets['created_at'])
+    trend_periods = {"Last 30 days": 30, "Last 90 days": 90, "Last year": 365, "All time": None}
+    trend_period = st.selectbox("Period", list(trend_periods), index=1)
+    trend_start = None
+    if trend_periods[trend_period]:
+        trend_start = datetime.now().date() - timedelta(days=trend_periods[trend_period])
     
-    # Daily ticket creation trend
-    daily_tickets = df_tickets.groupby(df_tickets['created_at'].dt.date).size().reset_index()
-    daily_tickets.columns = ['date', 'count']
+    daily_tickets, status_daily_rows = stats.get_daily_trends(start_date=trend_start)
+    daily_tickets = pd.DataFrame(daily_tickets, columns=['date', 'count'])
     
     fig_trend = px.line(daily_tickets, x='date', y='count',
                         title='Daily Ticket Volume',
@@ -62,21 +61,20 @@ def render_dashboard():
     st.markdown("---")
     st.subheader("Ticket Distribution")
     
+    category_counts, priority_counts = stats.get_distribution()
     col1, col2 = st.columns(2)
     
     with col1:
         # Category distribution
-        category_counts = df_tickets['category'].value_counts()
-        fig_category = px.pie(values=category_counts.values, 
-                            names=category_counts.index,
+        fig_category = px.pie(values=[c['count'] for c in category_counts],
+                            names=[c['category'] for c in category_counts],
                             title='Tickets by Category')
         st.plotly_chart(fig_category, use_container_width=True)
         
     with col2:
         # Priority distribution
-        priority_counts = df_tickets['priority'].value_counts()
-        fig_priority = px.pie(values=priority_counts.values,
-                            names=priority_counts.index,
+        fig_priority = px.pie(values=[p['count'] for p in priority_counts],
+                            names=[p['priority'] for p in priority_counts],
                             title='Tickets by Priority')
         st.plotly_chart(fig_priority, use_container_width=True)
         
@@ -84,10 +82,15 @@ def render_dashboard():
     st.markdown("---")
     st.subheader("Status Timeline")
     
-    status_daily = df_tickets.groupby([df_tickets['created_at'].dt.date, 'status']).size().unstack(fill_value=0)
-    fig_timeline = px.area(status_daily, title='Ticket Status Over Time',
-                          labels={'value': 'Number of Tickets', 'index': 'Date'})
-    st.plotly_chart(fig_timeline, use_container_width=True)
+    if status_daily_rows:
+        status_daily = pd.DataFrame(status_daily_rows).pivot(
+            index='date', columns='status', values='count'
+        ).fillna(0)
+        fig_timeline = px.area(status_daily, title='Ticket Status Over Time',
+                              labels={'value': 'Number of Tickets', 'index': 'Date'})
+        st.plotly_chart(fig_timeline, use_container_width=True)
+    else:
+        st.info("No tickets yet")
         
     # Advanced Analytics (only for admin and agents)
     if st.session_state.user['role'] in ['admin', 'agent']:
@@ -97,50 +100,40 @@ def render_dashboard():
         # Priority Distribution
         priority_col1, priority_col2, priority_col3 = st.columns(3)
         
-        low_priority = len(df_tickets[df_tickets['priority'].str.lower() == 'low'])
-        medium_priority = len(df_tickets[df_tickets['priority'].str.lower() == 'medium'])
-        high_priority = len(df_tickets[df_tickets['priority'].str.lower() == 'high'])
-        
         with priority_col1:
-            st.metric("Low Priority", low_priority)
+            st.metric("Low Priority", overview['low_priority'])
         with priority_col2:
-            st.metric("Medium Priority", medium_priority)
+            st.metric("Medium Priority", overview['medium_priority'])
         with priority_col3:
-            st.metric("High Priority", high_priority)
+            st.metric("High Priority", overview['high_priority'])
             
         # Agent Performance Metrics
         st.markdown("---")
         st.subheader("Agent Performance")
         
-        if not df_tickets.empty and 'assignee_email' in df_tickets.columns:
+        agent_stats = stats.get_agent_performance()
+        if agent_stats:
             # Tickets per agent
-            agent_tickets = df_tickets['assignee_email'].value_counts()
-            fig_agent = px.bar(x=agent_tickets.index, y=agent_tickets.values,
+            fig_agent = px.bar(x=[a['assignee_email'] for a in agent_stats],
+                             y=[a['assigned'] for a in agent_stats],
                              title='Tickets Handled by Agent',
                              labels={'x': 'Agent', 'y': 'Number of Tickets'})
             st.plotly_chart(fig_agent, use_container_width=True)
             
             # Resolution rate per agent
-            agent_resolution = df_tickets[df_tickets['status'].str.lower() == 'closed'].groupby('assignee_email').size()
-            resolution_rate = (agent_resolution / agent_tickets * 100).round(2)
-            
             st.subheader("Agent Resolution Rates")
-            for agent, rate in resolution_rate.items():
-                if agent:  # Skip None/unassigned
-                    st.metric(f"{agent}", f"{rate}%")
+            for agent in agent_stats:
+                st.metric(f"{agent['assignee_email']}", f"{float(agent['resolution_rate'])}%")
         
         # Response Time Analysis
         st.markdown("---")
         st.subheader("Response Time Analysis")
         
         # Average resolution time by priority
-        df_closed = df_tickets[df_tickets['status'].str.lower() == 'closed'].copy()
-        if not df_closed.empty and 'created_at' in df_closed.columns and 'updated_at' in df_closed.columns:
-            df_closed['resolution_time'] = (pd.to_datetime(df_closed['updated_at']) - 
-                                         pd.to_datetime(df_closed['created_at'])).dt.total_seconds() / 3600  # in hours
-            
-            avg_resolution = df_closed.groupby('priority')['resolution_time'].mean().round(2)
-            fig_resolution = px.bar(x=avg_resolution.index, y=avg_resolution.values,
+        avg_resolution = stats.get_resolution_time_by_priority()
+        if avg_resolution:
+            fig_resolution = px.bar(x=[r['priority'] for r in avg_resolution],
+                                  y=[float(r['hours']) for r in avg_resolution],
                                   title='Average Resolution Time by Priority (Hours)',
                                   labels={'x': 'Priority', 'y': 'Hours'})
             st.plotly_chart(fig_resolution, use_container_width=True)
@@ -160,8 +153,13 @@ def render_dashboard():
     
     # Recent Tickets
     st.subheader("Recent Tickets")
+    tickets, _ = ticket_model.get_tickets_page(
+        user_id=st.session_state.user['id'],
+        user_role=st.session_state.user['role'],
+        limit=5
+    )
     if tickets:
-        for ticket in tickets[:5]:
+        for ticket in tickets:
             # Add high-priority class if applicable
             is_high_priority = ticket['priority'].lower() == 'high' and st.session_state.user['role'] in ['admin', 'agent']
             
@@ -8,7 +8,7 @@ def render_settings():
     
     st.title("System Settings")
     
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Email Settings", "File Upload Settings", "Custom Fields", "Macros", "Audit Logs"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Email Settings", "File Upload Settings", "Custom Fields", "Macros", "Audit Logs", "Diagnostics"])
     
     with tab1:
         st.subheader("Email Settings")
@@ -117,17 +117,42 @@ def render_settings():
                             
     with tab5:
         st.subheader("Audit Logs")
-        from db.database import Database
+        from models.audit_log import AuditLog
+        from models.user import User
+        
+        audit_log = AuditLog()
+        users = User().get_all_users()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            entity_type = st.selectbox("Entity Type", ["All"] + audit_log.get_entity_types(), key="audit_entity_type")
+            entity_id = st.text_input("Entity ID", key="audit_entity_id")
+        with col2:
+            user_choice = st.selectbox(
+                "User",
+                [None] + [u['id'] for u in users],
+                format_func=lambda uid: "All" if uid is None else next(u['email'] for u in users if u['id'] == uid),
+                key="audit_user"
+            )
+        with col3:
+            start_date = st.date_input("From", value=None, key="audit_start_date")
+            end_date = st.date_input("To", value=None, key="audit_end_date")
+        
+        filters = {
+            'entity_type': None if entity_type == "All" else entity_type,
+            'entity_id': int(entity_id) if entity_id.strip().isdigit() else None,
+            'user_id': user_choice,
+            'start_date': start_date,
+            'end_date': end_date,
+        }
         
-        db = Database()
-        query = """
-            SELECT al.*, u.email as user_email
-            FROM audit_logs al
-            LEFT JOIN users u ON al.user_id = u.id
-            ORDER BY al.created_at DESC
-            LIMIT 100
-        """
-        logs = db.execute(query)
+        # Keyset pagination: one cursor per page visited, reset when the filters change
+        if st.session_state.get('audit_page_key') != filters:
+            st.session_state.audit_page_key = filters
+            st.session_state.audit_page_cursors = [None]
+        audit_cursors = st.session_state.audit_page_cursors
+        
+        logs, next_cursor = audit_log.search(cursor=audit_cursors[-1], **filters)
         
         if not logs:
             st.info("No audit logs found")
@@ -141,6 +166,18 @@ def render_settings():
                         st.write(f"User: {log['user_email']}")
                     if log['details']:
                         st.json(log['details'])
+        
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+        with nav_col1:
+            if len(audit_cursors) > 1 and st.button("← Newer", key="audit_prev"):
+                audit_cursors.pop()
+                st.rerun()
+        with nav_col2:
+            st.caption(f"Page {len(audit_cursors)}")
+        with nav_col3:
+            if next_cursor and st.button("Older →", key="audit_next"):
+                audit_cursors.append(next_cursor)
+                st.rerun()
         custom_field = CustomField()
         
         # Create new custom field
@@ -312,3 +349,69 @@ def render_settings():
                                     st.error("Failed to delete field: No such field exists")
                             except Exception as e:
                                 st.error(f"Failed to delete field: {str(e)}")
+    
+    with tab6:
+        st.subheader("Reference Data Cache")
+        from utils.cache import get_cache
+        
+        cache = get_cache()
+        cache_stats = cache.stats()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Entries", f"{cache_stats['size']} / {cache_stats['maxsize']}")
+        with col2:
+            st.metric("Hits", cache_stats['hits'])
+        with col3:
+            st.metric("Misses", cache_stats['misses'])
+        with col4:
+            st.metric("Hit Rate", f"{cache_stats['hit_rate'] * 100:.1f}%")
+        st.caption(f"Evictions: {cache_stats['evictions']}")
+        
+        if st.button("Clear Cache"):
+            cache.clear()
+            st.success("Cache cleared")
+        
+        st.subheader("Database Connection Pool")
+        from db.database import Database
+        
+        pool_stats = Database().pool_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Connections", f"{pool_stats['size']} / {pool_stats['maxconn']}")
+        with col2:
+            st.metric("In Use", pool_stats['in_use'])
+        with col3:
+            st.metric("Waiting", pool_stats['waiting'])
+        with col4:
+            st.metric("Avg Acquire", f"{pool_stats['avg_acquire_ms']:.1f} ms")
+        st.caption(
+            f"Created: {pool_stats['created']} · Closed: {pool_stats['closed']} · "
+            f"Timeouts: {pool_stats['timeouts']} · Failed pings: {pool_stats['failed_pings']}"
+        )
+        st.bar_chart(pool_stats['acquire_latency'])
+        
+        st.subheader("Audit Log Buffer")
+        from utils.audit_logger import get_audit_buffer
+        
+        audit_stats = get_audit_buffer().stats()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Queued", f"{audit_stats['queued']} / {audit_stats['max_entries']}")
+        with col2:
+            st.metric("Flushed", audit_stats['flushed'])
+        with col3:
+            st.metric("Dropped", audit_stats['dropped'])
+        with col4:
+            st.metric("Avg Flush", f"{audit_stats['avg_flush_ms']:.1f} ms")
+        st.caption(
+            f"Flushes: {audit_stats['flushes']} · Failed flushes: {audit_stats['flush_failures']} · "
+            f"Rejected entries: {audit_stats['rejected']} · "
+            f"Slowest flush: {audit_stats['max_flush_ms']:.1f} ms"
+        )
+        
+        st.subheader("Query Retries")
+        retried = [q for q in Database().retry_stats() if q['retries'] or q['failures']]
+        if retried:
+            st.dataframe(retried, use_container_width=True)
+        else:
+            st.info("No retried or failed queries")
@@ -23,12 +23,6 @@ def render_tickets():
     tab1, tab2 = st.tabs(["Ticket List", "Create Ticket"])
     
     with tab1:
-        # Get tickets based on user role
-        tickets = ticket_model.get_all_tickets(
-            user_id=st.session_state.user['id'],
-            user_role=st.session_state.user['role']
-        )
-        
         # Load saved filters
         from models.saved_filter import SavedFilter
         saved_filter_model = SavedFilter()
@@ -56,7 +50,26 @@ def render_tickets():
             with col2:
                 priority_filter = st.selectbox("Priority", ["All", "Low", "Medium", "High"])
             with col3:
-                search = st.text_input("Search tickets")
+                search = st.text_input("Search tickets", help="Searches titles, descriptions and comments")
+            
+            # Custom field filters; matched through the index on tickets.custom_values
+            custom_filters = {}
+            filterable_fields = [f for f in custom_field.get_schema().order
+                                 if f['field_type'] in ('Dropdown', 'MultiSelect', 'Checkbox')]
+            if filterable_fields:
+                field_columns = st.columns(min(len(filterable_fields), 3))
+                for i, field in enumerate(filterable_fields):
+                    with field_columns[i % 3]:
+                        if field['field_type'] == 'Checkbox':
+                            choice = st.selectbox(field['field_name'], ["Any", "Yes", "No"],
+                                                  key=f"filter_custom_{field['id']}")
+                            if choice != "Any":
+                                custom_filters[str(field['id'])] = choice == "Yes"
+                        else:
+                            selected = st.multiselect(field['field_name'], options=field['field_options'] or [],
+                                                      key=f"filter_custom_{field['id']}")
+                            if selected:
+                                custom_filters[str(field['id'])] = selected
             
             # Save filter button
             save_col1, save_col2 = st.columns([3, 1])
@@ -68,7 +81,8 @@ def render_tickets():
                         filter_criteria = {
                             'status': status_filter,
                             'priority': priority_filter,
-                            'search': search
+                            'search': search,
+                            'custom_fields': custom_filters
                         }
                         try:
                             saved_filter_model.create_filter(
@@ -84,37 +98,165 @@ def render_tickets():
                     else:
                         st.error("Please enter a name for the filter")
         
-        # Apply filters
-        filtered_tickets = tickets
-        
+        # Resolve the active filter criteria
         if isinstance(selected_filter, tuple):
-            # Apply saved filter
             saved_filter = next(f for f in user_filters if f['id'] == selected_filter[0])
             filter_criteria = saved_filter['filter_criteria']
-            
-            if filter_criteria.get('status') != "All":
-                filtered_tickets = [t for t in filtered_tickets if t['status'].lower() == filter_criteria['status'].lower()]
-            if filter_criteria.get('priority') != "All":
-                filtered_tickets = [t for t in filtered_tickets if t['priority'].lower() == filter_criteria['priority'].lower()]
-            if filter_criteria.get('search'):
-                filtered_tickets = [t for t in filtered_tickets if filter_criteria['search'].lower() in t['title'].lower()]
         else:
-            # Apply manual filters
-            if status_filter != "All":
-                filtered_tickets = [t for t in filtered_tickets if t['status'].lower() == status_filter.lower()]
-            if priority_filter != "All":
-                filtered_tickets = [t for t in filtered_tickets if t['priority'].lower() == priority_filter.lower()]
-            if search:
-                filtered_tickets = [t for t in filtered_tickets if search.lower() in t['title'].lower()]
+            filter_criteria = {
+                'status': status_filter,
+                'priority': priority_filter,
+                'search': search,
+                'custom_fields': custom_filters
+            }
+        
+        active_status = filter_criteria.get('status')
+        active_priority = filter_criteria.get('priority')
+        active_search = filter_criteria.get('search') or None
+        active_custom_fields = filter_criteria.get('custom_fields') or {}
+        if active_status == "All":
+            active_status = None
+        if active_priority == "All":
+            active_priority = None
+        
+        # Restart paging whenever the filters change
+        page_key = (active_status, active_priority, active_search, repr(sorted(active_custom_fields.items())))
+        if st.session_state.get('ticket_page_key') != page_key:
+            st.session_state.ticket_page_key = page_key
+            st.session_state.ticket_page_cursors = [None]
+        page_cursors = st.session_state.ticket_page_cursors
+        
+        if active_search:
+            # Ranked full-text search over titles, descriptions and comments
+            filtered_tickets, next_cursor = ticket_model.search(
+                active_search,
+                user_id=st.session_state.user['id'],
+                user_role=st.session_state.user['role'],
+                status=active_status,
+                priority=active_priority,
+                custom_fields=active_custom_fields,
+                cursor=page_cursors[-1]
+            )
+        else:
+            filtered_tickets, next_cursor = ticket_model.get_tickets_page(
+                user_id=st.session_state.user['id'],
+                user_role=st.session_state.user['role'],
+                status=active_status,
+                priority=active_priority,
+                custom_fields=active_custom_fields,
+                cursor=page_cursors[-1]
+            )
+        
+        if not filtered_tickets:
+            st.info("No tickets found")
+        
+        # Load the details for the whole page up front
+        from components.comment_handler import CommentHandler
+        comment_handler = CommentHandler()
+        macro_model = Macro()
+        
+        page_ticket_ids = [t['id'] for t in filtered_tickets]
+        page_field_values = custom_field.get_field_values_for_tickets(page_ticket_ids)
+        page_attachments = file_handler.get_attachments_for_tickets(page_ticket_ids)
+        page_comments = ticket_model.get_comments_for_tickets(page_ticket_ids)
+        
+        agents = []
+        if filtered_tickets and st.session_state.user['role'] in ['admin', 'agent']:
+            agents = [u for u in user_model.get_all_users() if u['role'] in ['admin', 'agent']]
+        user_macros = macro_model.get_user_macros(st.session_state.user['id']) if filtered_tickets else []
+        
+        # Apply a macro or the same changes to many tickets at once
+        if filtered_tickets and st.session_state.user['role'] in ['admin', 'agent']:
+            with st.expander("Bulk Actions"):
+                scope = st.radio(
+                    "Apply to",
+                    ["Selected tickets on this page", "All tickets matching the filters"],
+                    key="bulk_scope"
+                )
+                if scope == "Selected tickets on this page":
+                    selected_ids = st.multiselect(
+                        "Tickets",
+                        page_ticket_ids,
+                        format_func=lambda tid: next(t['title'] for t in filtered_tickets if t['id'] == tid),
+                        key="bulk_ticket_ids"
+                    )
+                else:
+                    selected_ids = None
+                
+                bulk_macro = st.selectbox(
+                    "Macro",
+                    [None] + [m['id'] for m in user_macros],
+                    format_func=lambda mid: "No macro" if mid is None else next(m['name'] for m in user_macros if m['id'] == mid),
+                    key="bulk_macro"
+                )
+                macro_actions = next((m['actions'] for m in user_macros if m['id'] == bulk_macro), {})
+                
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    bulk_status = st.selectbox("Status", ["No change", "Open", "In Progress", "Closed"], key="bulk_status")
+                with col2:
+                    bulk_priority = st.selectbox("Priority", ["No change", "Low", "Medium", "High"], key="bulk_priority")
+                with col3:
+                    bulk_agent = st.selectbox(
+                        "Assign To",
+                        [None] + [a['id'] for a in agents],
+                        format_func=lambda aid: "No change" if aid is None else next(a['email'] for a in agents if a['id'] == aid),
+                        key="bulk_agent"
+                    )
+                bulk_comment = st.text_area(
+                    "Comment",
+                    value=macro_actions.get('comment', ''),
+                    help="Added to every ticket. {id}, {title}, {status} and {priority} are filled in per ticket.",
+                    key=f"bulk_comment_{bulk_macro}"
+                )
+                
+                if st.button("Apply to Tickets", key="bulk_apply"):
+                    # Explicit choices override the macro's actions
+                    changes = {
+                        'status': bulk_status if bulk_status != "No change" else macro_actions.get('status'),
+                        'priority': bulk_priority if bulk_priority != "No change" else macro_actions.get('priority'),
+                        'assigned_to': bulk_agent,
+                    }
+                    try:
+                        if selected_ids is None:
+                            # Every match, not just the first batch, in one transaction per batch
+                            updated_count = ticket_model.bulk_update_matching(
+                                changes,
+                                user_id=st.session_state.user['id'],
+                                user_role=st.session_state.user['role'],
+                                status=active_status,
+                                priority=active_priority,
+                                search=active_search,
+                                custom_fields=active_custom_fields,
+                                comment=bulk_comment
+                            )
+                        elif selected_ids:
+                            updated_count = len(ticket_model.bulk_update(
+                                selected_ids,
+                                changes,
+                                user_id=st.session_state.user['id'],
+                                comment=bulk_comment
+                            ))
+                        else:
+                            updated_count = None
+                            st.warning("No tickets selected")
+                        if updated_count is not None:
+                            st.success(f"Updated {updated_count} tickets")
+                            time.sleep(0.5)  # Brief pause to show success message
+                            st.rerun()
+                    except Exception as e:
+                        st.error(f"Bulk update failed: {str(e)}")
         
         for ticket in filtered_tickets:
             with st.expander(f"{ticket['title']} - {ticket['status'].upper()}"):
+                if ticket.get('snippet'):
+                    st.markdown(f"…{ticket['snippet']}…")
                 st.write(f"Priority: {ticket['priority']}")
                 st.write(f"Category: {ticket['category']}")
                 st.write(f"Created by: {ticket['creator_email']}")
                 
                 # Display custom field values
-                field_values = custom_field.get_ticket_field_values(ticket['id'])
+                field_values = page_field_values[ticket['id']]
                 if field_values:
                     st.subheader("Additional Information")
                     for field_value in field_values:
@@ -135,19 +277,39 @@ def render_tickets():
                             st.write(value)
                 
                 # Show attachments
-                attachments = file_handler.get_ticket_attachments(ticket['id'])
+                attachments = page_attachments[ticket['id']]
                 if attachments:
                     st.subheader("Attachments")
                     for attachment in attachments:
+                        open_key = f"attachment_open_{attachment['id']}"
                         col1, col2 = st.columns([3, 1])
                         with col1:
+                            thumbnail = file_handler.get_thumbnail(attachment)
+                            if thumbnail and not st.session_state.get(open_key):
+                                st.image(thumbnail, caption=attachment['file_name'])
+                            st.write(f"📎 {attachment['file_name']} ({file_handler.format_size(attachment['file_size'])}, Uploaded: {attachment['uploaded_at'].strftime('%Y-%m-%d %H:%M')})")
+                        with col2:
+                            if not st.session_state.get(open_key):
+                                if st.button("Open", key=f"open_{attachment['id']}"):
+                                    st.session_state[open_key] = True
+                                    st.rerun()
+                        
+                        # Only fetch the file contents once the user asks for them
+                        if st.session_state.get(open_key):
+                            content = file_handler.get_attachment_content(attachment['id'])
                             if file_handler.is_image_file(attachment['file_name']):
                                 st.image(
-                                    f"data:image/png;base64,{attachment['file_data_base64']}", 
+                                    content,
                                     caption=attachment['file_name'],
                                     use_container_width=True
                                 )
-                            st.write(f"📎 {attachment['file_name']} (Uploaded: {attachment['uploaded_at'].strftime('%Y-%m-%d %H:%M')})")
+                            st.download_button(
+                                "Download",
+                                data=content,
+                                file_name=attachment['file_name'],
+                                mime=attachment['mime_type'] or "application/octet-stream",
+                                key=f"download_{attachment['id']}"
+                            )
                     
                     # Add file upload for existing tickets
                     upload_key = f"upload_{ticket['id']}"
@@ -165,17 +327,14 @@ def render_tickets():
                             time.sleep(0.1)  # Small delay to ensure state updates
                             st.rerun()
                         else:
-                            st.error("Invalid file. Please ensure the file is under 5MB and has a valid extension (.txt, .pdf, .doc, .docx, .png, .jpg, .jpeg)")
+                            st.error(f"Invalid file. Please ensure the file is under {file_handler.max_file_size // (1024 * 1024)}MB and has a valid extension (.txt, .pdf, .doc, .docx, .png, .jpg, .jpeg)")
                         
-                # Handle comments using the CommentHandler
-                from components.comment_handler import CommentHandler
-                comment_handler = CommentHandler()
-                
                 # Show existing comments
                 comment_handler.render_comments(
                     ticket_id=ticket['id'],
                     user_id=st.session_state.user['id'],
-                    user_role=st.session_state.user['role']
+                    user_role=st.session_state.user['role'],
+                    comments=page_comments[ticket['id']]
                 )
                 
                 # Render comment form
@@ -200,7 +359,6 @@ def render_tickets():
                     )
                 with col3:
                     if st.session_state.user['role'] in ['admin', 'agent']:
-                        agents = [u for u in user_model.get_all_users() if u['role'] in ['admin', 'agent']]
                         agent_options = [(None, "Unassigned")] + [(str(a['id']), a['email']) for a in agents]
                         current_assigned = str(ticket['assigned_to']) if ticket['assigned_to'] else None
                         selected_agent = st.selectbox(
@@ -215,9 +373,6 @@ def render_tickets():
                         assigned_to = ticket['assigned_to']
                 
                 # Add macro selection before the update form
-                macro_model = Macro()
-                user_macros = macro_model.get_user_macros(st.session_state.user['id'])
-                
                 if user_macros:
                     selected_macro = st.selectbox(
                         "Apply Macro",
@@ -258,11 +413,12 @@ def render_tickets():
                             
                             # Handle notifications asynchronously
                             try:
-                                email_notifier.notify_ticket_updated(ticket, ticket['creator_email'])
+                                updated = {**ticket, 'status': new_status, 'priority': new_priority}
+                                email_notifier.notify_ticket_updated(updated, ticket['creator_email'])
                                 if assigned_to and assigned_to != ticket['assigned_to']:
                                     assigned_user = user_model.get_user_by_id(assigned_to)
                                     if assigned_user:
-                                        email_notifier.notify_ticket_assigned(ticket, assigned_user['email'])
+                                        email_notifier.notify_ticket_assigned(updated, assigned_user['email'])
                             except Exception:
                                 pass  # Ignore notification errors to prevent blocking
                             
@@ -272,6 +428,19 @@ def render_tickets():
                             st.rerun()
                         except Exception as e:
                             st.error(f"Failed to update ticket: {str(e)}")
+        
+        # Page navigation
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+        with nav_col1:
+            if len(page_cursors) > 1 and st.button("← Previous"):
+                page_cursors.pop()
+                st.rerun()
+        with nav_col2:
+            st.caption(f"Page {len(page_cursors)}")
+        with nav_col3:
+            if next_cursor and st.button("Next →"):
+                page_cursors.append(next_cursor)
+                st.rerun()
     
     with tab2:
         st.subheader("Create New Ticket")
@@ -289,40 +458,22 @@ def render_tickets():
         
         # Custom Fields
         st.subheader("Additional Information")
-        custom_fields = custom_field.get_all_fields()
-        custom_field_values = {}
+        schema = custom_field.get_schema()
+        custom_fields = schema.order
+
+        # Values and visibility carry over between reruns; a changed value
+        # only re-evaluates the fields that depend on it
+        form_state = st.session_state.get('custom_field_form')
+        if not form_state or form_state['version'] != schema.version:
+            form_state = st.session_state.custom_field_form = {
+                'version': schema.version,
+                'values': {},
+                'visible': schema.visible_fields({}),
+            }
+        custom_field_values = form_state['values']
+        visible_fields = form_state['visible']
         
         if custom_fields:
-            # First, render fields without dependencies
-            independent_fields = [f for f in custom_fields if not f.get('depends_on')]
-            dependent_fields = [f for f in custom_fields if f.get('depends_on')]
-            
-            # Helper function to check if field should be shown based on dependencies
-            def should_show_field(field):
-                if not field.get('depends_on'):
-                    return True
-                    
-                depends_on = field['depends_on']
-                if not depends_on:
-                    return True
-                    
-                parent_field_id = depends_on.get('field_id')
-                if not parent_field_id:
-                    return True
-                    
-                parent_value = custom_field_values.get(parent_field_id)
-                if parent_value is None:
-                    return False
-                    
-                if 'value' in depends_on:  # Checkbox dependency
-                    expected_value = str(depends_on['value']).lower() == 'true'
-                    actual_value = str(parent_value).lower() == 'true'
-                    return expected_value == actual_value
-                elif 'values' in depends_on:  # Dropdown/MultiSelect dependency
-                    parent_values = parent_value.split(',') if isinstance(parent_value, str) else [parent_value]
-                    return any(str(v) in map(str, depends_on['values']) for v in parent_values)
-                return True
-            
             # Helper function to render a single field
             def render_field(field):
                 field_id = field['id']
@@ -339,15 +490,8 @@ def render_tickets():
                         key=f"custom_{field_id}"
                     )
                     # Validate text input
-                    if value and validation:
-                        if 'min_length' in validation and len(value) < validation['min_length']:
-                            st.error(f"Minimum length is {validation['min_length']} characters")
-                        if 'max_length' in validation and len(value) > validation['max_length']:
-                            st.error(f"Maximum length is {validation['max_length']} characters")
-                        if 'pattern' in validation:
-                            import re
-                            if not re.match(validation['pattern'], value):
-                                st.error("Input format is invalid")
+                    for error in schema.check(field_id, value):
+                        st.error(error)
                 
                 elif field['field_type'] == 'Number':
                     min_val = validation.get('min_value', None)
@@ -392,14 +536,16 @@ def render_tickets():
                 
                 return value
             
-            # Render independent fields first
-            for field in independent_fields:
-                custom_field_values[field['id']] = render_field(field)
-            
-            # Then render dependent fields if their conditions are met
-            for field in dependent_fields:
-                if should_show_field(field):
-                    custom_field_values[field['id']] = render_field(field)
+            # Fields come in dependency order, so a parent is always rendered
+            # (and its dependents re-evaluated) before the fields below it
+            for field in custom_fields:
+                if field['id'] not in visible_fields:
+                    continue
+                value = render_field(field)
+                if value != custom_field_values.get(field['id']):
+                    custom_field_values[field['id']] = value
+                    for hidden_id in schema.update_visibility(visible_fields, custom_field_values, field['id']):
+                        custom_field_values.pop(hidden_id, None)
         
         # Allow admin/agents to assign tickets to users during creation
         assigned_to = None
@@ -429,80 +575,69 @@ def render_tickets():
                 validation_failed = True
             
             # Custom fields validation
-            if custom_fields:
-                for field in custom_fields:
-                    field_id = field['id']
-                    value = custom_field_values.get(field_id)
-                    
-                    if field['is_required']:
-                        if value is None or (isinstance(value, str) and not value.strip()):
-                            st.error(f"{field['field_name']} is required")
-                            validation_failed = True
-                        elif isinstance(value, list) and not value:
-                            st.error(f"Please select at least one option for {field['field_name']}")
-                            validation_failed = True
+            for field, error in schema.validate(custom_field_values, visible_fields):
+                st.error(error)
+                validation_failed = True
             
             if not validation_failed:
                 try:
                     # Set creating flag to prevent multiple submissions
                     st.session_state.creating_ticket = True
                     
-                    new_ticket = ticket_model.create_ticket(
-                        title=title,
-                        description=description,
-                        status="Open",
-                        priority=priority,
-                        category=category,
-                        created_by=st.session_state.user['id'],
-                        assigned_to=assigned_to
-                    )
-                    
-                    # Add initial comment with the description
-                    if description:
-                        try:
-                            comment_result = ticket_model.add_comment(
+                    # Ticket, first comment, field values and attachment are
+                    # written in one transaction, so a failure leaves nothing behind
+                    with ticket_model.db.transaction():
+                        new_ticket = ticket_model.create_ticket(
+                            title=title,
+                            description=description,
+                            status="Open",
+                            priority=priority,
+                            category=category,
+                            created_by=st.session_state.user['id'],
+                            assigned_to=assigned_to
+                        )
+
+                        # Add initial comment with the description
+                        if description:
+                            ticket_model.add_comment(
                                 ticket_id=new_ticket[0]['id'],
                                 user_id=st.session_state.user['id'],
                                 content=description,
                                 is_private=False
                             )
-                            if not comment_result:
-                                st.warning("Initial comment was not saved properly")
-                        except Exception as e:
-                            st.error(f"Error saving initial comment: {str(e)}")
-                    
-                    # Save custom field values
-                    for field in custom_fields:
-                        field_id = field['id']
-                        value = custom_field_values.get(field_id)
-                        
-                        # Only save fields that should be visible based on dependencies
-                        if should_show_field(field):
-                            if isinstance(value, (list, set)):
-                                value = ','.join(map(str, value))
-                            elif not isinstance(value, (str, int, float)):
-                                value = str(value)
-                            if value is not None:  # Only save non-None values
-                                custom_field.save_field_value(new_ticket[0]['id'], field_id, value)
-                    
-                    if uploaded_file:
-                        file_handler.save_file(new_ticket[0]['id'], uploaded_file)
-                    
-                    # Notify admin
-                    admins = [u for u in user_model.get_all_users() if u['role'] == 'admin']
-                    if admins:
-                        try:
-                            email_notifier.notify_ticket_created(
-                                {'title': title, 'priority': priority, 'description': description},
-                                admins[0]['email']
-                            )
-                        except Exception as e:
-                            st.warning(f"Ticket created but notification failed: {str(e)}")
+
+                        # Save custom field values
+                        field_values = {}
+                        for field in custom_fields:
+                            field_id = field['id']
+                            value = custom_field_values.get(field_id)
+    
+                            # Only save fields that should be visible based on dependencies
+                            if field_id in visible_fields:
+                                if isinstance(value, (list, set)):
+                                    value = ','.join(map(str, value))
+                                elif not isinstance(value, (str, int, float)):
+                                    value = str(value)
+                                if value is not None:  # Only save non-None values
+                                    field_values[field_id] = value
+                        custom_field.save_field_values(new_ticket[0]['id'], field_values)
+
+                        if uploaded_file:
+                            file_handler.save_file(new_ticket[0]['id'], uploaded_file)
+
+                        # Notify admins; the emails are queued with the ticket and sent in the background
+                        admins = [u['email'] for u in user_model.get_all_users() if u['role'] == 'admin']
+                        email_notifier.notify_ticket_created(
+                            {'id': new_ticket[0]['id'], 'title': title, 'status': "Open",
+                             'priority': priority, 'description': description},
+                            admins
+                        )
                     
                     # Clear the form
                     st.session_state.title = ""
                     st.session_state.description = ""
                     st.session_state.uploaded_file = None
+                    st.session_state.pop('custom_field_form', None)
                     
                     st.success(f"Ticket '{title}' created successfully with {priority} priority")
                     time.sleep(0.5)  # Brief pause to show success message
@@ -0,0 +1,126 @@
+"""
+Maintenance commands for the attachment blob store.
+
+Usage:
+    python -m scripts.attachment_blobs migrate [--batch-size N]
+    python -m scripts.attachment_blobs gc [--limit N]
+    python -m scripts.attachment_blobs process [--batch-size N]
+
+``migrate`` moves file_data still stored inline in the attachments table
+into the blob store, a batch at a time. Only run one migration at a time.
+``gc`` removes blobs that are no longer referenced by any attachment.
+``process`` runs MIME sniffing and thumbnailing for attachments that have
+not been processed yet, e.g. after ``migrate``.
+"""
+import io
+import argparse
+import time
+from components.file_handler import FileHandler
+from components.attachment_processor import AttachmentProcessor
+
+
+def migrate(file_handler, batch_size):
+    db = file_handler.db
+    select_query = """
+        SELECT id, file_data
+        FROM attachments
+        WHERE blob_sha256 IS NULL AND file_data IS NOT NULL AND id > %s
+        ORDER BY id
+        LIMIT %s
+    """
+    # Only an attachment that still needs it takes a reference on the blob
+    update_query = """
+        WITH target AS (
+            SELECT id FROM attachments
+            WHERE id = %(id)s AND blob_sha256 IS NULL
+            FOR UPDATE
+        ), blob AS (
+            INSERT INTO attachment_blobs (sha256, size, ref_count)
+            SELECT %(sha256)s, %(size)s, 1 FROM target
+            ON CONFLICT (sha256) DO UPDATE
+            SET ref_count = attachment_blobs.ref_count + 1, released_at = NULL
+            RETURNING sha256
+        )
+        UPDATE attachments
+        SET blob_sha256 = blob.sha256, file_data = NULL, file_size = %(size)s
+        FROM blob, target
+        WHERE attachments.id = target.id
+        RETURNING attachments.id
+    """
+
+    last_id = 0
+    migrated = 0
+    started = time.time()
+    while True:
+        rows = db.query(select_query, (last_id, batch_size))
+        if not rows:
+            break
+        for row in rows:
+            data = bytes(row['file_data'])
+            sha256, size, staged = file_handler.blob_store.stage_stream(io.BytesIO(data))
+            # Published once the attachment references it, as in FileHandler.save_file
+            try:
+                with db.transaction():
+                    updated = db.execute(update_query, {'id': row['id'], 'sha256': sha256, 'size': size})
+                    if updated:
+                        file_handler.blob_store.commit(staged, sha256)
+            except Exception:
+                file_handler.blob_store.discard(staged)
+                raise
+            if not updated:
+                file_handler.blob_store.discard(staged)
+            last_id = row['id']
+            migrated += 1
+        print(f"Migrated {migrated} attachments (last id {last_id}, {time.time() - started:.1f}s)")
+
+    print(f"Done: {migrated} attachments moved to the blob store")
+
+
+def collect_garbage(file_handler, limit):
+    total = 0
+    while True:
+        removed = file_handler.collect_garbage(limit=limit)
+        total += removed
+        if removed < limit:
+            break
+    print(f"Removed {total} unreferenced blobs")
+
+
+def process_pending(file_handler, batch_size):
+    processor = AttachmentProcessor(file_handler.blob_store)
+    total = 0
+    while True:
+        submitted = processor.process_pending(limit=batch_size)
+        total += submitted
+        if submitted < batch_size:
+            break
+        print(f"Processed {total} attachments")
+    print(f"Done: processed {total} attachments")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attachment blob store maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help="Move inline attachment data into the blob store")
+    migrate_parser.add_argument('--batch-size', type=int, default=20)
+
+    gc_parser = subparsers.add_parser('gc', help="Remove unreferenced blobs")
+    gc_parser.add_argument('--limit', type=int, default=500)
+
+    process_parser = subparsers.add_parser('process', help="Generate thumbnails for unprocessed attachments")
+    process_parser.add_argument('--batch-size', type=int, default=100)
+
+    args = parser.parse_args()
+    file_handler = FileHandler()
+
+    if args.command == 'migrate':
+        migrate(file_handler, args.batch_size)
+    elif args.command == 'gc':
+        collect_garbage(file_handler, args.limit)
+    elif args.command == 'process':
+        process_pending(file_handler, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Maintenance commands for the partitioned audit log.
+
+Usage:
+    python -m scripts.audit_logs partitions [--months-ahead N]
+    python -m scripts.audit_logs retain --months N [--drop]
+
+``partitions`` creates the monthly partitions for the current month and
+the next N months; run it at least monthly, e.g. from cron. ``retain``
+detaches (and with --drop, drops) the partitions of every month that ended
+more than N months ago.
+"""
+import argparse
+from datetime import date
+from models.audit_log import AuditLog, month_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit log maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    partitions_parser = subparsers.add_parser('partitions', help="Create upcoming monthly partitions")
+    partitions_parser.add_argument('--months-ahead', type=int, default=3)
+
+    retain_parser = subparsers.add_parser('retain', help="Detach partitions older than the retention period")
+    retain_parser.add_argument('--months', type=int, required=True)
+    retain_parser.add_argument('--drop', action='store_true', help="Drop detached partitions instead of keeping them")
+
+    args = parser.parse_args()
+    audit_log = AuditLog()
+
+    if args.command == 'partitions':
+        for name in audit_log.create_partitions(months_ahead=args.months_ahead):
+            print(f"Partition ready: {name}")
+    elif args.command == 'retain':
+        cutoff = month_start(date.today(), -args.months)
+        detached = audit_log.detach_partitions_before(cutoff, drop=args.drop)
+        action = "Dropped" if args.drop else "Detached"
+        for name in detached:
+            print(f"{action} {name}")
+        print(f"Done: {len(detached)} partitions before {cutoff} removed")
+
+
+if __name__ == "__main__":
+    main()
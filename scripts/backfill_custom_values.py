@@ -0,0 +1,38 @@
+"""
+Fill tickets.custom_values from ticket_custom_fields.
+
+Usage:
+    python -m scripts.backfill_custom_values [--batch-size N] [--start-after ID]
+
+Run once after migration 0011 adds the column; afterwards CustomField keeps
+it in sync. Each batch is its own short transaction, so the ticket table is
+never locked for long. To resume an interrupted run, pass the last ticket
+id it reported as --start-after.
+"""
+import time
+import argparse
+from models.custom_field import CustomField
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill tickets.custom_values")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--start-after', type=int, default=0, help="Ticket id to resume after")
+    args = parser.parse_args()
+
+    custom_field = CustomField()
+    started = time.time()
+    last_id, total = args.start_after, 0
+    while True:
+        batch_last_id, rows = custom_field.backfill_custom_values(last_id, args.batch_size)
+        if not rows:
+            break
+        last_id = batch_last_id
+        total += rows
+        elapsed = time.time() - started
+        print(f"{total} tickets updated, up to id {last_id} ({total / elapsed if elapsed else 0:.0f} rows/s)")
+    print(f"Done: {total} tickets backfilled in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Fill tickets.search_vector for tickets that have none.
+
+Usage:
+    python -m scripts.backfill_search_vectors [--batch-size N] [--start-after ID]
+
+Run once after migration 0004 adds the column; afterwards triggers keep it
+in sync. Each batch is its own short transaction, so the ticket table is
+never locked for long. To resume an interrupted run, pass the last ticket
+id it reported as --start-after, or just rerun it: filled tickets are
+skipped.
+"""
+import time
+import argparse
+from models.ticket import Ticket
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill tickets.search_vector")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--start-after', type=int, default=0, help="Ticket id to resume after")
+    args = parser.parse_args()
+
+    ticket_model = Ticket()
+    started = time.time()
+    last_id, total = args.start_after, 0
+    while True:
+        batch_last_id, rows = ticket_model.backfill_search_vectors(last_id, args.batch_size)
+        if not rows:
+            break
+        last_id = batch_last_id
+        total += rows
+        elapsed = time.time() - started
+        print(f"{total} tickets updated, up to id {last_id} ({total / elapsed if elapsed else 0:.0f} rows/s)")
+    print(f"Done: {total} tickets backfilled in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
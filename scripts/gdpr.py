@@ -0,0 +1,73 @@
+"""
+Data subject requests.
+
+Usage:
+    python -m scripts.gdpr export USER OUTPUT
+    python -m scripts.gdpr erase USER [--batch-size N] [--duty-cycle F]
+
+USER is a user id or email address. ``export`` writes a ZIP bundle with
+everything stored about the user (see GDPRCompliance.export_user_data);
+pass ``-`` as OUTPUT to write it to standard output. ``erase`` deletes or
+anonymizes the user's data in small batches (see GDPRCompliance.erase_user);
+rerun it to resume an interrupted job.
+"""
+import sys
+import time
+import argparse
+from db.database import Database
+from utils.gdpr import GDPRCompliance
+
+
+def resolve_user(value):
+    """Return the id of the user given by id or email, including users with an erasure job"""
+    if value.isdigit():
+        return int(value)
+    # Erasure jobs only keep a hash of the address
+    result = Database().query("""
+        SELECT id FROM users WHERE LOWER(email) = LOWER(%s)
+        UNION
+        SELECT user_id FROM gdpr_erasure_jobs WHERE email_sha256 = %s
+    """, (value, GDPRCompliance.email_hash(value)))
+    if not result:
+        raise SystemExit(f"No such user: {value}")
+    return result[0]['id']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GDPR data subject requests")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Export all data stored about a user")
+    export_parser.add_argument('user', help="User id or email")
+    export_parser.add_argument('output', help="ZIP file to write, or - for standard output")
+
+    erase_parser = subparsers.add_parser('erase', help="Delete or anonymize all data stored about a user")
+    erase_parser.add_argument('user', help="User id or email")
+    erase_parser.add_argument('--batch-size', type=int, default=500)
+    erase_parser.add_argument('--duty-cycle', type=float,
+                              help="Fraction of the time spent running batches (default: GDPR_ERASURE_DUTY_CYCLE or 0.5)")
+
+    args = parser.parse_args()
+    gdpr = GDPRCompliance()
+    user_id = resolve_user(args.user)
+
+    if args.command == 'export':
+        started = time.time()
+        if args.output == '-':
+            counts = gdpr.export_user_data(user_id, sys.stdout.buffer)
+        else:
+            with open(args.output, 'wb') as f:
+                counts = gdpr.export_user_data(user_id, f)
+        for name, count in counts.items():
+            print(f"{name}: {count}", file=sys.stderr)
+        print(f"Exported user {user_id} in {time.time() - started:.1f}s", file=sys.stderr)
+    elif args.command == 'erase':
+        started = time.time()
+        counts = gdpr.erase_user(user_id, batch_size=args.batch_size, duty_cycle=args.duty_cycle)
+        for name, count in counts.items():
+            print(f"{name}: {count}")
+        print(f"Erased user {user_id} in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
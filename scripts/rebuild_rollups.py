@@ -0,0 +1,22 @@
+"""
+Rebuild the dashboard's daily ticket rollups from the tickets table.
+
+Usage:
+    python -m scripts.rebuild_rollups
+
+The rollups are kept current by a trigger on tickets; this is only needed
+after restoring data, bulk changes with triggers disabled, or to repair
+drift. Ticket writes are blocked while the rebuild runs.
+"""
+import time
+from models.dashboard_stats import DashboardStats
+
+
+def main():
+    started = time.time()
+    DashboardStats().rebuild_rollups()
+    print(f"Rebuilt ticket_daily_rollups in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
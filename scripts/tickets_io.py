@@ -0,0 +1,207 @@
+"""
+Bulk import and export of tickets with their custom field values and comments.
+
+Usage:
+    python -m scripts.tickets_io import FILE [--format csv|jsonl] [--batch-size N] [--resume]
+    python -m scripts.tickets_io export FILE [--format csv|jsonl] [--batch-size N] [--resume]
+
+Both formats have one ticket per line with the columns of
+``models.ticket.IMPORT_COLUMNS``. Users are referred to by email. In CSV,
+each custom field is a ``cf:<field name>`` column and comments are not
+included; in JSONL, ``custom_fields`` is an object of field name to value
+and ``comments`` a list of objects with author_email, content, is_private
+and created_at.
+
+Imports are committed one batch at a time. The line number of the last
+committed batch is kept in ``FILE.import-checkpoint``, and ``--resume``
+continues after it. Exports stream from a server-side cursor; ``--resume``
+appends to an existing output file after the last ticket id it contains.
+"""
+import io
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+from contextlib import closing
+from itertools import islice
+from models.ticket import Ticket, IMPORT_COLUMNS
+
+CUSTOM_FIELD_PREFIX = 'cf:'
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(f, fmt):
+    """Yield import rows from an open file"""
+    if fmt == 'jsonl':
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+        return
+    for record in csv.DictReader(f):
+        row = {'custom_fields': {}}
+        for key, value in record.items():
+            value = value if value != '' else None
+            if key.startswith(CUSTOM_FIELD_PREFIX):
+                if value is not None:
+                    row['custom_fields'][key[len(CUSTOM_FIELD_PREFIX):]] = value
+            else:
+                row[key] = value
+        yield row
+
+
+def import_file(path, fmt, batch_size, resume):
+    ticket_model = Ticket()
+    checkpoint_path = f"{path}.import-checkpoint"
+    skip = 0
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            skip = int(f.read().strip() or 0)
+        print(f"Resuming after row {skip}")
+
+    totals = {'tickets': 0, 'field_values': 0, 'comments': 0, 'unresolved_users': 0, 'unknown_fields': 0}
+    done = skip
+    started = time.time()
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = islice(read_rows(f, fmt), skip, None)
+        while True:
+            batch = [{column: row.get(column) for column in IMPORT_COLUMNS} for row in islice(rows, batch_size)]
+            if not batch:
+                break
+            try:
+                stats = ticket_model.import_rows(batch, first_row=done + 1)
+            except ValueError as e:
+                raise SystemExit(f"{e}\nNothing was imported from rows {done + 1}-{done + len(batch)}; "
+                                 f"fix them and rerun with --resume")
+            for key, value in stats.items():
+                totals[key] += value
+            done += len(batch)
+            with open(checkpoint_path, 'w') as checkpoint:
+                checkpoint.write(str(done))
+            elapsed = time.time() - started
+            print(f"{done} rows imported ({totals['tickets'] / elapsed if elapsed else 0:.0f} rows/s)")
+
+    elapsed = time.time() - started
+    print(f"Done: {totals['tickets']} tickets, {totals['field_values']} custom field values and "
+          f"{totals['comments']} comments in {elapsed:.1f}s "
+          f"({totals['tickets'] / elapsed if elapsed else 0:.0f} rows/s)")
+    if totals['unresolved_users'] or totals['unknown_fields']:
+        print(f"Warning: {totals['unresolved_users']} user emails and "
+              f"{totals['unknown_fields']} custom field values could not be matched")
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+def last_exported_id(path, fmt):
+    """
+    Id of the last complete ticket in an existing export, or 0
+
+    An interrupted export can leave a partly written last ticket behind; it
+    is cut off here so that the resumed export appends after the last
+    complete one. A record is complete when it ends with a newline outside
+    of quotes and parses.
+    """
+    if not os.path.exists(path):
+        return 0
+    last_id, end, offset = 0, 0, 0
+    header, pending = None, b''
+    with open(path, 'rb') as f:
+        for line in f:
+            offset += len(line)
+            pending += line
+            # CSV fields may span lines; a doubled quote is an escaped quote
+            if not line.endswith(b'\n') or (fmt == 'csv' and pending.count(b'"') % 2):
+                continue
+            record, pending = pending.decode('utf-8'), b''
+            if not record.strip():
+                end = offset
+                continue
+            try:
+                if fmt == 'jsonl':
+                    last_id = int(json.loads(record)['id'])
+                elif header is None:
+                    header = next(csv.reader(io.StringIO(record)))
+                else:
+                    last_id = int(dict(zip(header, next(csv.reader(io.StringIO(record)))))['id'])
+            except (ValueError, KeyError, TypeError, StopIteration, csv.Error):
+                # Only the last record can be partly written
+                if f.read().strip():
+                    raise SystemExit(f"{path}: the record at byte {end} is not valid")
+                break
+            end = offset
+    if end < offset:
+        print(f"Cutting off an incomplete last record at byte {end}")
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+    return last_id
+
+
+def export_file(path, fmt, batch_size, resume):
+    ticket_model = Ticket()
+    after_id = last_exported_id(path, fmt) if resume else 0
+    if after_id:
+        print(f"Resuming after ticket {after_id}")
+    field_names = None
+    if fmt == 'csv':
+        fields = ticket_model.db.query("SELECT field_name FROM custom_fields ORDER BY field_name") or []
+        field_names = [row['field_name'] for row in fields]
+
+    exported = 0
+    started = time.time()
+    with open(path, 'a' if after_id else 'w', newline='', encoding='utf-8') as f:
+        writer = None
+        if fmt == 'csv':
+            columns = ['id'] + [c for c in IMPORT_COLUMNS if c not in ('custom_fields', 'comments')]
+            writer = csv.DictWriter(f, columns + [CUSTOM_FIELD_PREFIX + name for name in field_names],
+                                    extrasaction='ignore')
+            if not after_id:
+                writer.writeheader()
+
+        with closing(ticket_model.stream_export(after_id=after_id, batch_size=batch_size)) as tickets:
+            for ticket in tickets:
+                if writer:
+                    row = {key: value for key, value in ticket.items() if key not in ('custom_fields', 'comments')}
+                    for name, value in (ticket['custom_fields'] or {}).items():
+                        row[CUSTOM_FIELD_PREFIX + name] = value
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(ticket, default=str) + "\n")
+                exported += 1
+                if exported % batch_size == 0:
+                    elapsed = time.time() - started
+                    print(f"{exported} rows exported ({exported / elapsed if elapsed else 0:.0f} rows/s)")
+
+    elapsed = time.time() - started
+    print(f"Done: {exported} tickets exported in {elapsed:.1f}s "
+          f"({exported / elapsed if elapsed else 0:.0f} rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk ticket import and export")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in [('import', "Import tickets from a file"), ('export', "Export tickets to a file")]:
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument('file')
+        command_parser.add_argument('--format', choices=['csv', 'jsonl'],
+                                    help="Defaults to csv for .csv files, jsonl otherwise")
+        command_parser.add_argument('--batch-size', type=int, default=1000)
+        command_parser.add_argument('--resume', action='store_true', help="Continue an interrupted run")
+    args = parser.parse_args()
+
+    fmt = detect_format(args.file, args.format)
+    if args.command == 'import':
+        import_file(args.file, fmt, args.batch_size, args.resume)
+    else:
+        if fmt == 'csv':
+            print("Note: comments are only exported in the jsonl format", file=sys.stderr)
+        export_file(args.file, fmt, args.batch_size, args.resume)
+
+
+if __name__ == "__main__":
+    main()
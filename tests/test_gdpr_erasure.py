@@ -0,0 +1,78 @@
+"""
+Erasure jobs against a real database.
+
+Needs a PostgreSQL database in DATABASE_URL; the migrations are applied
+first. Skipped when there is none.
+"""
+import os
+import uuid
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('streamlit')
+if not os.environ.get('DATABASE_URL'):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from db.database import Database
+from db.migrate import upgrade
+from utils.gdpr import GDPRCompliance
+
+
+@pytest.fixture(scope='module')
+def db():
+    database = Database()
+    upgrade(database)
+    return database
+
+
+def create_user(db, role='customer'):
+    email = f"gdpr-test-{uuid.uuid4().hex}@example.com"
+    return db.execute(
+        "INSERT INTO users (email, password_hash, role) VALUES (%s, 'x', %s) RETURNING id",
+        (email, role)
+    )[0]['id']
+
+
+def create_attachment(db, ticket_id, sha256):
+    db.execute("""
+        WITH blob AS (
+            INSERT INTO attachment_blobs (sha256, size, ref_count)
+            VALUES (%s, 1, 1)
+            ON CONFLICT (sha256) DO UPDATE SET ref_count = attachment_blobs.ref_count + 1
+            RETURNING sha256
+        )
+        INSERT INTO attachments (ticket_id, file_name, blob_sha256, file_size, mime_type)
+        SELECT %s, 'late.txt', sha256, 1, 'text/plain' FROM blob
+    """, (sha256, ticket_id))
+
+
+def test_attachment_added_after_attachment_step_is_erased_with_ticket(db):
+    subject = create_user(db)
+    agent = create_user(db, role='agent')
+    ticket_id = db.execute("""
+        INSERT INTO tickets (title, description, status, priority, created_by)
+        VALUES ('Erase me', 'Description', 'Open', 'Medium', %s) RETURNING id
+    """, (subject,))[0]['id']
+    sha256 = uuid.uuid4().hex + uuid.uuid4().hex
+
+    gdpr = GDPRCompliance()
+    gdpr.db.execute("""
+        INSERT INTO gdpr_erasure_jobs (user_id, email, email_sha256, step)
+        SELECT id, email, encode(sha256(convert_to(LOWER(email), 'UTF8')), 'hex'), 'block_account'
+        FROM users WHERE id = %s
+    """, (subject,))
+    # Run the job up to, but not including, the tickets step
+    while db.query("SELECT step FROM gdpr_erasure_jobs WHERE user_id = %s", (subject,))[0]['step'] != 'tickets':
+        gdpr._erase_batch(subject, batch_size=100)
+
+    # Another user attaches a file to the subject's ticket in between
+    create_attachment(db, ticket_id, sha256)
+
+    gdpr.erase_user(subject, requested_by=agent, duty_cycle=1.0)
+
+    assert not db.query("SELECT 1 FROM tickets WHERE id = %s", (ticket_id,))
+    assert not db.query("SELECT 1 FROM attachments WHERE ticket_id = %s", (ticket_id,))
+    blob = db.query("SELECT ref_count, released_at FROM attachment_blobs WHERE sha256 = %s", (sha256,))[0]
+    assert blob['ref_count'] == 0
+    assert blob['released_at'] is not None
+    assert db.query("SELECT completed_at FROM gdpr_erasure_jobs WHERE user_id = %s", (subject,))[0]['completed_at']
@@ -1,27 +1,255 @@
 from db.database import Database
-import json
+from db.pool import PoolTimeout
+from db.retry import RetryPolicy
+from models.audit_log import ensure_partitions
+from psycopg2.extras import Json
+from collections import deque
+import os
+import time
+import atexit
+import threading
+from datetime import datetime
+
+INSERT_QUERY = """
+    INSERT INTO audit_logs (operation, entity_type, entity_id, user_id, details, created_at)
+    VALUES %s
+"""
+
+
+def is_transient(error):
+    """Whether a failed insert may succeed if simply tried again later"""
+    return (isinstance(error, PoolTimeout) or RetryPolicy.is_connection_error(error)
+            or RetryPolicy.is_rollback_error(error))
+
+
+class AuditBuffer:
+    """
+    In-memory queue of audit entries, written in batches by a background thread.
+
+    The thread flushes once ``batch_size`` entries are queued or every
+    ``flush_interval`` seconds, whichever comes first, so audited actions
+    no longer pay for an INSERT and a commit of their own. At most
+    ``max_entries`` are held; beyond that new entries are dropped and
+    counted. A flush that fails for a transient reason (lost connection,
+    pool exhausted, deadlock) keeps its batch for the next one. Any other
+    error is specific to some rows, e.g. a user_id whose user was deleted,
+    so the batch is retried row by row and the rows that still fail are
+    dropped and counted as rejected, rather than blocking every later entry.
+    Entries still queued at interpreter exit are flushed by an atexit hook.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_entries=10000):
+        self.db = Database()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._entries = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._thread = None
+        self._counters = {'enqueued': 0, 'flushed': 0, 'dropped': 0, 'rejected': 0,
+                          'flushes': 0, 'flush_failures': 0}
+        self._flush_total = 0.0
+        self._flush_max = 0.0
+
+    def add(self, rows):
+        """
+        Queue rows for the next flush
+
+        Returns:
+            bool: False if the buffer was full and the rows were dropped
+        """
+        with self._cond:
+            if len(self._entries) + len(rows) > self.max_entries:
+                self._counters['dropped'] += len(rows)
+                return False
+            self._entries.extend(rows)
+            self._counters['enqueued'] += len(rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-log-flusher", daemon=True)
+                self._thread.start()
+            if len(self._entries) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def flush(self):
+        """Write everything queued so far; returns the number of entries written"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = [self._entries[i] for i in range(min(self.batch_size, len(self._entries)))]
+                if not batch:
+                    return written
+                started = time.monotonic()
+                try:
+                    self.db.execute_many(INSERT_QUERY, batch, page_size=self.batch_size)
+                    done, rejected = len(batch), 0
+                except Exception as e:
+                    if is_transient(e):
+                        with self._cond:
+                            self._counters['flush_failures'] += 1
+                        print(f"Failed to flush audit log entries: {str(e)}")
+                        return written
+                    done, rejected = self._flush_rows(batch)
+                elapsed = time.monotonic() - started
+                with self._cond:
+                    # Only this method removes entries, so the batch is still at the front
+                    for _ in range(done):
+                        self._entries.popleft()
+                    self._counters['flushed'] += done - rejected
+                    self._counters['rejected'] += rejected
+                    self._counters['flushes'] += 1
+                    self._flush_total += elapsed
+                    self._flush_max = max(self._flush_max, elapsed)
+                    if done < len(batch):
+                        self._counters['flush_failures'] += 1
+                written += done - rejected
+                if done < len(batch):
+                    return written
+
+    def _flush_rows(self, batch):
+        """
+        Insert a batch one row at a time after it failed as a whole
+
+        Returns:
+            tuple: (rows handled from the front of the batch, rows rejected);
+            stops early at a transient error so the rest stays queued
+        """
+        rejected = 0
+        for done, row in enumerate(batch):
+            try:
+                self.db.execute_many(INSERT_QUERY, [row])
+            except Exception as e:
+                if is_transient(e):
+                    print(f"Failed to flush audit log entries: {str(e)}")
+                    return done, rejected
+                rejected += 1
+                print(f"Dropping audit log entry {row[:4]}: {str(e)}")
+        return len(batch), rejected
+
+    def stats(self):
+        with self._cond:
+            flushes = self._counters['flushes']
+            return {
+                'queued': len(self._entries),
+                'max_entries': self.max_entries,
+                **self._counters,
+                'avg_flush_ms': (self._flush_total / flushes * 1000) if flushes else 0.0,
+                'max_flush_ms': self._flush_max * 1000,
+            }
+
+    def _run(self):
+        failed = False
+        while True:
+            with self._cond:
+                # After a failure always wait, so a full buffer does not spin against the database
+                if failed or len(self._entries) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                failures = self._counters['flush_failures']
+            ensure_partitions()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Audit log flusher error: {str(e)}")
+            with self._cond:
+                failed = self._counters['flush_failures'] != failures
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_audit_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AuditBuffer(
+                    batch_size=int(os.environ.get('AUDIT_BATCH_SIZE', 500)),
+                    flush_interval=float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0)),
+                    max_entries=int(os.environ.get('AUDIT_BUFFER_SIZE', 10000))
+                )
+                atexit.register(_buffer.flush)
+    return _buffer
+
 
 class AuditLogger:
-    def __init__(self):
+    """
+    Records audited actions in the audit_logs table.
+
+    In 'async' mode (the default, AUDIT_LOG_MODE) entries go to the shared
+    AuditBuffer once the surrounding transaction commits, so rolled-back
+    changes are never audited. In 'sync' mode, or for a call with
+    durable=True, entries are written in the caller's transaction right
+    before it commits, in one insert, so the change and its audit record
+    commit together.
+    """
+
+    def __init__(self, mode=None):
         self.db = Database()
-    
-    def log_action(self, operation, entity_type, entity_id, user_id, details=None):
+        self.mode = mode or os.environ.get('AUDIT_LOG_MODE', 'async')
+
+    def log_action(self, operation, entity_type, entity_id, user_id, details=None, durable=False):
         """
         Log an action in the audit_logs table
-        
+
         Args:
             operation (str): The type of operation (create, update, delete)
             entity_type (str): The type of entity (field, ticket)
             entity_id (int): The ID of the entity
             user_id (int): The ID of the user performing the action
             details (dict, optional): Additional details about the change
+            durable (bool): Write the entry before returning or committing
+        """
+        self.log_actions([{
+            'operation': operation,
+            'entity_type': entity_type,
+            'entity_id': entity_id,
+            'user_id': user_id,
+            'details': details,
+        }], durable=durable)
+
+    def log_actions(self, entries, durable=False):
         """
-        query = """
-            INSERT INTO audit_logs (operation, entity_type, entity_id, user_id, details)
-            VALUES (%s, %s, %s, %s, %s)
+        Log several actions at once
+
+        Args:
+            entries (list): Dicts with the keyword arguments of log_action
+            durable (bool): Write the entries before returning or committing
         """
-        try:
-            details_json = json.dumps(details) if details else None
-            self.db.execute(query, (operation, entity_type, entity_id, user_id, details_json))
-        except Exception as e:
-            print(f"Failed to log action: {str(e)}")
+        # Timestamped now rather than when a buffered entry reaches the table
+        now = datetime.now()
+        rows = [
+            (e['operation'], e['entity_type'], e['entity_id'], e['user_id'],
+             Json(e['details']) if e.get('details') else None, now)
+            for e in entries
+        ]
+        if not rows:
+            return
+
+        if not durable and self.mode != 'sync':
+            buffer = get_audit_buffer()
+            self.db.after_commit(lambda: buffer.add(rows))
+            return
+
+        state = self.db.transaction_state()
+        if state is None:
+            try:
+                self.db.execute_many(INSERT_QUERY, rows)
+            except Exception as e:
+                if durable:
+                    raise
+                print(f"Failed to log action: {str(e)}")
+            return
+
+        # Collect the transaction's entries and write them in one insert at commit
+        pending = state.get('audit_rows')
+        if pending is None:
+            pending = state['audit_rows'] = []
+            self.db.before_commit(lambda: self.db.execute_many(INSERT_QUERY, pending))
+        pending.extend(rows)
+
+    def stats(self):
+        """Counters of the shared audit buffer"""
+        return get_audit_buffer().stats()
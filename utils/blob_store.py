@@ -0,0 +1,167 @@
+import os
+import io
+import hashlib
+import tempfile
+from abc import ABC, abstractmethod
+
+
+CHUNK_SIZE = 256 * 1024
+
+
+class FileTooLargeError(ValueError):
+    """Raised when a streamed upload exceeds the allowed size"""
+
+
+class BlobStore(ABC):
+    """
+    Interface for attachment content storage.
+
+    Blobs are addressed by the SHA-256 hex digest of their contents, so
+    storing the same bytes twice only keeps one copy. Reference counting is
+    tracked in the attachment_blobs table by FileHandler; stores only deal
+    with the bytes.
+    """
+
+    def put(self, data):
+        """Store bytes and return their SHA-256 hex digest"""
+        sha256, _ = self.put_stream(io.BytesIO(data))
+        return sha256
+
+    def put_stream(self, fileobj, max_size=None, chunk_size=CHUNK_SIZE):
+        """
+        Store the contents of a binary file object, reading it in chunks
+
+        Args:
+            fileobj: Readable binary file object
+            max_size (int, optional): Maximum number of bytes to accept
+            chunk_size (int): Bytes read and written per iteration
+
+        Returns:
+            tuple: (SHA-256 hex digest, size in bytes)
+
+        Raises:
+            FileTooLargeError: If more than max_size bytes are read
+        """
+        sha256, size, staged = self.stage_stream(fileobj, max_size=max_size, chunk_size=chunk_size)
+        try:
+            self.commit(staged, sha256)
+        except Exception:
+            self.discard(staged)
+            raise
+        return sha256, size
+
+    @abstractmethod
+    def stage_stream(self, fileobj, max_size=None, chunk_size=CHUNK_SIZE):
+        """
+        Write the contents of a binary file object to a staging area
+
+        The blob is not visible under its digest until commit() is called, so
+        callers can reference it in the database first and only publish it
+        once that reference exists.
+
+        Returns:
+            tuple: (SHA-256 hex digest, size in bytes, staging handle)
+        """
+
+    @abstractmethod
+    def commit(self, staged, sha256):
+        """Publish a staged blob under its digest"""
+
+    @abstractmethod
+    def discard(self, staged):
+        """Remove a staged blob that will not be committed"""
+
+    @abstractmethod
+    def open(self, sha256):
+        """Open a stored blob for reading in binary mode"""
+
+    @abstractmethod
+    def exists(self, sha256):
+        """Whether a blob is stored under the digest"""
+
+    @abstractmethod
+    def delete(self, sha256):
+        """Remove a blob, returning True if it existed"""
+
+    def iter_chunks(self, sha256, chunk_size):
+        """Stream a stored blob in chunks of at most chunk_size bytes"""
+        with self.open(sha256) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+
+class LocalBlobStore(BlobStore):
+    """Content-addressed blob store on the local filesystem"""
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get('ATTACHMENT_STORAGE_PATH', 'data/attachments')
+
+    def path_for(self, sha256):
+        # Fan out into two directory levels to keep directories small
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def stage_stream(self, fileobj, max_size=None, chunk_size=CHUNK_SIZE):
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = self._create_temp_file()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = fileobj.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise FileTooLargeError(f"File exceeds the maximum size of {max_size} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            self.discard(tmp_path)
+            raise
+        return digest.hexdigest(), size, tmp_path
+
+    def commit(self, tmp_path, sha256):
+        """Atomically move a fully written temporary file to its final path"""
+        path = self.path_for(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def discard(self, tmp_path):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def open(self, sha256):
+        return open(self.path_for(sha256), 'rb')
+
+    def exists(self, sha256):
+        return os.path.exists(self.path_for(sha256))
+
+    def delete(self, sha256):
+        try:
+            os.remove(self.path_for(sha256))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _create_temp_file(self):
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        return tempfile.mkstemp(dir=tmp_dir)
+
+
+BLOB_STORES = {
+    'local': LocalBlobStore,
+}
+
+
+def get_blob_store():
+    """Create the blob store selected by the ATTACHMENT_STORAGE environment variable"""
+    backend = os.environ.get('ATTACHMENT_STORAGE', 'local')
+    if backend not in BLOB_STORES:
+        raise ValueError(f"Unknown attachment storage backend: {backend}")
+    return BLOB_STORES[backend]()
@@ -0,0 +1,115 @@
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+from db.database import Database
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry expiry.
+
+    Keys are tuples whose first element is a namespace, e.g.
+    ``('macros', user_id)``. Write paths call ``invalidate`` with a key prefix
+    to drop everything derived from the data they changed.
+
+    Lists and dicts (query rows) are copied on the way in and out, so a
+    caller modifying its result cannot change what other sessions get.
+    While ``bypass()`` returns True, e.g. inside a database transaction
+    whose uncommitted data must not be shared, the cache is not used.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, bypass=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.bypass = bypass
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._generations = {}  # namespace -> number of invalidations
+        self._clears = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader, ttl=None):
+        """
+        Return the cached value for key, calling loader() on a miss
+
+        A value loaded while its namespace was invalidated is returned but not
+        stored, so a concurrent write can never be overwritten by stale data.
+        """
+        if self.bypass and self.bypass():
+            return loader()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(entry[1])
+            self.misses += 1
+            generation = self._generation(key[0])
+
+        value = loader()
+
+        with self._lock:
+            if self._generation(key[0]) == generation:
+                self._store(key, value, ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def invalidate(self, *prefix):
+        """Drop every entry whose key starts with prefix"""
+        with self._lock:
+            self._generations[prefix[0]] = self._generations.get(prefix[0], 0) + 1
+            stale = [key for key in self._entries if key[:len(prefix)] == prefix]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._clears += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+    def _generation(self, namespace):
+        return (self._clears, self._generations.get(namespace, 0))
+
+    @staticmethod
+    def _copy(value):
+        # Compiled objects such as CustomFieldSchema are read-only and shared as they are
+        return copy.deepcopy(value) if isinstance(value, (list, dict)) else value
+
+    def _store(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + (ttl or self.ttl), self._copy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+# One cache per process, shared by every Streamlit session. Loads inside a
+# transaction may see its uncommitted writes, so they bypass the cache.
+_cache = TTLCache(
+    maxsize=int(os.environ.get('CACHE_MAX_ENTRIES', 1024)),
+    ttl=float(os.environ.get('CACHE_TTL_SECONDS', 300)),
+    bypass=lambda: Database().in_transaction()
+)
+
+
+def get_cache():
+    return _cache
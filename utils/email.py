@@ -1,59 +1,102 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from psycopg2.extras import Json
+from db.database import Database
+from utils.email_worker import wake_worker
+
 
 class EmailNotifier:
+    """
+    Queues notification emails in the email_outbox table.
+
+    Ticket notifications are recorded as events first and turned into
+    emails by utils.notifications.NotificationAggregator. Nothing talks to
+    the SMTP server on the request path; EmailOutboxWorker in
+    utils.email_worker delivers queued messages in the background. Queued
+    inside Database.transaction(), an email is only sent if the change it
+    announces commits.
+    """
+
     def __init__(self):
-        self.sender_email = "support@yourdomain.com"
-        self.smtp_server = "smtp.yourdomain.com"
-        self.smtp_port = 587
+        self.db = Database()
 
-    def send_notification(self, recipient, subject, body):
-        msg = MIMEMultipart()
-        msg['From'] = self.sender_email
-        msg['To'] = recipient
-        msg['Subject'] = subject
+    def send_notification(self, recipients, subject, body):
+        """
+        Queue an email to one or more recipients
 
-        msg.attach(MIMEText(body, 'html'))
+        Args:
+            recipients (str or list): Email address(es)
+            subject (str): Subject line
+            body (str): HTML body
+        """
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        recipients = [r for r in recipients if r]
+        if not recipients:
+            return False
 
+        query = """
+            INSERT INTO email_outbox (recipient, subject, body)
+            VALUES %s
+        """
         try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                # server.login(username, password)  # Add credentials when needed
-                server.send_message(msg)
-            return True
+            self.db.execute_many(query, [(recipient, subject, body) for recipient in recipients])
         except Exception as e:
-            print(f"Failed to send email: {str(e)}")
+            if self.db.in_transaction():
+                raise
+            print(f"Failed to queue email: {str(e)}")
             return False
 
-    def notify_ticket_created(self, ticket, assignee_email):
-        subject = f"New Ticket Created: {ticket['title']}"
-        body = f"""
-        <h2>New Support Ticket</h2>
-        <p><strong>Title:</strong> {ticket['title']}</p>
-        <p><strong>Priority:</strong> {ticket['priority']}</p>
-        <p><strong>Description:</strong> {ticket['description']}</p>
-        """
-        self.send_notification(assignee_email, subject, body)
+        self.db.after_commit(wake_worker)
+        return True
+
+    def notify_ticket_created(self, ticket, recipients):
+        self.record_event(recipients, ticket, 'created')
 
     def notify_ticket_updated(self, ticket, user_email):
-        subject = f"Ticket Updated: {ticket['title']}"
-        body = f"""
-        <h2>Ticket Update</h2>
-        <p><strong>Title:</strong> {ticket['title']}</p>
-        <p><strong>Status:</strong> {ticket['status']}</p>
-        <p><strong>Priority:</strong> {ticket['priority']}</p>
-        """
-        self.send_notification(user_email, subject, body)
+        self.record_event(user_email, ticket, 'updated')
 
     def notify_ticket_assigned(self, ticket, assignee_email):
-        subject = f"Ticket Assigned: {ticket['title']}"
-        body = f"""
-        <h2>Ticket Assignment</h2>
-        <p>You have been assigned to the following ticket:</p>
-        <p><strong>Title:</strong> {ticket['title']}</p>
-        <p><strong>Priority:</strong> {ticket['priority']}</p>
-        <p><strong>Status:</strong> {ticket['status']}</p>
-        <p><strong>Description:</strong> {ticket['description']}</p>
-        """
-        self.send_notification(assignee_email, subject, body)
+        self.record_event(assignee_email, ticket, 'assigned')
+
+    def record_event(self, recipients, ticket, event_type):
+        """
+        Record a ticket notification for NotificationAggregator
+
+        Events are not mailed one by one: the aggregator coalesces them per
+        recipient and ticket, or into digests, according to each
+        recipient's notification preference.
+        """
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        return self.record_events([(recipient, ticket, event_type) for recipient in recipients])
+
+    def record_events(self, events):
+        """
+        Record several ticket notifications with one insert
+
+        Args:
+            events (list): (recipient email, ticket dict, event type) tuples
+        """
+        rows = [
+            (recipient, ticket.get('id'), event_type,
+             Json({key: ticket.get(key) for key in ('title', 'status', 'priority', 'description')}))
+            for recipient, ticket, event_type in events
+            if recipient
+        ]
+        if not rows:
+            return False
+
+        query = """
+            INSERT INTO notification_events (recipient, ticket_id, event_type, payload)
+            VALUES %s
+        """
+        try:
+            self.db.execute_many(query, rows)
+        except Exception as e:
+            if self.db.in_transaction():
+                raise
+            print(f"Failed to record notification: {str(e)}")
+            return False
+
+        # Make sure a worker is running to aggregate the events
+        self.db.after_commit(wake_worker)
+        return True
@@ -0,0 +1,328 @@
+"""
+Background delivery of the email_outbox table.
+
+Each pass first turns due notification_events into emails (see
+utils.notifications), then sends what is queued.
+
+Usage:
+    python -m utils.email_worker [--once] [--batch-size N]
+
+By default the Streamlit process runs the worker in a daemon thread, started
+when the app starts. Set EMAIL_WORKER_MODE=external to run it
+as a separate process with the command above instead. Any number of workers
+may run at once; rows are claimed with FOR UPDATE SKIP LOCKED.
+"""
+import os
+import time
+import random
+import smtplib
+import argparse
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from db.database import Database
+from utils.notifications import NotificationAggregator
+
+
+def build_message(sender, recipient, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+
+def is_permanent_failure(error):
+    """
+    Whether the server rejected this particular message for good
+
+    Only 5xx replies to the recipients or the message data count; those will
+    never succeed on retry. Connection, HELO/STARTTLS and login errors
+    (including a 535 for a wrong password) are about the server or our
+    configuration, not the message, and are always retried.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPDataError):
+        return error.smtp_code >= 500
+    return False
+
+
+def is_message_error(error):
+    """Whether the error concerns one message rather than the SMTP session"""
+    return isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError))
+
+
+class SMTPConnection:
+    """
+    One reusable SMTP session
+
+    Opening a connection and negotiating STARTTLS costs several round trips,
+    so the session is kept open across messages and batches. It is
+    reopened after ``max_messages`` messages (many servers cap this), after
+    being idle for ``max_idle`` seconds, or when the server dropped it.
+    """
+
+    def __init__(self, host=None, port=None, username=None, password=None,
+                 starttls=None, timeout=30, max_messages=100, max_idle=60):
+        self.host = host or os.environ.get('SMTP_HOST', 'localhost')
+        self.port = int(port or os.environ.get('SMTP_PORT', 587))
+        self.username = username or os.environ.get('SMTP_USERNAME')
+        self.password = password or os.environ.get('SMTP_PASSWORD')
+        if starttls is None:
+            starttls = os.environ.get('SMTP_STARTTLS', 'true').lower() in ('1', 'true', 'yes')
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self._server = None
+        self._sent = 0
+        self._last_used = 0.0
+        self.connections_opened = 0
+
+    def send(self, msg):
+        server = self._get_server()
+        try:
+            server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The server timed the session out since the last message; retry once
+            self.close()
+            server = self._get_server()
+            server.send_message(msg)
+        self._sent += 1
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _get_server(self):
+        if self._server is not None:
+            if self._sent >= self.max_messages or time.monotonic() - self._last_used > self.max_idle:
+                self.close()
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    server.starttls()
+                if self.username:
+                    server.login(self.username, self.password)
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+            self._sent = 0
+            self.connections_opened += 1
+        return self._server
+
+
+class EmailOutboxWorker:
+    """
+    Delivers queued emails in batches over a single SMTP connection.
+
+    A batch is claimed by pushing its next_attempt_at ``lease`` into the
+    future in a short transaction, so no lock is held while talking to the
+    SMTP server and rows claimed by a worker that crashed become due again
+    once the lease runs out. The lease of the unsent part of a batch is
+    renewed every ``lease / 2`` seconds, so a slow batch is never claimed
+    twice; the lease must exceed twice the SMTP timeout. Failed messages are retried with jittered
+    exponential backoff; permanent failures and messages that ran out of
+    attempts are marked failed. When the server itself fails (unreachable,
+    bad credentials), the rest of the batch is put back without counting
+    an attempt, so an outage or a wrong password never fails messages.
+    """
+
+    def __init__(self, smtp=None, aggregator=None, batch_size=50, poll_interval=5.0, max_attempts=None,
+                 base_delay=30.0, max_delay=3600.0, lease=300):
+        self.db = Database()
+        self.smtp = smtp or SMTPConnection()
+        self.aggregator = aggregator or NotificationAggregator()
+        self.sender_email = os.environ.get('EMAIL_SENDER', "support@yourdomain.com")
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts or int(os.environ.get('EMAIL_MAX_ATTEMPTS', 8))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Renewal happens between messages, so one send must fit in half a lease
+        self.lease = max(lease, 2 * getattr(self.smtp, 'timeout', 0) + 60)
+        self.wake = threading.Event()
+        self.sent = 0
+        self.failed = 0
+        self.server_failures = 0  # consecutive session-level failures
+
+    def claim_batch(self):
+        query = """
+            UPDATE email_outbox
+            SET attempts = attempts + 1,
+                next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, recipient, subject, body, attempts
+        """
+        return self.db.execute(query, (self.lease, self.batch_size)) or []
+
+    def renew_lease(self, ids):
+        self.db.execute("""
+            UPDATE email_outbox
+            SET next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+            WHERE id = ANY(%s) AND status = 'pending'
+        """, (self.lease, ids))
+
+    def deliver_batch(self):
+        """
+        Send one batch of due messages
+
+        Returns:
+            tuple: (number of messages claimed, whether the server failed)
+        """
+        batch = self.claim_batch()
+        server_failed = False
+        sent_ids = []
+        failures = []
+        leased_at = time.monotonic()
+        for i, message in enumerate(batch):
+            # A slow server can take longer than the lease over a whole batch;
+            # extend it for the unsent messages so no other worker claims them
+            if time.monotonic() - leased_at > self.lease / 2:
+                self.renew_lease([m['id'] for m in batch[i:]])
+                leased_at = time.monotonic()
+            try:
+                self.smtp.send(build_message(
+                    self.sender_email, message['recipient'], message['subject'], message['body']
+                ))
+                sent_ids.append(message['id'])
+                self.server_failures = 0
+            except Exception as e:
+                if is_message_error(e):
+                    # smtplib resets the session after a refused message, so it stays open
+                    give_up = is_permanent_failure(e) or message['attempts'] >= self.max_attempts
+                    failures.append((message['id'], give_up, False, self.backoff(message['attempts']),
+                                     str(e)[:1000]))
+                    continue
+                # The server is unreachable or refuses us: drop the session, put the
+                # rest of the batch back without using up their attempts, and back
+                # off as a whole
+                self.smtp.close()
+                server_failed = True
+                self.server_failures += 1
+                delay = self.backoff(self.server_failures)
+                failures.extend((m['id'], False, True, delay, str(e)[:1000]) for m in batch[i:])
+                break
+
+        with self.db.transaction():
+            if sent_ids:
+                self.db.execute("""
+                    UPDATE email_outbox
+                    SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL
+                    WHERE id = ANY(%s)
+                """, (sent_ids,))
+            if failures:
+                self.db.execute_many("""
+                    UPDATE email_outbox o
+                    SET status = CASE WHEN f.give_up THEN 'failed' ELSE 'pending' END,
+                        attempts = o.attempts - CASE WHEN f.refund THEN 1 ELSE 0 END,
+                        next_attempt_at = CURRENT_TIMESTAMP + f.delay * INTERVAL '1 second',
+                        last_error = f.error
+                    FROM (VALUES %s) AS f(id, give_up, refund, delay, error)
+                    WHERE o.id = f.id
+                """, failures, template="(%s::bigint, %s::boolean, %s::boolean, %s::float8, %s::text)")
+
+        self.sent += len(sent_ids)
+        self.failed += sum(1 for f in failures if f[1])
+        return len(batch), server_failed
+
+    def backoff(self, attempts):
+        """Seconds until the next attempt, exponential with jitter"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def drain(self):
+        """
+        Deliver every message that is currently due
+
+        Stops early when the server fails, rather than claiming further
+        batches only to put them back; the next poll tries again.
+        """
+        total = 0
+        while True:
+            claimed, server_failed = self.deliver_batch()
+            total += claimed
+            if server_failed or claimed < self.batch_size:
+                return total
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.aggregator.flush()
+                self.drain()
+            except Exception as e:
+                print(f"Email worker error: {str(e)}")
+            # Queued emails wake the worker early; otherwise poll for retries
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+        self.smtp.close()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker():
+    """
+    Start the in-process worker unless it is running or EMAIL_WORKER_MODE is not 'thread'
+
+    Called at app startup, so messages queued before a restart, scheduled
+    retries and due digests are delivered without waiting for a new email.
+
+    Returns:
+        EmailOutboxWorker: The running worker, or None in external mode
+    """
+    global _worker
+    if os.environ.get('EMAIL_WORKER_MODE', 'thread') != 'thread':
+        return None
+    with _worker_lock:
+        if _worker is None:
+            _worker = EmailOutboxWorker()
+            threading.Thread(target=_worker.run, name="email-outbox-worker", daemon=True).start()
+    return _worker
+
+
+def wake_worker():
+    """Start the in-process worker if needed and have it check the outbox now"""
+    worker = start_worker()
+    if worker is not None:
+        worker.wake.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver queued emails")
+    parser.add_argument('--once', action='store_true', help="Deliver what is due, then exit")
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--poll-interval', type=float, default=5.0)
+    args = parser.parse_args()
+
+    worker = EmailOutboxWorker(batch_size=args.batch_size, poll_interval=args.poll_interval)
+    if args.once:
+        started = time.time()
+        worker.aggregator.flush()
+        worker.drain()
+        worker.smtp.close()
+        print(f"Sent {worker.sent} emails, {worker.failed} failed permanently "
+              f"({time.time() - started:.1f}s, {worker.smtp.connections_opened} SMTP connections)")
+    else:
+        worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,282 @@
 import streamlit as st
 from db.database import Database
+from components.file_handler import FileHandler
+from utils.audit_logger import AuditLogger
+from utils.cache import get_cache
+from psycopg2.extras import Json
+import os
 import json
+import time
+import hashlib
+import zipfile
+from contextlib import closing
 from datetime import datetime
 
+# Rows of a user's data export: (file in the bundle, query with user_id parameters)
+EXPORT_QUERIES = [
+    ('account.jsonl', """
+        SELECT id, email, role, created_at
+        FROM users
+        WHERE id = %(user_id)s
+    """),
+    ('consents.jsonl', """
+        SELECT consents, ip_address, created_at
+        FROM gdpr_consents
+        WHERE user_id = %(user_id)s
+    """),
+    ('notification_preferences.jsonl', """
+        SELECT mode, updated_at
+        FROM notification_preferences
+        WHERE user_id = %(user_id)s
+    """),
+    # Tickets the user opened in full; for tickets only assigned to them, just
+    # the fact of the assignment, as the content is the requester's data
+    ('tickets.jsonl', """
+        SELECT id,
+               CASE WHEN created_by = %(user_id)s THEN title END as title,
+               CASE WHEN created_by = %(user_id)s THEN description END as description,
+               CASE WHEN created_by = %(user_id)s THEN status END as status,
+               CASE WHEN created_by = %(user_id)s THEN priority END as priority,
+               CASE WHEN created_by = %(user_id)s THEN category END as category,
+               created_by = %(user_id)s as created_by_you,
+               assigned_to = %(user_id)s as assigned_to_you,
+               CASE WHEN created_by = %(user_id)s THEN created_at END as created_at,
+               CASE WHEN created_by = %(user_id)s THEN updated_at END as updated_at
+        FROM tickets
+        WHERE created_by = %(user_id)s OR assigned_to = %(user_id)s
+        ORDER BY id
+    """),
+    # The user's own comments, and the public replies on tickets they opened
+    ('comments.jsonl', """
+        SELECT c.id, c.ticket_id, c.content, c.is_private,
+               c.user_id = %(user_id)s as written_by_you, c.created_at
+        FROM comments c
+        WHERE c.user_id = %(user_id)s
+           OR (NOT c.is_private AND c.ticket_id IN (
+               SELECT id FROM tickets WHERE created_by = %(user_id)s
+           ))
+        ORDER BY c.ticket_id, c.created_at, c.id
+    """),
+    ('custom_field_values.jsonl', """
+        SELECT tcf.ticket_id, cf.field_name, tcf.field_value
+        FROM ticket_custom_fields tcf
+        JOIN custom_fields cf ON cf.id = tcf.field_id
+        JOIN tickets t ON t.id = tcf.ticket_id
+        WHERE t.created_by = %(user_id)s
+        ORDER BY tcf.ticket_id, cf.field_name
+    """),
+    ('attachments.jsonl', """
+        SELECT a.id, a.ticket_id, a.file_name, a.file_size, a.mime_type, a.uploaded_at
+        FROM attachments a
+        JOIN tickets t ON t.id = a.ticket_id
+        WHERE t.created_by = %(user_id)s
+        ORDER BY a.id
+    """),
+    ('audit_log.jsonl', """
+        SELECT operation, entity_type, entity_id, details, created_at
+        FROM audit_logs
+        WHERE user_id = %(user_id)s
+        ORDER BY created_at, id
+    """),
+]
+
+# Steps of an erasure job, in order: (name, statement). Each statement
+# handles at most %(limit)s rows after %(last_id)s and returns the highest id
+# it touched and the number of rows. Tickets the user opened are deleted with
+# everything on them; elsewhere the user is removed from the rows. Steps that
+# anonymize stop matching the rows they changed, so they need no keyset.
+ERASURE_STEPS = [
+    # Lock the user out first: no SHA-256 hex digest matches an empty hash
+    ('block_account', """
+        WITH done AS (
+            UPDATE users SET password_hash = '' WHERE id = %(user_id)s RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    ('ticket_comments', """
+        WITH batch AS (
+            SELECT c.id FROM comments c
+            JOIN tickets t ON t.id = c.ticket_id
+            WHERE t.created_by = %(user_id)s AND c.id > %(last_id)s
+            ORDER BY c.id
+            LIMIT %(limit)s
+        ), done AS (
+            DELETE FROM comments WHERE id IN (SELECT id FROM batch) RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    # Release the blob references like FileHandler.delete_attachment, per blob
+    ('ticket_attachments', """
+        WITH batch AS (
+            SELECT a.id FROM attachments a
+            JOIN tickets t ON t.id = a.ticket_id
+            WHERE t.created_by = %(user_id)s AND a.id > %(last_id)s
+            ORDER BY a.id
+            LIMIT %(limit)s
+        ), done AS (
+            DELETE FROM attachments WHERE id IN (SELECT id FROM batch)
+            RETURNING id, blob_sha256, thumbnail_sha256
+        ), refs AS (
+            SELECT sha256, COUNT(*) as n
+            FROM (SELECT blob_sha256 as sha256 FROM done
+                  UNION ALL SELECT thumbnail_sha256 FROM done) r
+            WHERE sha256 IS NOT NULL
+            GROUP BY sha256
+        ), released AS (
+            UPDATE attachment_blobs b
+            SET ref_count = b.ref_count - refs.n,
+                released_at = CASE WHEN b.ref_count - refs.n <= 0
+                                   THEN CURRENT_TIMESTAMP ELSE b.released_at END
+            FROM refs
+            WHERE b.sha256 = refs.sha256
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    # Comments and attachments added since their step go with their ticket,
+    # releasing blob references as above; custom field values and
+    # notification events cascade
+    ('tickets', """
+        WITH batch AS (
+            SELECT id FROM tickets
+            WHERE created_by = %(user_id)s AND id > %(last_id)s
+            ORDER BY id
+            LIMIT %(limit)s
+        ), late_comments AS (
+            DELETE FROM comments WHERE ticket_id IN (SELECT id FROM batch)
+        ), late_attachments AS (
+            DELETE FROM attachments WHERE ticket_id IN (SELECT id FROM batch)
+            RETURNING blob_sha256, thumbnail_sha256
+        ), late_refs AS (
+            SELECT sha256, COUNT(*) as n
+            FROM (SELECT blob_sha256 as sha256 FROM late_attachments
+                  UNION ALL SELECT thumbnail_sha256 FROM late_attachments) r
+            WHERE sha256 IS NOT NULL
+            GROUP BY sha256
+        ), late_released AS (
+            UPDATE attachment_blobs b
+            SET ref_count = b.ref_count - late_refs.n,
+                released_at = CASE WHEN b.ref_count - late_refs.n <= 0
+                                   THEN CURRENT_TIMESTAMP ELSE b.released_at END
+            FROM late_refs
+            WHERE b.sha256 = late_refs.sha256
+        ), done AS (
+            DELETE FROM tickets WHERE id IN (SELECT id FROM batch) RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    ('comments', """
+        WITH done AS (
+            UPDATE comments SET user_id = NULL
+            WHERE id IN (
+                SELECT id FROM comments
+                WHERE user_id = %(user_id)s AND id > %(last_id)s
+                ORDER BY id
+                LIMIT %(limit)s
+            )
+            RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    ('assigned_tickets', """
+        WITH done AS (
+            UPDATE tickets SET assigned_to = NULL
+            WHERE id IN (
+                SELECT id FROM tickets
+                WHERE assigned_to = %(user_id)s AND id > %(last_id)s
+                ORDER BY id
+                LIMIT %(limit)s
+            )
+            RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    # Matched on the partition key as well, so each update only visits the partitions it needs
+    ('audit_entries', """
+        WITH done AS (
+            UPDATE audit_logs SET user_id = NULL
+            WHERE (created_at, id) IN (
+                SELECT created_at, id FROM audit_logs
+                WHERE user_id = %(user_id)s
+                ORDER BY created_at DESC, id DESC
+                LIMIT %(limit)s
+            )
+            RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    ('audit_subject_entries', """
+        WITH done AS (
+            UPDATE audit_logs SET details = NULL
+            WHERE (created_at, id) IN (
+                SELECT created_at, id FROM audit_logs
+                WHERE entity_type = 'user' AND entity_id = %(user_id)s AND details IS NOT NULL
+                ORDER BY created_at DESC, id DESC
+                LIMIT %(limit)s
+            )
+            RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    ('notification_events', """
+        WITH done AS (
+            DELETE FROM notification_events
+            WHERE id IN (
+                SELECT id FROM notification_events
+                WHERE recipient = %(email)s AND id > %(last_id)s
+                ORDER BY id
+                LIMIT %(limit)s
+            )
+            RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    ('email_outbox', """
+        WITH done AS (
+            DELETE FROM email_outbox
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE recipient = %(email)s AND id > %(last_id)s
+                ORDER BY id
+                LIMIT %(limit)s
+            )
+            RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+    # A handful of rows; foreign keys are checked at the end of the statement
+    ('account', """
+        WITH macros AS (
+            DELETE FROM macros WHERE user_id = %(user_id)s
+        ), filters AS (
+            DELETE FROM saved_filters WHERE user_id = %(user_id)s
+        ), preferences AS (
+            DELETE FROM notification_preferences WHERE user_id = %(user_id)s
+        ), consents AS (
+            DELETE FROM gdpr_consents WHERE user_id = %(user_id)s
+        ), done AS (
+            DELETE FROM users WHERE id = %(user_id)s RETURNING id
+        )
+        SELECT MAX(id) as last_id, COUNT(*) as rows FROM done
+    """),
+]
+ERASURE_STEP_NAMES = [name for name, _ in ERASURE_STEPS]
+
+# Steps repeated without a limit right before the account is deleted, for
+# rows an already signed-in session created after their step had passed
+ERASURE_SWEEP_STEPS = [step for step in ERASURE_STEPS if step[0] not in ('block_account', 'account')]
+
+# SQLSTATE of a statement that gave up waiting for a lock (lock_timeout)
+LOCK_NOT_AVAILABLE = '55P03'
+
 class GDPRCompliance:
+    # Erasure batches give up on a lock after this long rather than queue foreground queries behind them
+    erasure_lock_timeout = '2s'
+
     def __init__(self):
         self.db = Database()
-        self._ensure_table_exists()
-
-    def _ensure_table_exists(self):
-        """Ensure the GDPR consent table exists"""
-        query = """
-            CREATE TABLE IF NOT EXISTS gdpr_consents (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                consents JSONB,
-                ip_address VARCHAR(45),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id)
-            )
-        """
-        self.db.execute(query)
+        self.cache = get_cache()
+        self.file_handler = FileHandler()
+        self.audit_logger = AuditLogger()
 
     def render_consent_form(self):
         """Render GDPR consent checkboxes"""
@@ -73,9 +329,178 @@ class GDPRCompliance:
             FROM gdpr_consents
             WHERE user_id = %s
         """
-        result = self.db.execute(query, (user_id,))
+        result = self.db.query(query, (user_id,))
         return result[0] if result else None
 
+    def export_user_data(self, user_id, fileobj, requested_by=None):
+        """
+        Write everything stored about a user to fileobj as a ZIP bundle
+
+        The bundle holds one JSONL file per kind of record (see
+        EXPORT_QUERIES), the attachment contents under attachments/, and a
+        manifest.json with the record counts. Rows are read from server-side
+        cursors and attachments in chunks, and each member is written as it
+        is read, so memory use does not grow with the size of the account.
+        fileobj does not need to be seekable.
+
+        Args:
+            user_id (int): The user whose data is exported
+            fileobj: Writable binary file object
+            requested_by (int, optional): User who requested the export, for the audit log
+
+        Returns:
+            dict: Number of records written per file in the bundle
+        """
+        counts = {}
+        params = {'user_id': user_id}
+        with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+            for name, query in EXPORT_QUERIES:
+                counts[name] = 0
+                # Closed explicitly, so an error mid-export releases the cursor's connection
+                with bundle.open(name, 'w', force_zip64=True) as member, \
+                        closing(self.db.stream(query, params)) as rows:
+                    for row in rows:
+                        member.write((json.dumps(row, default=str) + "\n").encode('utf-8'))
+                        counts[name] += 1
+
+            counts['attachments/'] = 0
+            with closing(self.db.stream(dict(EXPORT_QUERIES)['attachments.jsonl'], params)) as attachments:
+                for attachment in attachments:
+                    file_name = os.path.basename((attachment['file_name'] or '').replace('\\', '/')) or 'file'
+                    uploaded_at = attachment['uploaded_at'] or datetime.now()
+                    info = zipfile.ZipInfo(f"attachments/{attachment['id']}_{file_name}", uploaded_at.timetuple()[:6])
+                    # Most uploads are already compressed; store them as they are
+                    info.compress_type = zipfile.ZIP_STORED
+                    with bundle.open(info, 'w', force_zip64=True) as member:
+                        for chunk in self.file_handler.iter_attachment_chunks(attachment['id']):
+                            member.write(chunk)
+                    counts['attachments/'] += 1
+
+            bundle.writestr('manifest.json', json.dumps({
+                'user_id': user_id,
+                'generated_at': datetime.now().isoformat(),
+                'records': counts,
+            }, indent=2))
+
+        self.audit_logger.log_action('export', 'user', user_id, requested_by, {'records': counts})
+        return counts
+
+    def erase_user(self, user_id, requested_by=None, batch_size=500, duty_cycle=None, max_lock_waits=20):
+        """
+        Delete or anonymize everything stored about a user
+
+        Works through ERASURE_STEPS in batches of batch_size rows, each in a
+        short transaction of its own that also records the progress in
+        gdpr_erasure_jobs; calling this again for the same user resumes an
+        interrupted job. The first step blocks the user's login, and the
+        final transaction repeats every sweep without a limit before deleting
+        the account, catching rows that a session which was already signed
+        in created after their step. Between batches the job sleeps so that it is busy
+        at most duty_cycle of the time (GDPR_ERASURE_DUTY_CYCLE, default
+        0.5), and a batch that cannot get a lock quickly is retried later.
+        One audit entry summarizing the job is written when it completes.
+
+        Args:
+            user_id (int): The user to erase
+            requested_by (int, optional): User who requested the erasure, for the audit log
+            batch_size (int): Maximum rows changed per transaction
+            duty_cycle (float, optional): Fraction of the time spent running batches
+            max_lock_waits (int): Consecutive lock timeouts after which the job gives up
+
+        Returns:
+            dict: Number of rows deleted or anonymized per step
+
+        Raises:
+            ValueError: If there is neither such a user nor an erasure job for it
+        """
+        if duty_cycle is None:
+            duty_cycle = float(os.environ.get('GDPR_ERASURE_DUTY_CYCLE', 0.5))
+        self.db.execute("""
+            INSERT INTO gdpr_erasure_jobs (user_id, email, email_sha256, requested_by, step)
+            SELECT id, email, encode(sha256(convert_to(LOWER(email), 'UTF8')), 'hex'), %s, %s
+            FROM users WHERE id = %s
+            ON CONFLICT (user_id) DO NOTHING
+        """, (requested_by, ERASURE_STEP_NAMES[0], user_id))
+
+        lock_waits = 0
+        while True:
+            started = time.monotonic()
+            try:
+                finished, counts = self._erase_batch(user_id, batch_size)
+                lock_waits = 0
+            except Exception as e:
+                if getattr(e, 'pgcode', None) != LOCK_NOT_AVAILABLE or lock_waits >= max_lock_waits:
+                    raise
+                lock_waits += 1
+                finished = False
+            if finished:
+                return counts
+            # Sleep long enough that batches only take duty_cycle of the time
+            elapsed = time.monotonic() - started
+            time.sleep(max(elapsed * (1 - duty_cycle) / duty_cycle, 0.01))
+
+    def _erase_batch(self, user_id, batch_size):
+        """Run one batch of an erasure job; returns (job finished, counts so far)"""
+        with self.db.transaction():
+            job = self.db.execute(
+                "SELECT * FROM gdpr_erasure_jobs WHERE user_id = %s FOR UPDATE", (user_id,)
+            )
+            if not job:
+                raise ValueError(f"No such user: {user_id}")
+            job = job[0]
+            counts = dict(job['counts'])
+            if job['completed_at']:
+                return True, counts
+
+            self.db.execute("SET LOCAL lock_timeout = %s", (self.erasure_lock_timeout,))
+            step = ERASURE_STEP_NAMES.index(job['step'])
+            name, query = ERASURE_STEPS[step]
+            params = {'user_id': user_id, 'email': job['email'], 'last_id': job['last_id'], 'limit': batch_size}
+            if name == 'account':
+                # LIMIT NULL is no limit; stragglers are few since login was blocked
+                for sweep_name, sweep_query in ERASURE_SWEEP_STEPS:
+                    swept = self.db.execute(sweep_query, {**params, 'last_id': 0, 'limit': None})[0]
+                    counts[sweep_name] = counts.get(sweep_name, 0) + swept['rows']
+            result = self.db.execute(query, params)[0]
+            counts[name] = counts.get(name, 0) + result['rows']
+
+            next_step, last_id = job['step'], result['last_id'] or job['last_id']
+            if result['rows'] < batch_size:
+                if step + 1 == len(ERASURE_STEPS):
+                    next_step = None
+                else:
+                    next_step, last_id = ERASURE_STEP_NAMES[step + 1], 0
+            self.db.execute("""
+                UPDATE gdpr_erasure_jobs
+                SET step = COALESCE(%s, step), last_id = %s, counts = %s,
+                    updated_at = CURRENT_TIMESTAMP,
+                    completed_at = CASE WHEN %s IS NULL THEN CURRENT_TIMESTAMP END,
+                    -- Only email_sha256 outlives the job
+                    email = CASE WHEN %s IS NULL THEN NULL ELSE email END
+                WHERE user_id = %s
+            """, (next_step, last_id, Json(counts), next_step, next_step, user_id))
+
+            if name == 'block_account':
+                self.db.after_commit(lambda: self.cache.invalidate('users'))
+            if next_step is None:
+                # The requester may be the erased user, whose row no longer exists
+                actor = job['requested_by'] if job['requested_by'] != user_id else None
+                self.audit_logger.log_action(
+                    'erase', 'user', user_id, actor, {'rows': counts}, durable=True
+                )
+                self.db.after_commit(lambda: self._invalidate_user_caches(user_id))
+        return next_step is None, counts
+
+    @staticmethod
+    def email_hash(email):
+        """The gdpr_erasure_jobs.email_sha256 of an email address"""
+        return hashlib.sha256(email.lower().encode('utf-8')).hexdigest()
+
+    def _invalidate_user_caches(self, user_id):
+        self.cache.invalidate('users')
+        for prefix in ('macros', 'saved_filters', 'notification_preferences'):
+            self.cache.invalidate(prefix, user_id)
+
     def get_privacy_policy(self):
         """Return the privacy policy text"""
         return """
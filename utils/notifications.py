@@ -0,0 +1,155 @@
+import os
+import html
+from itertools import groupby
+from db.database import Database
+
+# Key of the advisory lock held while events are turned into emails
+AGGREGATOR_LOCK_ID = 5_310_002
+
+EVENT_LABELS = {
+    'created': "Created",
+    'updated': "Updated",
+    'assigned': "Assigned to you",
+}
+
+
+class NotificationAggregator:
+    """
+    Turns queued notification_events into email_outbox messages.
+
+    Users in 'immediate' mode get one email per ticket summarizing every
+    event for that ticket, sent once the oldest event is ``window`` seconds
+    old; a burst of updates during triage becomes a single message. Users in
+    'hourly' or 'daily' mode get one digest per period with all the events
+    from before the start of the current hour or day. Events and the emails
+    built from them are written in one transaction, so nothing is sent twice.
+    """
+
+    def __init__(self, window=None, batch_size=1000):
+        self.db = Database()
+        self.window = float(window if window is not None else os.environ.get('NOTIFICATION_COALESCE_SECONDS', 120))
+        self.batch_size = batch_size
+
+    def flush(self):
+        """
+        Build and queue the emails for every due event
+
+        Returns:
+            int: Number of emails queued
+        """
+        queued = 0
+        while True:
+            messages, events, more = self._flush_batch()
+            queued += messages
+            if not more or not events:
+                return queued
+
+    def _flush_batch(self):
+        query = """
+            WITH pending AS (
+                SELECT e.id, e.recipient, e.ticket_id, e.event_type, e.payload, e.created_at,
+                       COALESCE(p.mode, 'immediate') as mode,
+                       MIN(e.created_at) OVER (PARTITION BY e.recipient, e.ticket_id) as first_at
+                FROM notification_events e
+                LEFT JOIN users u ON u.email = e.recipient
+                LEFT JOIN notification_preferences p ON p.user_id = u.id
+                WHERE e.processed_at IS NULL
+            )
+            SELECT id, recipient, ticket_id, event_type, payload, created_at, mode
+            FROM pending
+            WHERE (mode = 'immediate' AND first_at <= CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+               OR (mode = 'hourly' AND created_at < date_trunc('hour', CURRENT_TIMESTAMP))
+               OR (mode = 'daily' AND created_at < date_trunc('day', CURRENT_TIMESTAMP))
+            ORDER BY recipient, ticket_id, created_at, id
+            LIMIT %s
+        """
+        with self.db.transaction():
+            # One aggregator at a time, so an event group is never split between two
+            locked = self.db.query("SELECT pg_try_advisory_xact_lock(%s) as locked", (AGGREGATOR_LOCK_ID,))
+            if not locked[0]['locked']:
+                return 0, [], False
+
+            events = self.db.query(query, (self.window, self.batch_size + 1)) or []
+            more = len(events) > self.batch_size
+            if more:
+                # Leave the last recipient for the next batch rather than split its email
+                last = events[self.batch_size - 1]['recipient']
+                trimmed = [e for e in events[:self.batch_size] if e['recipient'] != last]
+                events = trimmed or events[:self.batch_size]
+
+            messages = self.build_messages(events)
+            if messages:
+                self.db.execute_many(
+                    "INSERT INTO email_outbox (recipient, subject, body) VALUES %s", messages
+                )
+            if events:
+                self.db.execute(
+                    "UPDATE notification_events SET processed_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)",
+                    ([e['id'] for e in events],)
+                )
+        return len(messages), events, more
+
+    def build_messages(self, events):
+        """Group events (ordered by recipient, ticket, time) into (recipient, subject, body) tuples"""
+        messages = []
+        for recipient, recipient_events in groupby(events, key=lambda e: e['recipient']):
+            recipient_events = list(recipient_events)
+            by_ticket = [list(g) for _, g in groupby(recipient_events, key=lambda e: e['ticket_id'])]
+            if recipient_events[0]['mode'] == 'immediate':
+                for ticket_events in by_ticket:
+                    messages.append((recipient, *self.render_ticket_email(ticket_events)))
+            else:
+                messages.append((recipient, *self.render_digest(recipient_events[0]['mode'], by_ticket)))
+        return messages
+
+    @staticmethod
+    def render_ticket_email(events):
+        latest = events[-1]['payload']
+        title = latest.get('title', '')
+        if len(events) == 1:
+            event_type = events[0]['event_type']
+            subject = {
+                'created': f"New Ticket Created: {title}",
+                'assigned': f"Ticket Assigned: {title}",
+            }.get(event_type, f"Ticket Updated: {title}")
+        else:
+            subject = f"{len(events)} updates to ticket: {title}"
+        body = f"""
+        <h2>{html.escape(subject)}</h2>
+        {NotificationAggregator._render_ticket(events)}
+        """
+        return subject, body
+
+    @staticmethod
+    def render_digest(mode, by_ticket):
+        count = sum(len(events) for events in by_ticket)
+        period = "Hourly" if mode == 'hourly' else "Daily"
+        subject = f"{period} ticket digest: {count} updates on {len(by_ticket)} tickets"
+        sections = "".join(
+            f"<h3>{html.escape(str(events[-1]['payload'].get('title', '')))}</h3>"
+            f"{NotificationAggregator._render_ticket(events)}"
+            for events in by_ticket
+        )
+        body = f"""
+        <h2>{html.escape(subject)}</h2>
+        {sections}
+        """
+        return subject, body
+
+    @staticmethod
+    def _render_ticket(events):
+        latest = events[-1]['payload']
+        details = "".join(
+            f"<p><strong>{label}:</strong> {html.escape(str(latest[key]))}</p>"
+            for key, label in [('title', 'Title'), ('status', 'Status'),
+                               ('priority', 'Priority'), ('description', 'Description')]
+            if latest.get(key)
+        )
+        items = []
+        for event in events:
+            line = f"{event['created_at']:%Y-%m-%d %H:%M} — {EVENT_LABELS.get(event['event_type'], event['event_type'])}"
+            payload = event['payload']
+            if payload.get('status'):
+                line += f" (status {payload['status']}, priority {payload.get('priority')})"
+            items.append(f"<li>{html.escape(line)}</li>")
+        return f"{details}<ul>{''.join(items)}</ul>"